@@ -0,0 +1,494 @@
+# Pre-aggregated views of the subscriptions data used by the dashboard tabs.
+#
+# The raw frame is summed once per data version into daily rollups keyed by
+# Client x Region x Date (every metric) plus one rollup per breakdown dimension
+# (SKU, Status, PaymentMethod) holding the measures the charts plot. Filter
+# changes then only touch these pre-summed cells, never the raw rows.
+
+import logging
+import threading
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import stage
+from parallel_compare import period_range_totals
+from polars_backend import PolarsBackend
+from schema import METRIC_COLUMNS, concat_normalized
+
+logger = logging.getLogger(__name__)
+
+CUBE_KEYS = ["Client", "Region", "Date"]
+BREAKDOWN_DIMENSIONS = ["SKU", "Status", "PaymentMethod"]
+# Measures kept in the per-dimension rollups (the 360 View breakdown charts)
+BREAKDOWN_MEASURES = ["Subscribers", "Revenue"]
+
+# Time-series grains: daily, weekly (Monday-based) and monthly buckets. Ranges up
+# to DAILY_MAX_DAYS long are plotted by day, up to WEEKLY_MAX_DAYS by week, and
+# longer ones by month.
+TIME_GRAINS = ["D", "W", "M"]
+DAILY_MAX_DAYS = 92
+WEEKLY_MAX_DAYS = 731
+
+
+# Grain for a time series over start..end (None: the whole history, by month)
+def time_grain(start=None, end=None):
+    if start is None or end is None:
+        return "M"
+    days = (pd.Timestamp(end) - pd.Timestamp(start)).days + 1
+    if days <= DAILY_MAX_DAYS:
+        return "D"
+    if days <= WEEKLY_MAX_DAYS:
+        return "W"
+    return "M"
+
+
+# First day of the bucket holding each date (a datetime Series)
+def bucket_starts(dates, grain):
+    if grain == "W":
+        return dates - pd.to_timedelta(dates.dt.dayofweek, unit="D")
+    if grain == "M":
+        return dates.dt.to_period("M").dt.to_timestamp()
+    return dates
+
+
+# (first day, first day of the next bucket) of the bucket holding one date
+def _bucket_bounds(day, grain):
+    day = pd.Timestamp(day).normalize()
+    if grain == "W":
+        first = day - pd.Timedelta(days=day.dayofweek)
+        return first, first + pd.Timedelta(days=7)
+    first = day.replace(day=1)
+    return first, first + pd.offsets.MonthBegin(1)
+
+
+# Daily totals re-summed into weekly or monthly buckets, dated by bucket start
+def resample_over_time(daily, measures, grain, backend=None):
+    if grain == "D":
+        return daily
+    bucketed = daily.assign(Date=bucket_starts(daily["Date"], grain))
+    return (backend or _pandas_backend).group_sum(bucketed, "Date", measures)
+
+
+# Rows sorted by (Client, Date) with per-client offsets, so a client + date range
+# lookup is two binary searches and a positional slice (a view, not a copy).
+class ClientDateIndex:
+    def __init__(self, df, presorted=False):
+        if not isinstance(df["Client"].dtype, pd.CategoricalDtype):
+            df = df.assign(Client=df["Client"].astype("category"))
+        codes = df["Client"].cat.codes.to_numpy()
+        dates = df["Date"].to_numpy()
+        if not presorted:
+            order = np.lexsort((dates, codes))
+            df = df.take(order).reset_index(drop=True)
+            codes = codes[order]
+            dates = dates[order]
+        self.frame = df
+        self.clients = df["Client"].cat.categories
+        self._dates = dates
+        # offsets[c]:offsets[c + 1] is the row range of client code c
+        self._offsets = np.searchsorted(codes, np.arange(len(self.clients) + 1), side="left")
+
+    def client_bounds(self, client):
+        if client not in self.clients:
+            return 0, 0
+        code = self.clients.get_loc(client)
+        return int(self._offsets[code]), int(self._offsets[code + 1])
+
+    def row_range(self, client, start=None, end=None):
+        lo, hi = self.client_bounds(client)
+        dates = self._dates[lo:hi]
+        if start is not None:
+            lo_offset = np.searchsorted(dates, np.datetime64(pd.Timestamp(start)), side="left")
+        else:
+            lo_offset = 0
+        if end is not None:
+            hi_offset = np.searchsorted(dates, np.datetime64(pd.Timestamp(end)), side="right")
+        else:
+            hi_offset = hi - lo
+        return lo + int(lo_offset), lo + int(hi_offset)
+
+    def slice(self, client, start=None, end=None, region=None):
+        lo, hi = self.row_range(client, start, end)
+        rows = self.frame.iloc[lo:hi]
+        if region is not None:
+            rows = rows[rows["Region"] == region]
+        return rows
+
+
+# Cumulative sums of every metric per Client x Region over a dense daily axis.
+# Any "metric for client (and region) between two dates" total is then two
+# lookups and a subtraction. TotalChurn is carried as its own derived column.
+class PrefixSums:
+    def __init__(self, daily):
+        self.clients = daily["Client"].cat.categories
+        self.regions = daily["Region"].cat.categories
+        self.metrics = [metric for metric in METRIC_COLUMNS if metric in daily.columns]
+        values = daily[self.metrics].to_numpy(dtype=np.int64)
+        if "InvoluntaryChurn" in self.metrics and "VoluntaryChurn" in self.metrics:
+            self.metrics = self.metrics + ["TotalChurn"]
+            churn = daily["InvoluntaryChurn"].to_numpy(dtype=np.int64) + daily["VoluntaryChurn"].to_numpy(dtype=np.int64)
+            values = np.column_stack([values, churn])
+        self._metric_pos = {metric: i for i, metric in enumerate(self.metrics)}
+
+        days = daily["Date"].to_numpy().astype("datetime64[D]")
+        self.origin = days.min() if len(days) else np.datetime64("1970-01-01", "D")
+        n_days = int((days.max() - self.origin).astype(int)) + 1 if len(days) else 0
+        day_idx = (days - self.origin).astype(np.int64)
+
+        dense = np.zeros((len(self.clients), len(self.regions), n_days, len(self.metrics)), dtype=np.int64)
+        np.add.at(dense, (daily["Client"].cat.codes.to_numpy(), daily["Region"].cat.codes.to_numpy(), day_idx), values)
+        # Leading zero row along the day axis: total(a..b) = cum[b + 1] - cum[a]
+        self._by_region = np.zeros((len(self.clients), len(self.regions), n_days + 1, len(self.metrics)), dtype=np.int64)
+        np.cumsum(dense, axis=2, out=self._by_region[:, :, 1:])
+        self._by_client = self._by_region.sum(axis=1)
+        self.n_days = n_days
+
+    def _day_bounds(self, start, end):
+        first = 0 if start is None else int((np.datetime64(pd.Timestamp(start), "D") - self.origin).astype(int))
+        last = self.n_days - 1 if end is None else int((np.datetime64(pd.Timestamp(end), "D") - self.origin).astype(int))
+        return max(first, 0), min(last, self.n_days - 1)
+
+    def _cumulative(self, client, region):
+        if client not in self.clients:
+            return None
+        client_code = self.clients.get_loc(client)
+        if region is None:
+            return self._by_client[client_code]
+        if region not in self.regions:
+            return None
+        return self._by_region[client_code, self.regions.get_loc(region)]
+
+    # Totals of every metric for client/region over [start, end] (inclusive days)
+    def range_totals(self, client, start=None, end=None, region=None):
+        cumulative = self._cumulative(client, region)
+        first, last = self._day_bounds(start, end)
+        if cumulative is None or last < first:
+            totals = np.zeros(len(self.metrics), dtype=np.int64)
+        else:
+            totals = cumulative[last + 1] - cumulative[first]
+        return pd.Series(totals, index=self.metrics)
+
+    # (period, client, metric) array of totals for each (start, end) period in one
+    # fancy-indexed lookup; `pool` (a ComparisonPool) may split it by client over
+    # worker processes. Unknown clients get zero rows.
+    def period_totals(self, clients, metrics, periods, pool=None):
+        known = np.array([client in self.clients for client in clients], dtype=bool)
+        codes = np.array([self.clients.get_loc(client) if ok else 0 for client, ok in zip(clients, known)], dtype=np.intp)
+        positions = np.array([self._metric_pos[metric] for metric in metrics], dtype=np.intp)
+        bounds = [self._day_bounds(start, end) for start, end in periods]
+        if pool is not None and pool.should_split(len(clients), len(metrics)):
+            totals = pool.period_totals(self._by_client, codes, positions, bounds)
+        else:
+            totals = period_range_totals(self._by_client, codes, positions, bounds)
+        totals[:, ~known] = 0
+        return totals
+
+    # (client, metric) matrix of totals over [start, end]
+    def range_totals_matrix(self, clients, metrics, start=None, end=None):
+        return self.period_totals(clients, metrics, [(start, end)])[0]
+
+    def range_total(self, client, metric, start=None, end=None, region=None):
+        cumulative = self._cumulative(client, region)
+        first, last = self._day_bounds(start, end)
+        if cumulative is None or last < first:
+            return np.int64(0)
+        position = self._metric_pos[metric]
+        return cumulative[last + 1, position] - cumulative[first, position]
+
+
+def _rollup(df, keys, measures):
+    rollup = df.groupby(keys, observed=True, sort=False)[measures].sum().reset_index()
+    return rollup.sort_values(["Client", "Date"], kind="stable", ignore_index=True)
+
+
+def _merge_rollups(cells, added, removed, keys, measures, backend):
+    parts = [cells, backend.rollup(added, keys, measures)]
+    if removed is not None and len(removed):
+        negated = backend.rollup(removed, keys, measures)
+        negated[measures] = -negated[measures]
+        parts.append(negated)
+    return backend.rollup(concat_normalized(parts), keys, measures)
+
+
+# The group-by sums behind the cube, on single-threaded pandas (the reference
+# implementation). Backends implement rollup / rollups / group_sum with the same
+# rows, order and values; filtering and range totals work on the rollups they
+# return and are shared.
+class PandasBackend:
+    name = "pandas"
+
+    # Sums of `measures` per `keys` cell, sorted by (Client, Date)
+    def rollup(self, df, keys, measures):
+        return _rollup(df, keys, measures)
+
+    # Every rollup in `specs` (name -> (keys, measures))
+    def rollups(self, df, specs):
+        return {name: _rollup(df, keys, measures) for name, (keys, measures) in specs.items()}
+
+    # Totals of `measures` per value of `key`, sorted by it
+    def group_sum(self, df, key, measures):
+        return df.groupby(key, observed=True)[measures].sum().reset_index()
+
+
+# Two columns as numpy arrays that are equal when the columns hold the same
+# values: codes in the expected column's categories (values missing from them
+# become -1), or the plain values
+def _comparable(expected, actual):
+    if isinstance(expected.dtype, pd.CategoricalDtype):
+        categories = expected.cat.categories
+        if isinstance(actual.dtype, pd.CategoricalDtype) and actual.cat.categories.equals(categories):
+            return expected.cat.codes.to_numpy(), actual.cat.codes.to_numpy()
+        return expected.cat.codes.to_numpy(), pd.Categorical(actual, categories=categories).codes
+    return expected.to_numpy(), actual.to_numpy()
+
+
+# Description of how `actual` differs from `expected`, or None when they hold the
+# same columns and rows. Compared with numpy on category codes and raw values,
+# so checking a large rollup costs a few vectorized passes. Sums are compared by
+# value: pandas narrows them back to the input dtype when they fit.
+def _frame_difference(expected, actual):
+    if list(expected.columns) != list(actual.columns):
+        return f"columns {list(actual.columns)} instead of {list(expected.columns)}"
+    if len(expected) != len(actual):
+        return f"{len(actual)} rows instead of {len(expected)}"
+    for column in expected.columns:
+        left, right = _comparable(expected[column], actual[column])
+        equal_nan = left.dtype.kind == "f" and right.dtype.kind == "f"
+        if not np.array_equal(left, right, equal_nan=equal_nan):
+            differing = int(np.count_nonzero(left != right))
+            return f"{differing:,} of {len(expected):,} rows differ in {column}"
+    return None
+
+
+# Runs every aggregation on both backends and returns the reference result,
+# logging an error for each result the candidate gets differently. Used to
+# validate a backend on real data before switching to it.
+class CrossCheckBackend:
+    def __init__(self, reference, candidate):
+        self.reference = reference
+        self.candidate = candidate
+        self.name = f"{candidate.name} (checked against {reference.name})"
+        self.checks = 0
+        self.mismatches = 0
+        self._lock = threading.Lock()
+
+    def _check(self, call, expected, actual):
+        difference = _frame_difference(expected, actual)
+        if difference is not None:
+            logger.error(f"{self.candidate.name} backend differs from {self.reference.name} in {call}: {difference}")
+        with self._lock:
+            self.checks += 1
+            self.mismatches += difference is not None
+        return expected
+
+    def rollup(self, df, keys, measures):
+        return self._check(f"rollup{keys}", self.reference.rollup(df, keys, measures), self.candidate.rollup(df, keys, measures))
+
+    def rollups(self, df, specs):
+        expected, actual = self.reference.rollups(df, specs), self.candidate.rollups(df, specs)
+        return {name: self._check(f"rollup{specs[name][0]}", expected[name], actual[name]) for name in specs}
+
+    def group_sum(self, df, key, measures):
+        return self._check(f"group_sum[{key}]", self.reference.group_sum(df, key, measures), self.candidate.group_sum(df, key, measures))
+
+
+_pandas_backend = PandasBackend()
+AGGREGATION_BACKENDS = {"pandas": PandasBackend, "polars": PolarsBackend}
+# Backend of cubes built without an explicit one
+_active_backend = _pandas_backend
+
+
+# Backend by name; cross_check=True wraps it to be checked against pandas
+def make_aggregation_backend(name, cross_check=False):
+    if name not in AGGREGATION_BACKENDS:
+        raise ValueError(f"Unknown aggregation backend: {name}")
+    backend = _pandas_backend if name == "pandas" else AGGREGATION_BACKENDS[name]()
+    return CrossCheckBackend(_pandas_backend, backend) if cross_check else backend
+
+
+def set_aggregation_backend(backend):
+    global _active_backend
+    _active_backend = backend
+    logger.info(f"Aggregation backend: {backend.name}")
+
+
+def aggregation_backend():
+    return _active_backend
+
+
+# ComparisonPool used by every cube's period_totals; None looks them up in-process
+_comparison_pool = None
+
+
+def set_comparison_pool(pool):
+    global _comparison_pool
+    _comparison_pool = pool
+
+
+class RollupCube:
+    def __init__(self, base, breakdowns, backend=None):
+        self.backend = backend or _active_backend
+        # Rollups are sorted by (Client, Date), so each gets a range index
+        self.base = ClientDateIndex(base, presorted=True)
+        self.breakdowns = {
+            dimension: ClientDateIndex(cells, presorted=True)
+            for dimension, cells in breakdowns.items()
+        }
+        self.prefix_sums = PrefixSums(base)
+        # Weekly and monthly rollups of the base, for time series over long ranges
+        metrics = [column for column in base.columns if column not in CUBE_KEYS]
+        self.coarse = {
+            grain: ClientDateIndex(
+                self.backend.rollup(base.assign(Date=bucket_starts(base["Date"], grain)), CUBE_KEYS, metrics),
+                presorted=True
+            )
+            for grain in TIME_GRAINS[1:]
+        }
+
+    def cells(self, client, region=None, start=None, end=None, dimension=None):
+        index = self.base if dimension in (None, "Region") else self.breakdowns[dimension]
+        return index.slice(client, start, end, region)
+
+    # New cube with `added` rows summed in and `removed` rows subtracted out, for
+    # incremental refreshes. Only the small rollups are regrouped, never the raw data.
+    def merged(self, added, removed=None):
+        metrics = [column for column in self.base.frame.columns if column not in CUBE_KEYS]
+        base = _merge_rollups(self.base.frame, added, removed, CUBE_KEYS, metrics, self.backend)
+        breakdowns = {
+            dimension: _merge_rollups(index.frame, added, removed, CUBE_KEYS + [dimension], BREAKDOWN_MEASURES, self.backend)
+            for dimension, index in self.breakdowns.items()
+        }
+        return RollupCube(base, breakdowns, self.backend)
+
+    # Sum of every metric (and TotalChurn) for the selection (the KPI cards)
+    def totals(self, client, region=None, start=None, end=None):
+        return self.prefix_sums.range_totals(client, start, end, region)
+
+    # Sum of one metric for a client over a date range (Trends period values)
+    def range_total(self, client, metric, start=None, end=None, region=None):
+        return self.prefix_sums.range_total(client, metric, start, end, region)
+
+    # (period, track, metric) array of totals for each (start, end) period
+    def period_totals(self, tracks, metrics, periods):
+        return self.prefix_sums.period_totals(list(tracks), list(metrics), list(periods), _comparison_pool)
+
+    # Distinct observed values of Client or Region, sorted
+    def dimension_values(self, dimension):
+        return sorted(self.base.frame[dimension].unique())
+
+    # Totals of `measures` broken down by one dimension (Region, SKU, Status, PaymentMethod)
+    def by_dimension(self, dimension, measures, client, region=None, start=None, end=None):
+        cells = self.cells(client, region, start, end, dimension)
+        return self.backend.group_sum(cells, dimension, measures)
+
+    # Totals of `measures` per day, week or month for the selection. Buckets that
+    # lie wholly inside the range come from the coarse rollups; only the partial
+    # buckets at either end are summed from daily cells.
+    def over_time(self, measures, client, region=None, start=None, end=None, grain="D"):
+        if grain == "D":
+            cells = self.cells(client, region, start, end)
+            return self.backend.group_sum(cells, "Date", measures)
+        full_from = full_to = None
+        if start is not None:
+            first, following = _bucket_bounds(start, grain)
+            full_from = first if pd.Timestamp(start) == first else following
+        if end is not None:
+            first, following = _bucket_bounds(end, grain)
+            if pd.Timestamp(end) < following - pd.Timedelta(days=1):
+                first = _bucket_bounds(first - pd.Timedelta(days=1), grain)[0]
+            full_to = first
+        if full_from is not None and full_to is not None and full_from > full_to:
+            parts = [self.cells(client, region, start, end)]
+        else:
+            parts = [self.coarse[grain].slice(client, full_from, full_to, region)]
+            if full_from is not None and pd.Timestamp(start) < full_from:
+                parts.append(self.cells(client, region, start, full_from - pd.Timedelta(days=1)))
+            if full_to is not None:
+                tail_from = _bucket_bounds(full_to, grain)[1]
+                if tail_from <= pd.Timestamp(end):
+                    parts.append(self.cells(client, region, tail_from, end))
+        cells = pd.concat([part[["Date"] + measures] for part in parts], ignore_index=True)
+        return resample_over_time(cells, measures, grain, self.backend)
+
+
+# (keys, measures) of every rollup in the cube: None for the base rollup, then
+# one per breakdown dimension present in `columns`
+def _rollup_specs(columns):
+    specs = {None: (CUBE_KEYS, [metric for metric in METRIC_COLUMNS if metric in columns])}
+    for dimension in BREAKDOWN_DIMENSIONS:
+        if dimension in columns:
+            specs[dimension] = (CUBE_KEYS + [dimension], BREAKDOWN_MEASURES)
+    return specs
+
+
+def _cube_from_rollups(rollups, row_count, backend):
+    base = rollups.pop(None)
+    cell_count = len(base) + sum(len(cells) for cells in rollups.values())
+    logger.info(f"Built rollup cube: {row_count:,} rows -> {cell_count:,} cells ({backend.name})")
+    return RollupCube(base, rollups, backend)
+
+
+def build_rollup_cube(df, backend=None):
+    backend = backend or _active_backend
+    with stage("cube", rows=len(df)):
+        return _cube_from_rollups(backend.rollups(df, _rollup_specs(df.columns)), len(df), backend)
+
+
+# Builds a rollup cube from data that arrives in chunks. Each chunk is summed into
+# partial rollups as soon as it is added, and the partials are re-summed every
+# `combine_every` chunks, so only the small partial cells are held until cube().
+class RollupAccumulator:
+    def __init__(self, combine_every=16, backend=None):
+        self.combine_every = combine_every
+        self.backend = backend or _active_backend
+        self.row_count = 0
+        self._specs = None
+        self._partials = {}
+
+    def _combine(self):
+        for name, (keys, measures) in self._specs.items():
+            self._partials[name] = [self.backend.rollup(concat_normalized(self._partials[name]), keys, measures)]
+
+    def add(self, chunk):
+        if self._specs is None:
+            self._specs = _rollup_specs(chunk.columns)
+            self._partials = {name: [] for name in self._specs}
+        for name, rollup in self.backend.rollups(chunk, self._specs).items():
+            self._partials[name].append(rollup)
+        self.row_count += len(chunk)
+        if len(self._partials[None]) >= self.combine_every:
+            self._combine()
+
+    def cube(self):
+        if self._specs is None:
+            return None
+        with stage("cube", rows=self.row_count):
+            self._combine()
+            return _cube_from_rollups({name: parts[0] for name, parts in self._partials.items()}, self.row_count, self.backend)
+
+
+COMPARISON_COLUMNS = ["track", "metric", "period1_value", "period2_value", "value_change", "percent_change"]
+
+
+# Period-over-period totals for every selected track x metric in one batch.
+# `source` is anything with period_totals (RollupCube, PushdownSqlSource).
+# Returns a tidy frame (one row per metric x track, metric-major as the Trends
+# tab lays out its charts) with the columns in COMPARISON_COLUMNS.
+def compare_periods(source, tracks, metrics, period1, period2):
+    tracks, metrics = list(tracks), list(metrics)
+    period1_values, period2_values = source.period_totals(tracks, metrics, [period1, period2])
+    # metric-major order: transpose (track, metric) -> (metric, track) before raveling
+    period1_values = period1_values.T.ravel()
+    period2_values = period2_values.T.ravel()
+    value_change = period2_values - period1_values
+    with np.errstate(divide="ignore", invalid="ignore"):
+        percent_change = np.where(period1_values != 0, value_change / period1_values * 100, 0.0)
+    return pd.DataFrame({
+        "track": np.tile(np.array(tracks, dtype=object), len(metrics)),
+        "metric": np.repeat(np.array(metrics, dtype=object), len(tracks)),
+        "period1_value": period1_values,
+        "period2_value": period2_values,
+        "value_change": value_change,
+        "percent_change": percent_change
+    }, columns=COMPARISON_COLUMNS)
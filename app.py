@@ -17,6 +17,29 @@
 # - Test database connections with BigQuery or Microsoft SQL Server.
 # - Switch between "360 View" and "Trends Comparison" tabs.
 # - Verify connection success messages, data loading, and dashboard functionality.
+#
+# **Optional: Materialized Demo Dataset**:
+# - Run `python dummy_data.py <dir> --seed <n>` to write the demo dataset once (or let the app write it on first start).
+# - Set `TRACKMONITOR_DEMO_DATA_DIR=<dir>` and `TRACKMONITOR_DEMO_DATA_SEED=<n>`; "Dummy Data" is then memory-mapped from disk.
+#
+# **Optional: Out-of-Core Mode**:
+# - Set `TRACKMONITOR_OUT_OF_CORE_DIR=<dir>` (requires `duckdb`); "Dummy Data" is then written to partitioned Parquet there and queried with DuckDB.
+# - For Microsoft SQL Server, pick the "Out-of-Core" query mode: new rows (by `id`) are appended, and the table is rewritten every `TRACKMONITOR_SQL_FULL_REFRESH_SECONDS`. `TRACKMONITOR_OUT_OF_CORE_MEMORY_LIMIT` (e.g. `2GB`) caps the engine.
+#
+# **Optional: Aggregation Backend**:
+# - Set `TRACKMONITOR_AGGREGATION_BACKEND=polars` (requires `polars`) to build the rollup cube on all cores instead of single-threaded pandas.
+# - Set `TRACKMONITOR_AGGREGATION_CROSS_CHECK=1` to also run every aggregation on pandas and log any result that differs.
+#
+# **Optional: Parallel Trends Comparison**:
+# - Set `TRACKMONITOR_COMPARE_WORKERS=<n>` to split very large Trends comparisons by track over `n` worker processes.
+# - Selections with fewer than `TRACKMONITOR_COMPARE_MIN_CELLS` track x metric cells (default 60000) still run in-process; at dashboard sizes (at most 34 x 15 cells) that is every selection, since the pool is slower there.
+#
+# **Optional: Benchmarks**:
+# - Run `python benchmark.py --rows 1M,10M,50M --tracks 1,8,34 --metrics 1,15 --save baseline.json` to record a baseline.
+# - Re-run with `--baseline baseline.json` instead of `--save`; it exits with status 1 when a stage regressed.
+#
+# **Optional: Tests**:
+# - Run `python -m pytest tests` (requires `pytest`); tests of optional engines (`duckdb`, `polars`, `sqlalchemy`) are skipped when those are not installed.
 
 import streamlit as st
 import pandas as pd
@@ -25,12 +48,26 @@ import plotly.graph_objects as go
 import numpy as np
 from datetime import datetime, timedelta, date
 import time
-from sqlalchemy import create_engine
 import os
 import warnings
 import logging
 import threading
-import re
+import uuid
+import hashlib
+
+from dummy_data import generate_churn_triggers, generate_dummy_frames, generate_subscription_chunks, generate_top_coupons, generate_top_promotions, load_dataset
+from schema import normalize_subscriptions
+from aggregations import build_rollup_cube, compare_periods, make_aggregation_backend, set_aggregation_backend, set_comparison_pool, time_grain
+from sql_source import WATERMARKS, IncrementalSqlLoader, PushdownSqlSource, acquire_engine, get_engine, iter_subscription_chunks, release_engine
+from parquet_source import IncrementalParquetMirror, ParquetDataset
+from bigquery_source import BigQueryReader, BigQuerySource
+from parallel_compare import ComparisonPool
+from refresher import BackgroundRefresher, SnapshotStore
+from result_cache import CachedAggregates, VersionedCache
+from downsampling import downsample_frame
+from charts import get_date_ranges, short_period_label, trend_figure
+from summary_table import PAGE_SIZES, PARQUET_EXPORT, SORT_COLUMNS, export_frame, page_count, sort_summary, summary_page, summary_table_html, to_csv_bytes, to_parquet_bytes
+from instrumentation import record_stage, stage, stage_metrics, start_metrics_server, timed
 
 # Optional database libraries
 try:
@@ -45,6 +82,69 @@ logger = logging.getLogger(__name__)
 # Suppress warnings for cleaner output
 warnings.filterwarnings('ignore')
 
+# Snapshot frames are shared by every session: with copy-on-write, frames derived
+# from them copy before any write instead of modifying the shared data
+pd.set_option("mode.copy_on_write", True)
+
+# Materialized demo dataset: when a directory is configured, "Dummy Data" is generated
+# once from a fixed seed, persisted as columnar files and memory-mapped on startup,
+# instead of being regenerated from the clock on every refresh.
+DEMO_DATA_DIR = os.environ.get("TRACKMONITOR_DEMO_DATA_DIR", "")
+DEMO_DATA_SEED = int(os.environ.get("TRACKMONITOR_DEMO_DATA_SEED", "0"))
+
+# Out-of-core mode: when a directory is set, "Dummy Data" (and the SQL Server
+# "Out-of-Core" query mode) write the subscriptions to partitioned Parquet files
+# there and answer every query with the embedded DuckDB engine, so the history
+# never has to fit in memory. The memory limit caps DuckDB itself (e.g. "2GB").
+OUT_OF_CORE_DIR = os.environ.get("TRACKMONITOR_OUT_OF_CORE_DIR", "")
+OUT_OF_CORE_MEMORY_LIMIT = os.environ.get("TRACKMONITOR_OUT_OF_CORE_MEMORY_LIMIT", "")
+
+# Engine behind the rollup cube's group-by sums: "pandas" (single-threaded) or
+# "polars" (multi-threaded, columnar). With the cross-check on, every aggregation
+# also runs on pandas and differences are logged; pandas' results are used.
+AGGREGATION_BACKEND = os.environ.get("TRACKMONITOR_AGGREGATION_BACKEND", "pandas")
+AGGREGATION_CROSS_CHECK = os.environ.get("TRACKMONITOR_AGGREGATION_CROSS_CHECK", "0") == "1"
+
+# Trends comparisons on the in-memory cube are split by track over
+# COMPARE_WORKERS processes (0 or 1 keeps them in the script thread), which read
+# the cube's cumulative sums from shared memory. Selections under
+# COMPARE_MIN_CELLS track x metric cells are looked up in-process (see
+# parallel_compare for the measured crossover).
+COMPARE_WORKERS = int(os.environ.get("TRACKMONITOR_COMPARE_WORKERS", "0"))
+COMPARE_MIN_CELLS = int(os.environ.get("TRACKMONITOR_COMPARE_MIN_CELLS", "60000"))
+
+# Microsoft SQL Server refreshes are incremental: only rows past the high-water mark
+# ("id" or "date") are fetched, with a full reload every SQL_FULL_REFRESH_SECONDS to
+# pick up late corrections (0 reloads the whole table on every refresh).
+SQL_WATERMARK = os.environ.get("TRACKMONITOR_SQL_WATERMARK", "id")
+SQL_FULL_REFRESH_SECONDS = int(os.environ.get("TRACKMONITOR_SQL_FULL_REFRESH_SECONDS", "900"))
+
+# Data is refreshed in the background every REFRESH_SECONDS; reruns read the latest snapshot
+REFRESH_SECONDS = 10
+
+# Memory budget of the process-wide cache of computed results (KPIs, chart data, comparisons)
+RESULT_CACHE_MB = int(os.environ.get("TRACKMONITOR_RESULT_CACHE_MB", "256"))
+
+# Time-series charts are downsampled (LTTB) to at most CHART_MAX_POINTS points (0
+# plots every bucket). The day / week / month grain already keeps a series under
+# about 105 points; 60 leaves the full-width line charts' markers roughly 18 px
+# apart, so longer daily and weekly ranges are thinned while months are not.
+CHART_MAX_POINTS = int(os.environ.get("TRACKMONITOR_CHART_MAX_POINTS", "60"))
+
+# Port of the Prometheus text endpoint (/metrics) with per-stage latencies; 0 disables it
+METRICS_PORT = int(os.environ.get("TRACKMONITOR_METRICS_PORT", "0"))
+
+# Connection pool of the process-wide SQL Server engine, shared by every session
+SQL_POOL_OPTIONS = {
+    "pool_size": int(os.environ.get("TRACKMONITOR_SQL_POOL_SIZE", "5")),
+    "max_overflow": int(os.environ.get("TRACKMONITOR_SQL_MAX_OVERFLOW", "10")),
+    "pool_pre_ping": os.environ.get("TRACKMONITOR_SQL_POOL_PRE_PING", "1") == "1",
+    "pool_recycle": int(os.environ.get("TRACKMONITOR_SQL_POOL_RECYCLE_SECONDS", "1800"))
+}
+
+# Start of this script run (the "rerun" stage)
+rerun_started = time.perf_counter()
+
 # Streamlit page configuration
 st.set_page_config(page_title="TrendTrack Monitor - Modern Dashboard", layout="wide")
 
@@ -197,20 +297,16 @@ if 'connection_params' not in st.session_state:
     st.session_state.connection_params = {}
 if 'data_fetched' not in st.session_state:
     st.session_state.data_fetched = False
-if 'df' not in st.session_state:
-    st.session_state.df = None
 if 'error_message' not in st.session_state:
     st.session_state.error_message = ""
 if 'connection_established' not in st.session_state:
     st.session_state.connection_established = False
 if 'connection_objects' not in st.session_state:
     st.session_state.connection_objects = {}
-if 'churn_triggers' not in st.session_state:
-    st.session_state.churn_triggers = None
-if 'top_promotions' not in st.session_state:
-    st.session_state.top_promotions = None
-if 'top_coupons' not in st.session_state:
-    st.session_state.top_coupons = None
+if 'session_id' not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+if 'snapshot_keys' not in st.session_state:
+    st.session_state.snapshot_keys = set()
 
 # Database parameter requirements
 db_param_requirements = {
@@ -224,6 +320,217 @@ db_param_defaults = {
     "BigQuery": {"project_id": "", "dataset_id": "trendtrack", "table_id": "subscriptions", "credential_path": ""}
 }
 
+# Fields of a data snapshot (see refresher.Snapshot)
+def snapshot_fields(token, aggregates, churn_triggers_df, top_promotions_df, top_coupons_df):
+    return {
+        "token": token,
+        "aggregates": aggregates,
+        "churn_triggers": churn_triggers_df,
+        "top_promotions": top_promotions_df,
+        "top_coupons": top_coupons_df
+    }
+
+# Generate dummy data (matching HTML code)
+def build_live_dummy_snapshot():
+    seed = int(time.time())
+    with stage("fetch") as record:
+        subscriptions_df, churn_triggers_df, top_promotions_df, top_coupons_df = generate_dummy_frames(seed)
+        record.rows, record.bytes = len(subscriptions_df), int(subscriptions_df.memory_usage(deep=True).sum())
+    subscriptions_df, _ = normalize_subscriptions(subscriptions_df, "dummy data")
+    logger.info("Generated dummy data")
+    return snapshot_fields(seed, build_rollup_cube(subscriptions_df), churn_triggers_df, top_promotions_df, top_coupons_df)
+
+# Load the materialized demo dataset (memory-mapped frames, shared by every session)
+def build_demo_snapshot(data_dir, seed):
+    with stage("fetch") as record:
+        subscriptions_df, churn_triggers_df, top_promotions_df, top_coupons_df = load_dataset(data_dir, seed)
+        record.rows = len(subscriptions_df)
+    subscriptions_df, _ = normalize_subscriptions(subscriptions_df, "demo dataset")
+    logger.info(f"Loaded demo dataset from {data_dir} (seed {seed})")
+    return snapshot_fields((data_dir, seed), build_rollup_cube(subscriptions_df), churn_triggers_df, top_promotions_df, top_coupons_df)
+
+# Versioned Parquet dataset of one source under OUT_OF_CORE_DIR
+def get_out_of_core_dataset(name):
+    if not OUT_OF_CORE_DIR:
+        raise ValueError("Out-of-core mode needs TRACKMONITOR_OUT_OF_CORE_DIR to be set.")
+    return ParquetDataset(os.path.join(OUT_OF_CORE_DIR, name), memory_limit=OUT_OF_CORE_MEMORY_LIMIT or None)
+
+# Generate the dummy data month by month straight into Parquet, once per seed
+def build_out_of_core_dummy_snapshot(seed):
+    dataset = get_out_of_core_dataset(f"dummy-{seed}")
+    if dataset.latest() is None:
+        rng = np.random.default_rng(seed)
+        dataset.write(normalize_subscriptions(chunk, "dummy data chunk", log=False)[0] for chunk in generate_subscription_chunks(rng))
+    source = dataset.source()
+    logger.info(f"Opened out-of-core dummy data in {source.path}")
+    rng = np.random.default_rng(seed)
+    return snapshot_fields(source.path, source, generate_churn_triggers(rng), generate_top_promotions(rng), generate_top_coupons(rng))
+
+# Dummy data refresher. The demo dataset is static and built once.
+def start_dummy_refresher(data_dir, seed):
+    if OUT_OF_CORE_DIR:
+        return BackgroundRefresher(lambda: build_out_of_core_dummy_snapshot(seed), interval=None, name="dummy data (out-of-core)").start()
+    if data_dir:
+        return BackgroundRefresher(lambda: build_demo_snapshot(data_dir, seed), interval=None, name="demo dataset").start()
+    return BackgroundRefresher(build_live_dummy_snapshot, interval=REFRESH_SECONDS, name="dummy data").start()
+
+# Churn triggers, promotions and coupons are not in the database; database
+# snapshots carry dummy ones
+def generate_dummy_tables():
+    rng = np.random.default_rng(int(time.time()))
+    return generate_churn_triggers(rng), generate_top_promotions(rng), generate_top_coupons(rng)
+
+def sql_connection_string(params):
+    return f"mssql+pyodbc://{params['username']}:{params['password']}@{params['server']}/{params['database']}?driver={params['driver']}"
+
+# Incremental SQL Server loader (owned by the connection's refresher)
+def get_sql_loader(connection_string):
+    return IncrementalSqlLoader(
+        get_engine(connection_string, **SQL_POOL_OPTIONS),
+        watermark=SQL_WATERMARK,
+        full_refresh_interval=SQL_FULL_REFRESH_SECONDS
+    )
+
+# Pushdown query source: filters and aggregation run in SQL Server
+def get_pushdown_source(connection_string):
+    return PushdownSqlSource(get_engine(connection_string, **SQL_POOL_OPTIONS), cache_ttl=SQL_FULL_REFRESH_SECONDS or None)
+
+# Session key of each database's snapshot key in connection_objects
+CONNECTION_KEYS = {"Microsoft SQL Server": "MSSQL", "BigQuery": "BigQuery"}
+
+# Release this session's connections. The pooled engine and the snapshot store
+# entry are shared: they are closed once the last session holding them lets go.
+def cleanup():
+    if 'connection_objects' in st.session_state:
+        for conn_type, conn in st.session_state.connection_objects.items():
+            try:
+                if conn_type == "engine" and conn:
+                    release_engine(conn, st.session_state.session_id)
+                elif conn_type in CONNECTION_KEYS.values() and conn:
+                    get_snapshot_store().release(conn, st.session_state.session_id)
+                    st.session_state.snapshot_keys.discard(conn)
+            except:
+                pass
+        st.session_state.connection_objects = {}
+
+# Fetch data from SQL database (for Microsoft SQL Server)
+def fetch_sql_data(loader):
+    try:
+        return loader.refresh()
+    except Exception as e:
+        logger.error(f"SQL query failed: {str(e)}")
+        raise
+
+# SQL Server refresher, one per connection and query mode. Pushdown snapshots
+# hold the source itself; its query cache is dropped when the table changes.
+def start_sql_refresher(connection_string, query_mode):
+    if query_mode == "Pushdown":
+        source = get_pushdown_source(connection_string)
+        def build():
+            return snapshot_fields(source.data_token(), source, *generate_dummy_tables())
+    elif query_mode == "Out-of-Core":
+        # Rows past the highest id are appended to the Parquet mirror; the table
+        # is rewritten in full every SQL_FULL_REFRESH_SECONDS
+        dataset = get_out_of_core_dataset(f"sql-{hashlib.sha1(connection_string.encode()).hexdigest()[:16]}")
+        engine = get_engine(connection_string, **SQL_POOL_OPTIONS)
+        def read_chunks(after_id):
+            if after_id is None:
+                return iter_subscription_chunks(engine)
+            return iter_subscription_chunks(engine, WATERMARKS["id"][1], {"watermark": int(after_id)})
+        mirror = IncrementalParquetMirror(dataset, read_chunks, full_refresh_interval=SQL_FULL_REFRESH_SECONDS)
+        def build():
+            source = mirror.refresh()
+            return snapshot_fields(mirror.version, source, *generate_dummy_tables())
+    else:
+        loader = get_sql_loader(connection_string)
+        def build():
+            cube = fetch_sql_data(loader)
+            return snapshot_fields(loader.version, cube, *generate_dummy_tables())
+    return BackgroundRefresher(build, interval=REFRESH_SECONDS, name=f"SQL Server ({query_mode})").start()
+
+# BigQuery source: pruned, filtered queries per selection with a local result cache
+def get_bigquery_source(project_id, dataset_id, table_id, credential_path):
+    if not bigquery:
+        raise ImportError("google-cloud-bigquery is not installed.")
+    os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = credential_path
+    client = bigquery.Client(project=project_id)
+    return BigQuerySource(BigQueryReader(client, project_id, dataset_id, table_id))
+
+def bigquery_table_params(params):
+    return params['project_id'], params['dataset_id'], params['table_id'], params['credential_path']
+
+# BigQuery refresher: re-checks the table's last-modified time; unchanged tables are not re-queried
+def start_bigquery_refresher(project_id, dataset_id, table_id, credential_path):
+    source = get_bigquery_source(project_id, dataset_id, table_id, credential_path)
+    def build():
+        return snapshot_fields(source.data_token(), source, *generate_dummy_tables())
+    return BackgroundRefresher(build, interval=REFRESH_SECONDS, name="BigQuery").start()
+
+# Refresher for a snapshot key: (data source, connection identity...)
+def start_refresher(key):
+    if key[0] == "Microsoft SQL Server":
+        return start_sql_refresher(*key[1:])
+    if key[0] == "BigQuery":
+        return start_bigquery_refresher(*key[1:])
+    return start_dummy_refresher(*key[1:])
+
+# Process-wide aggregation backend, chosen once before any cube is built
+@st.cache_resource
+def get_aggregation_backend():
+    try:
+        backend = make_aggregation_backend(AGGREGATION_BACKEND, cross_check=AGGREGATION_CROSS_CHECK)
+    except (ImportError, ValueError) as e:
+        logger.error(f"Aggregation backend {AGGREGATION_BACKEND} not available, using pandas: {str(e)}")
+        backend = make_aggregation_backend("pandas")
+    set_aggregation_backend(backend)
+    return backend
+
+# Process-wide comparison worker pool, shared by every session
+@st.cache_resource
+def get_comparison_pool():
+    pool = ComparisonPool(COMPARE_WORKERS, min_cells=COMPARE_MIN_CELLS) if COMPARE_WORKERS > 1 else None
+    set_comparison_pool(pool)
+    return pool
+
+# Process-wide snapshot store: one refresher (one copy of the data, one refresh
+# schedule) per snapshot key, shared by every session reading it
+@st.cache_resource
+def get_snapshot_store():
+    get_aggregation_backend()
+    get_comparison_pool()
+    return SnapshotStore(start_refresher)
+
+# Results computed from snapshots, keyed by (snapshot key, data version) and
+# shared by every session; a refresh only invalidates the source that changed
+@st.cache_resource
+def get_result_cache():
+    return VersionedCache(max_bytes=RESULT_CACHE_MB * 1024 * 1024)
+
+# Result cache, snapshot store and backend cross-check gauges, exported next to the stage latencies
+def metrics_gauges(result_cache, snapshot_store, backend):
+    stats = result_cache.stats()
+    holder_counts = snapshot_store.holder_counts()
+    return {
+        "result_cache_hits": stats["hits"],
+        "result_cache_misses": stats["misses"],
+        "result_cache_entries": stats["entries"],
+        "result_cache_bytes": stats["bytes"],
+        "snapshot_sources": len(holder_counts),
+        "snapshot_sessions": sum(holder_counts.values()),
+        "aggregation_cross_checks": getattr(backend, "checks", 0),
+        "aggregation_mismatches": getattr(backend, "mismatches", 0)
+    }
+
+# Prometheus text endpoint, started once per process
+@st.cache_resource
+def get_metrics_server():
+    result_cache, snapshot_store, backend = get_result_cache(), get_snapshot_store(), get_aggregation_backend()
+    try:
+        return start_metrics_server(METRICS_PORT, gauges=lambda: metrics_gauges(result_cache, snapshot_store, backend))
+    except OSError as e:
+        logger.error(f"Metrics endpoint not started: {str(e)}")
+        return None
+
 # Dynamic parameter prompts
 if data_source != "Dummy Data":
     params = db_param_requirements.get(data_source, [])
@@ -238,6 +545,14 @@ if data_source != "Dummy Data":
         else:
             st.session_state.connection_params[param] = st.sidebar.text_input(param.capitalize(), value=default_value, key=param)
 
+    # Query mode: extract the table into memory, push each query down to the server,
+    # or mirror the table to local Parquet and query it with DuckDB (out-of-core)
+    sql_query_modes = ["Full Extract", "Pushdown", "Out-of-Core"]
+    if data_source == "Microsoft SQL Server":
+        sql_query_mode = st.sidebar.selectbox("Query Mode", sql_query_modes, key="sql_query_mode")
+    else:
+        sql_query_mode = "Full Extract"
+
     # Connect button with validation
     if st.sidebar.button("Connect"):
         # Basic parameter validation
@@ -248,32 +563,23 @@ if data_source != "Dummy Data":
             logger.error(st.session_state.error_message)
         else:
             # Clean up existing connections
-            if 'connection_objects' in st.session_state:
-                for conn_type, conn in st.session_state.connection_objects.items():
-                    try:
-                        if conn_type in ["Microsoft SQL Server"] and conn:
-                            conn.dispose()
-                    except:
-                        pass
-            st.session_state.connection_objects = {}
+            cleanup()
 
             try:
-                if data_source == "Microsoft SQL Server":
-                    connection_string = f"mssql+pyodbc://{st.session_state.connection_params['username']}:{st.session_state.connection_params['password']}@{st.session_state.connection_params['server']}/{st.session_state.connection_params['database']}?driver={st.session_state.connection_params['driver']}"
-                    engine = create_engine(connection_string)
-                    df = fetch_sql_data(engine, st.session_state.get('refresh_key', 0))
-                    st.session_state.connection_objects['MSSQL'] = engine
-                elif data_source == "BigQuery":
-                    if not bigquery:
-                        raise ImportError("google-cloud-bigquery is not installed.")
-                    os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = st.session_state.connection_params['credential_path']
-                    client = bigquery.Client(project=st.session_state.connection_params['project_id'])
-                    query = f"SELECT * FROM `{st.session_state.connection_params['project_id']}.{st.session_state.connection_params['dataset_id']}.{st.session_state.connection_params['table_id']}`"
-                    df = client.query(query).to_dataframe()
-                    if 'Date' in df.columns:
-                        df['Date'] = pd.to_datetime(df['Date'])
-                    st.session_state.connection_objects['BigQuery'] = client
-                st.session_state.df = df
+                # The first snapshot is built before acquire returns (or raises)
+                with stage("connect"):
+                    if data_source == "Microsoft SQL Server":
+                        st.session_state.connection_objects['engine'] = acquire_engine(
+                            sql_connection_string(st.session_state.connection_params),
+                            st.session_state.session_id,
+                            **SQL_POOL_OPTIONS
+                        )
+                        snapshot_key = (data_source, sql_connection_string(st.session_state.connection_params), sql_query_mode)
+                    elif data_source == "BigQuery":
+                        snapshot_key = (data_source,) + bigquery_table_params(st.session_state.connection_params)
+                    get_snapshot_store().acquire(snapshot_key, st.session_state.session_id)
+                st.session_state.snapshot_keys.add(snapshot_key)
+                st.session_state.connection_objects[CONNECTION_KEYS[data_source]] = snapshot_key
                 st.session_state.data_fetched = True
                 st.session_state.connection_established = True
                 st.session_state.error_message = ""
@@ -283,182 +589,76 @@ if data_source != "Dummy Data":
                 st.session_state.error_message = f"Connection failed: {str(e)}. Reverted to dummy data."
                 st.session_state.data_fetched = False
                 st.session_state.connection_established = False
-                df = generate_dummy_data(st.session_state.get('refresh_key', 0))
-                st.session_state.df = df
                 st.sidebar.error(st.session_state.error_message)
                 logger.error(f"Database connection failed: {str(e)}")
 
-# Generate dummy data (matching HTML code)
-@st.cache_data(ttl=10)
-def generate_dummy_data(_refresh_key):
-    np.random.seed(int(time.time()))
-    start_date = pd.to_datetime("2023-01-01")
-    end_date = pd.to_datetime("2025-04-06")
-    dates = pd.date_range(start=start_date, end=end_date, freq="D")
-    regions = ["North America", "South America", "Europe", "Africa", "Asia", "Australia"]
-    skus = ["SKU005", "SKU002", "SKU018", "SKU036", "SKU001"]
-    payment_methods = ["App Billing", "Google Wallet", "Pay Pal", "Roku Payment", "Debit Card", "Credit Card"]
-    statuses = ["Paid", "Active", "Free Trial", "Registered"]
-    clients = [
-        "1001", "AHA", "ATT", "Antel", "ABSCBN", "Astro Sooka", "Astro NJOI", "Astro PayTV",
-        "BBCAsia", "Britbox", "Cignal", "Etisalat", "Etv", "Exxen", "FOXUSA", "Kocowa",
-        "Lightbox", "MongolTV", "Marquee", "MK Ooredoo", "NBA", "NEWS9", "PLDT", "Pilipinas",
-        "Sinclair", "Sony", "SimpleTv", "Shahid", "TRT World", "TV3", "TV ASAHI", "VIKI",
-        "One31", "Gotham"
-    ]
-
-    # Subscriptions data
-    subscriptions_data = []
-    for date in dates:
-        for region in regions:
-            for sku in skus:
-                for client in clients:
-                    for status in statuses:
-                        subscriptions_data.append({
-                            "Date": date,
-                            "Region": region,
-                            "SKU": sku,
-                            "Client": client,
-                            "Status": status,
-                            "Subscribers": np.random.randint(500, 5000),
-                            "Revenue": np.random.randint(10000, 100000),
-                            "PaymentMethod": np.random.choice(payment_methods),
-                            "FreeTrials": np.random.randint(100, 500),
-                            "NewOrders": np.random.randint(50, 200),
-                            "Conversions": np.random.randint(100, 500),
-                            "Redemptions": np.random.randint(20, 100),
-                            "Registrations": np.random.randint(200, 600),
-                            "ActivePaid": np.random.randint(300, 4000),
-                            "Renewals": np.random.randint(100, 300),
-                            "PaymentAmount": np.random.randint(5000, 20000),
-                            "RefundAmount": np.random.randint(100, 1000),
-                            "InvoluntaryChurn": np.random.randint(50, 200),
-                            "VoluntaryChurn": np.random.randint(50, 200),
-                            "Winbacks": np.random.randint(10, 100)
-                        })
-    subscriptions_df = pd.DataFrame(subscriptions_data)
-
-    # Churn triggers
-    churn_triggers = []
-    triggers = [
-        "Got all the content needed already",
-        "Was too expensive",
-        "Technical issues",
-        "Stopped subscribing to bundling partner",
-        "After trial is expired, decided not to continue"
-    ]
-    for client in clients:
-        for trigger in triggers:
-            churn_triggers.append({
-                "Trigger": trigger,
-                "ChurnRate": np.random.uniform(5, 25),
-                "Client": client
-            })
-    churn_triggers_df = pd.DataFrame(churn_triggers)
-
-    # Top promotions
-    top_promotions = []
-    promos = ["Spring Deal", "20% OFF Combo", "AppleTV Offer", "Credit Card Offer", "Package10%OFF"]
-    for client in clients:
-        for promo in promos:
-            top_promotions.append({
-                "Promotion": promo,
-                "ProfitMargin": np.random.uniform(18, 35),
-                "Client": client
-            })
-    top_promotions_df = pd.DataFrame(top_promotions)
-
-    # Top coupons
-    top_coupons = []
-    coupons = ["FLAT25", "MOVIE999", "PREMIERE", "SAVE50", "FESTIVE10", "OFFER999", "FIRST50"]
-    for client in clients:
-        for coupon in coupons:
-            top_coupons.append({
-                "Coupon": coupon,
-                "Count": np.random.randint(50, 87),
-                "Client": client
-            })
-    top_coupons_df = pd.DataFrame(top_coupons)
-
-    logger.info("Generated dummy data")
-    return subscriptions_df, churn_triggers_df, top_promotions_df, top_coupons_df
-
-# Fetch data from SQL database (for Microsoft SQL Server)
-@st.cache_data(ttl=10)
-def fetch_sql_data(_engine, _refresh_key):
-    query = """
-    SELECT id, date, region, sku, client, status, subscribers, revenue, payment_method,
-           free_trials, new_orders, conversions, redemptions, registrations, active_paid,
-           renewals, payment_amount, refund_amount, involuntary_churn, voluntary_churn, winbacks
-    FROM subscriptions
-    """
+# Diagnostics panel: per-stage latencies, result cache and snapshot state
+show_diagnostics = st.sidebar.checkbox("Show diagnostics", key="show_diagnostics")
+
+# Current data snapshot, from the process-wide store. The source's refresher
+# publishes a new one in the background; reruns only read it and never wait on a
+# fetch. This session holds the keys it reads and releases the ones it stopped using.
+snapshot_store = get_snapshot_store()
+snapshot_store.sweep()
+held_keys = set()
+refresher = None
+if data_source != "Dummy Data" and st.session_state.data_fetched:
+    snapshot_key = st.session_state.connection_objects.get(CONNECTION_KEYS[data_source])
     try:
-        df = pd.read_sql(query, _engine).assign(date=lambda x: pd.to_datetime(x['date']))
-        logger.info("Fetched data from SQL database")
-        return df
+        if snapshot_key is not None:
+            held_keys.add(snapshot_key)
+            refresher = snapshot_store.acquire(snapshot_key, st.session_state.session_id)
+            active_key = snapshot_key
+        if refresher is not None and refresher.last_error is not None:
+            raise refresher.last_error
     except Exception as e:
-        logger.error(f"SQL query failed: {str(e)}")
-        raise
-
-# Initialize data
-if data_source == "Dummy Data" or not st.session_state.data_fetched:
-    subscriptions_df, churn_triggers_df, top_promotions_df, top_coupons_df = generate_dummy_data(st.session_state.get('refresh_key', 0))
-else:
-    subscriptions_df = st.session_state.df
-    # For database mode, generate churn triggers, promotions, and coupons as dummy data if not fetched
-    if st.session_state.churn_triggers is None or st.session_state.top_promotions is None or st.session_state.top_coupons is None:
-        _, churn_triggers_df, top_promotions_df, top_coupons_df = generate_dummy_data(st.session_state.get('refresh_key', 0))
-    else:
-        churn_triggers_df = st.session_state.churn_triggers
-        top_promotions_df = st.session_state.top_promotions
-        top_coupons_df = st.session_state.top_coupons
-
-# Store additional data in session state
-st.session_state.churn_triggers = churn_triggers_df
-st.session_state.top_promotions = top_promotions_df
-st.session_state.top_coupons = top_coupons_df
-
-# Initialize refresh key for real-time updates
-if 'refresh_key' not in st.session_state:
-    st.session_state.refresh_key = 0
-
-# Auto-refresh for real-time updates
-if 'last_refresh' not in st.session_state:
-    st.session_state.last_refresh = time.time()
-
-if time.time() - st.session_state.last_refresh > 10:  # Refresh every 10 seconds
-    st.session_state.refresh_key += 1
-    st.cache_data.clear()
-    if data_source == "Dummy Data" or not st.session_state.data_fetched:
-        subscriptions_df, churn_triggers_df, top_promotions_df, top_coupons_df = generate_dummy_data(st.session_state.refresh_key)
-    else:
-        try:
-            if data_source == "Microsoft SQL Server":
-                engine = create_engine(
-                    f"mssql+pyodbc://{st.session_state.connection_params['username']}:{st.session_state.connection_params['password']}@{st.session_state.connection_params['server']}/{st.session_state.connection_params['database']}?driver={st.session_state.connection_params['driver']}"
-                )
-                subscriptions_df = fetch_sql_data(engine, st.session_state.refresh_key)
-                st.session_state.connection_objects['MSSQL'] = engine
-            elif data_source == "BigQuery":
-                os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = st.session_state.connection_params['credential_path']
-                client = bigquery.Client(project=st.session_state.connection_params['project_id'])
-                query = f"SELECT * FROM `{st.session_state.connection_params['project_id']}.{st.session_state.connection_params['dataset_id']}.{st.session_state.connection_params['table_id']}`"
-                subscriptions_df = client.query(query).to_dataframe()
-                if 'Date' in subscriptions_df.columns:
-                    subscriptions_df['Date'] = pd.to_datetime(subscriptions_df['Date'])
-                st.session_state.connection_objects['BigQuery'] = client
-            # Regenerate churn triggers, promotions, and coupons as they may not be in the database
-            _, churn_triggers_df, top_promotions_df, top_coupons_df = generate_dummy_data(st.session_state.refresh_key)
-        except Exception as e:
-            st.session_state.error_message = f"Connection lost: {str(e)}. Reverted to dummy data."
-            subscriptions_df, churn_triggers_df, top_promotions_df, top_coupons_df = generate_dummy_data(st.session_state.refresh_key)
-            logger.error(f"Connection lost during refresh: {str(e)}")
-    st.session_state.df = subscriptions_df
-    st.session_state.churn_triggers = churn_triggers_df
-    st.session_state.top_promotions = top_promotions_df
-    st.session_state.top_coupons = top_coupons_df
-    st.session_state.last_refresh = time.time()
-    st.experimental_rerun()
+        st.session_state.error_message = f"Connection lost: {str(e)}. Reverted to dummy data."
+        logger.error(f"Connection lost during refresh: {str(e)}")
+        refresher = None
+if refresher is None:
+    active_key = ("Dummy Data", DEMO_DATA_DIR, DEMO_DATA_SEED)
+    held_keys.add(active_key)
+    refresher = snapshot_store.acquire(active_key, st.session_state.session_id)
+for snapshot_key in st.session_state.snapshot_keys - held_keys:
+    snapshot_store.release(snapshot_key, st.session_state.session_id)
+st.session_state.snapshot_keys = held_keys
+snapshot = refresher.snapshot
+
+churn_triggers_df = snapshot.churn_triggers
+top_promotions_df = snapshot.top_promotions
+top_coupons_df = snapshot.top_coupons
+# Pre-aggregated views of the current data (a rollup cube in memory, or the SQL
+# Server pushdown / BigQuery source), with results cached per data version
+result_cache = get_result_cache()
+result_cache.retain(active_key, snapshot.version)
+if METRICS_PORT:
+    get_metrics_server()
+aggregates = CachedAggregates(snapshot.aggregates, result_cache, active_key, snapshot.version)
+
+# Built Plotly figure for a chart, reused across reruns and sessions until the
+# selection it was drawn for (`figure_key`) or the data version changes
+def cached_figure(chart_id, figure_key, build):
+    return result_cache.get_or_compute(active_key, snapshot.version, ("figure", chart_id, figure_key), timed("figure")(build))
+
+# Send a figure to the browser (serialization and the element delta)
+def render_chart(fig):
+    with stage("render"):
+        st.plotly_chart(fig, use_container_width=True)
+
+# Reruns the whole app once the refresher publishes a new data version (or the
+# database connection fails). Widget changes only rerun their own tab's fragment,
+# so this is what picks up background refreshes without user interaction. It also
+# keeps this session's hold on its snapshot fresh between full reruns, and reruns
+# (re-acquiring a refresher) if the store stopped this one anyway.
+@st.experimental_fragment(run_every=REFRESH_SECONDS)
+def watch_data_version():
+    snapshot_store.touch(active_key, st.session_state.session_id)
+    if refresher.stopped or refresher.snapshot is not snapshot:
+        st.rerun()
+    if active_key[0] != "Dummy Data" and refresher.last_error is not None:
+        st.rerun()
+
+watch_data_version()
 
 # Dashboard title
 st.markdown('<h1 class="text-4xl font-bold text-center text-gray-800 mb-8">TrendTrack Monitor</h1>', unsafe_allow_html=True)
@@ -466,43 +666,47 @@ st.markdown('<h1 class="text-4xl font-bold text-center text-gray-800 mb-8">Trend
 # Tabs
 tab1, tab2 = st.tabs(["360 View", "Trends Comparison"])
 
-# 360 View Tab (Single Track)
-with tab1:
-    # Filters
-    st.markdown('<div class="filter-section">', unsafe_allow_html=True)
-    col1, col2, col3 = st.columns(3)
-    with col1:
-        clients = sorted(subscriptions_df['Client'].unique())
-        track_360 = st.selectbox("Track Name", ["Select a track"] + clients, key="track_360")
-    with col2:
-        regions = ["All"] + sorted(subscriptions_df['Region'].unique())
-        region_360 = st.selectbox("Region", regions, key="region_360")
-    with col3:
-        time_periods = ["Last 7 Days", "Last 30 Days", "Last 90 Days", "Last 6 Months", "Last Year", "Custom Range"]
-        time_period_360 = st.selectbox("Time Period", time_periods, key="time_period_360")
-
-    # Custom date range
-    if time_period_360 == "Custom Range":
-        st.markdown('<div class="custom-date-range">', unsafe_allow_html=True)
-        col4, col5 = st.columns(2)
-        with col4:
-            start_date_360 = st.date_input("Start Date", value=datetime.now() - timedelta(days=30), max_value=date(2025, 4, 6), key="start_date_360")
-        with col5:
-            end_date_360 = st.date_input("End Date", value=date(2025, 4, 6), max_value=date(2025, 4, 6), key="end_date_360")
+# 360 View Tab (Single Track). A fragment: its filters rerun only this tab (KPIs
+# and charts), not the sidebar or the Trends tab
+@st.experimental_fragment
+@timed("view_360")
+def render_360_view():
+    with stage("filter"):
+        # Filters
+        st.markdown('<div class="filter-section">', unsafe_allow_html=True)
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            clients = aggregates.dimension_values('Client')
+            track_360 = st.selectbox("Track Name", ["Select a track"] + clients, key="track_360")
+        with col2:
+            regions = ["All"] + aggregates.dimension_values('Region')
+            region_360 = st.selectbox("Region", regions, key="region_360")
+        with col3:
+            time_periods = ["Last 7 Days", "Last 30 Days", "Last 90 Days", "Last 6 Months", "Last Year", "Custom Range"]
+            time_period_360 = st.selectbox("Time Period", time_periods, key="time_period_360")
+
+        # Custom date range
+        if time_period_360 == "Custom Range":
+            st.markdown('<div class="custom-date-range">', unsafe_allow_html=True)
+            col4, col5 = st.columns(2)
+            with col4:
+                start_date_360 = st.date_input("Start Date", value=datetime.now() - timedelta(days=30), max_value=date(2025, 4, 6), key="start_date_360")
+            with col5:
+                end_date_360 = st.date_input("End Date", value=date(2025, 4, 6), max_value=date(2025, 4, 6), key="end_date_360")
+            st.markdown('</div>', unsafe_allow_html=True)
+        else:
+            end_date_360 = date(2025, 4, 6)
+            if time_period_360 == "Last 7 Days":
+                start_date_360 = (datetime(2025, 4, 6) - timedelta(days=7)).date()
+            elif time_period_360 == "Last 30 Days":
+                start_date_360 = (datetime(2025, 4, 6) - timedelta(days=30)).date()
+            elif time_period_360 == "Last 90 Days":
+                start_date_360 = (datetime(2025, 4, 6) - timedelta(days=90)).date()
+            elif time_period_360 == "Last 6 Months":
+                start_date_360 = (datetime(2025, 4, 6) - pd.offsets.MonthBegin(6)).date()
+            elif time_period_360 == "Last Year":
+                start_date_360 = (datetime(2025, 4, 6) - pd.offsets.YearBegin(1)).date()
         st.markdown('</div>', unsafe_allow_html=True)
-    else:
-        end_date_360 = date(2025, 4, 6)
-        if time_period_360 == "Last 7 Days":
-            start_date_360 = (datetime(2025, 4, 6) - timedelta(days=7)).date()
-        elif time_period_360 == "Last 30 Days":
-            start_date_360 = (datetime(2025, 4, 6) - timedelta(days=30)).date()
-        elif time_period_360 == "Last 90 Days":
-            start_date_360 = (datetime(2025, 4, 6) - timedelta(days=90)).date()
-        elif time_period_360 == "Last 6 Months":
-            start_date_360 = (datetime(2025, 4, 6) - pd.offsets.MonthBegin(6)).date()
-        elif time_period_360 == "Last Year":
-            start_date_360 = (datetime(2025, 4, 6) - pd.offsets.YearBegin(1)).date()
-    st.markdown('</div>', unsafe_allow_html=True)
 
     # Error Message
     error_message_360 = st.empty()
@@ -511,29 +715,32 @@ with tab1:
         error_message_360.markdown('<div class="error">Please select a track to proceed.</div>', unsafe_allow_html=True)
     else:
         error_message_360.markdown('')
-        filtered_df = subscriptions_df[subscriptions_df['Client'] == track_360]
-        if region_360 != "All":
-            filtered_df = filtered_df[filtered_df['Region'] == region_360]
-        filtered_df = filtered_df[(filtered_df['Date'] >= pd.to_datetime(start_date_360)) & (filtered_df['Date'] <= pd.to_datetime(end_date_360))]
+        selection_360 = dict(
+            client=track_360,
+            region=None if region_360 == "All" else region_360,
+            start=pd.to_datetime(start_date_360),
+            end=pd.to_datetime(end_date_360)
+        )
 
         # KPI Cards
-        total_subscribers = filtered_df['Subscribers'].sum()
+        totals = aggregates.totals(**selection_360)
+        total_subscribers = totals['Subscribers']
         kpi_metrics = {
-            "Revenue": f"${round(filtered_df['Revenue'].sum() / 1000000, 1)}M",
+            "Revenue": f"${round(totals['Revenue'] / 1000000, 1)}M",
             "Subscribers": f"{round(total_subscribers / 1000)}K",
-            "Registrations": f"{round(filtered_df['Registrations'].sum() / 1000)}K",
-            "Conversions": f"{round(filtered_df['Conversions'].sum() / 1000)}K (Paid)",
-            "Free Trials": f"{round(filtered_df['FreeTrials'].sum() / 1000)}K",
-            "New Orders": f"{round(filtered_df['NewOrders'].sum() / 1000)}K",
-            "Active Paid": f"{round(filtered_df['ActivePaid'].sum() / 1000)}K",
-            "Coupon Redemptions": f"{round(filtered_df['Redemptions'].sum() / 1000)}K",
-            "Renewals": f"{round(filtered_df['Renewals'].sum() / 1000)}K",
-            "Payment Amount": f"${round(filtered_df['PaymentAmount'].sum() / 1000000, 1)}M",
-            "Refund Amount": f"${round(filtered_df['RefundAmount'].sum() / 1000, 1)}K",
-            "Involuntary Churn": f"{round(filtered_df['InvoluntaryChurn'].sum() / 1000)}K",
-            "Voluntary Churn": f"{round(filtered_df['VoluntaryChurn'].sum() / 1000)}K",
-            "Winbacks": f"{round(filtered_df['Winbacks'].sum() / 1000)}K",
-            "ARPU": f"${round(filtered_df['Revenue'].sum() / total_subscribers, 2) if total_subscribers else 0}"
+            "Registrations": f"{round(totals['Registrations'] / 1000)}K",
+            "Conversions": f"{round(totals['Conversions'] / 1000)}K (Paid)",
+            "Free Trials": f"{round(totals['FreeTrials'] / 1000)}K",
+            "New Orders": f"{round(totals['NewOrders'] / 1000)}K",
+            "Active Paid": f"{round(totals['ActivePaid'] / 1000)}K",
+            "Coupon Redemptions": f"{round(totals['Redemptions'] / 1000)}K",
+            "Renewals": f"{round(totals['Renewals'] / 1000)}K",
+            "Payment Amount": f"${round(totals['PaymentAmount'] / 1000000, 1)}M",
+            "Refund Amount": f"${round(totals['RefundAmount'] / 1000, 1)}K",
+            "Involuntary Churn": f"{round(totals['InvoluntaryChurn'] / 1000)}K",
+            "Voluntary Churn": f"{round(totals['VoluntaryChurn'] / 1000)}K",
+            "Winbacks": f"{round(totals['Winbacks'] / 1000)}K",
+            "ARPU": f"${round(totals['Revenue'] / total_subscribers, 2) if total_subscribers else 0}"
         }
         kpi_cols = st.columns(5)
         for i, (metric, value) in enumerate(kpi_metrics.items()):
@@ -542,343 +749,390 @@ with tab1:
 
         # Visualizations
         time_period_text = time_period_360.replace("Last ", "").replace(" Days", "D").replace(" Months", "M").replace(" Year", "Y")
+        figure_key_360 = (track_360, region_360, time_period_360, start_date_360, end_date_360)
+        # Time series are bucketed by day, week or month depending on the range length
+        grain_360 = time_grain(start_date_360, end_date_360)
+        grain_label_360 = {"D": "Date", "W": "Week", "M": "Month"}[grain_360]
         col6, col7 = st.columns(2)
 
         # Subscribers by Region (Choropleth)
-        region_subs = filtered_df.groupby('Region')['Subscribers'].sum().reset_index()
-        region_to_iso = {
-            "North America": "USA",
-            "South America": "BRA",
-            "Europe": "DEU",
-            "Africa": "ZAF",
-            "Asia": "CHN",
-            "Australia": "AUS"
-        }
-        fig1 = go.Figure(data=go.Choropleth(
-            locations=region_subs['Region'].map(region_to_iso),
-            z=region_subs['Subscribers'],
-            text=region_subs['Region'],
-            colorscale=[[0, '#A3BFFA'], [1, '#C4B5FD']],
-            colorbar_title="Subscribers",
-            colorbar_tickformat='s'
-        ))
-        fig1.update_layout(
-            title=f"Subscribers by Region ({time_period_text})",
-            title_font=dict(size=18, color='#1f2937', family='Inter'),
-            geo=dict(showframe=False, showcoastlines=True, projection_type='equirectangular'),
-            margin=dict(t=80, b=50, l=50, r=50),
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)',
-            height=450
-        )
+        def build_fig1():
+            region_subs = aggregates.by_dimension('Region', ['Subscribers'], **selection_360)
+            region_to_iso = {
+                "North America": "USA",
+                "South America": "BRA",
+                "Europe": "DEU",
+                "Africa": "ZAF",
+                "Asia": "CHN",
+                "Australia": "AUS"
+            }
+            fig1 = go.Figure(data=go.Choropleth(
+                locations=region_subs['Region'].map(region_to_iso),
+                z=region_subs['Subscribers'],
+                text=region_subs['Region'],
+                colorscale=[[0, '#A3BFFA'], [1, '#C4B5FD']],
+                colorbar_title="Subscribers",
+                colorbar_tickformat='s'
+            ))
+            fig1.update_layout(
+                title=f"Subscribers by Region ({time_period_text})",
+                title_font=dict(size=18, color='#1f2937', family='Inter'),
+                geo=dict(showframe=False, showcoastlines=True, projection_type='equirectangular'),
+                margin=dict(t=80, b=50, l=50, r=50),
+                plot_bgcolor='rgba(0,0,0,0)',
+                paper_bgcolor='rgba(0,0,0,0)',
+                height=450
+            )
+            return fig1
+        fig1 = cached_figure("fig1", figure_key_360, build_fig1)
         with col6:
             st.markdown('<div class="chart-container">', unsafe_allow_html=True)
-            st.plotly_chart(fig1, use_container_width=True)
+            render_chart(fig1)
             st.markdown('</div>', unsafe_allow_html=True)
 
         # Revenue by Region (Funnel)
-        region_revenue = filtered_df.groupby('Region')['Revenue'].sum().reset_index().sort_values('Revenue', ascending=False)
-        fig2 = go.Figure(go.Funnel(
-            y=region_revenue['Region'],
-            x=region_revenue['Revenue'],
-            text=[f"${(rev / 1000000):.2f}M" for rev in region_revenue['Revenue']],
-            textinfo='text',
-            marker=dict(color=['#A3BFFA', '#B5F5EC', '#C4B5FD', '#FED7AA', '#FBB6CE', '#D1D5DB'])
-        ))
-        fig2.update_layout(
-            title=f"Revenue by Region ({time_period_text})",
-            title_font=dict(size=18, color='#1f2937', family='Inter'),
-            margin=dict(t=80, b=50, l=100, r=50),
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)',
-            xaxis=dict(tickformat='s', showgrid=False, showticklabels=False),
-            yaxis=dict(showgrid=False),
-            height=450
-        )
+        def build_fig2():
+            region_revenue = aggregates.by_dimension('Region', ['Revenue'], **selection_360).sort_values('Revenue', ascending=False)
+            fig2 = go.Figure(go.Funnel(
+                y=region_revenue['Region'],
+                x=region_revenue['Revenue'],
+                text=[f"${(rev / 1000000):.2f}M" for rev in region_revenue['Revenue']],
+                textinfo='text',
+                marker=dict(color=['#A3BFFA', '#B5F5EC', '#C4B5FD', '#FED7AA', '#FBB6CE', '#D1D5DB'])
+            ))
+            fig2.update_layout(
+                title=f"Revenue by Region ({time_period_text})",
+                title_font=dict(size=18, color='#1f2937', family='Inter'),
+                margin=dict(t=80, b=50, l=100, r=50),
+                plot_bgcolor='rgba(0,0,0,0)',
+                paper_bgcolor='rgba(0,0,0,0)',
+                xaxis=dict(tickformat='s', showgrid=False, showticklabels=False),
+                yaxis=dict(showgrid=False),
+                height=450
+            )
+            return fig2
+        fig2 = cached_figure("fig2", figure_key_360, build_fig2)
         with col7:
             st.markdown('<div class="chart-container">', unsafe_allow_html=True)
-            st.plotly_chart(fig2, use_container_width=True)
+            render_chart(fig2)
             st.markdown('</div>', unsafe_allow_html=True)
 
         # Subscribers by SKU (Bar)
-        sku_subs = filtered_df.groupby('SKU')['Subscribers'].sum().reset_index()
-        fig3 = px.bar(sku_subs, x='SKU', y='Subscribers',
-                      color_discrete_sequence=['#B5F5EC', '#A3BFFA', '#FED7AA', '#C4B5FD', '#FBB6CE'])
-        fig3.update_layout(
-            title=f"Subscribers by SKU ({time_period_text})",
-            title_font=dict(size=18, color='#1f2937', family='Inter'),
-            margin=dict(t=80, b=80, l=60, r=50),
-            xaxis=dict(tickfont=dict(size=10, color='#718096'), tickangle=-45, automargin=True, showgrid=False),
-            yaxis=dict(
-                title='Subscribers',
-                titlefont=dict(size=14, color='#1f2937'),
-                tickfont=dict(size=8, color='#718096'),
-                showticklabels=False,
-                ticks='',
-                automargin=True,
-                showgrid=False
-            ),
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)',
-            height=450
-        )
+        def build_fig3():
+            sku_subs = aggregates.by_dimension('SKU', ['Subscribers'], **selection_360)
+            fig3 = px.bar(sku_subs, x='SKU', y='Subscribers',
+                          color_discrete_sequence=['#B5F5EC', '#A3BFFA', '#FED7AA', '#C4B5FD', '#FBB6CE'])
+            fig3.update_layout(
+                title=f"Subscribers by SKU ({time_period_text})",
+                title_font=dict(size=18, color='#1f2937', family='Inter'),
+                margin=dict(t=80, b=80, l=60, r=50),
+                xaxis=dict(tickfont=dict(size=10, color='#718096'), tickangle=-45, automargin=True, showgrid=False),
+                yaxis=dict(
+                    title='Subscribers',
+                    titlefont=dict(size=14, color='#1f2937'),
+                    tickfont=dict(size=8, color='#718096'),
+                    showticklabels=False,
+                    ticks='',
+                    automargin=True,
+                    showgrid=False
+                ),
+                plot_bgcolor='rgba(0,0,0,0)',
+                paper_bgcolor='rgba(0,0,0,0)',
+                height=450
+            )
+            return fig3
+        fig3 = cached_figure("fig3", figure_key_360, build_fig3)
         with col6:
             st.markdown('<div class="chart-container">', unsafe_allow_html=True)
-            st.plotly_chart(fig3, use_container_width=True)
+            render_chart(fig3)
             st.markdown('</div>', unsafe_allow_html=True)
 
         # Revenue by SKU (Pie)
-        sku_revenue = filtered_df.groupby('SKU')['Revenue'].sum().reset_index()
-        fig4 = px.pie(sku_revenue, names='SKU', values='Revenue',
-                      color_discrete_sequence=['#A3BFFA', '#B5F5EC', '#FED7AA', '#C4B5FD', '#FBB6CE'])
-        fig4.update_layout(
-            title=f"Revenue by SKU ({time_period_text})",
-            title_font=dict(size=18, color='#1f2937', family='Inter'),
-            margin=dict(t=80, b=50, l=50, r=50),
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)',
-            height=450
-        )
+        def build_fig4():
+            sku_revenue = aggregates.by_dimension('SKU', ['Revenue'], **selection_360)
+            fig4 = px.pie(sku_revenue, names='SKU', values='Revenue',
+                          color_discrete_sequence=['#A3BFFA', '#B5F5EC', '#FED7AA', '#C4B5FD', '#FBB6CE'])
+            fig4.update_layout(
+                title=f"Revenue by SKU ({time_period_text})",
+                title_font=dict(size=18, color='#1f2937', family='Inter'),
+                margin=dict(t=80, b=50, l=50, r=50),
+                plot_bgcolor='rgba(0,0,0,0)',
+                paper_bgcolor='rgba(0,0,0,0)',
+                height=450
+            )
+            return fig4
+        fig4 = cached_figure("fig4", figure_key_360, build_fig4)
         with col7:
             st.markdown('<div class="chart-container">', unsafe_allow_html=True)
-            st.plotly_chart(fig4, use_container_width=True)
+            render_chart(fig4)
             st.markdown('</div>', unsafe_allow_html=True)
 
         # Churn Triggers (Bar)
-        churn_filtered = churn_triggers_df[churn_triggers_df['Client'] == track_360]
-        fig5 = px.bar(churn_filtered, x='ChurnRate', y='Trigger', orientation='h',
-                      color_discrete_sequence=['#FBB6CE', '#A3BFFA', '#B5F5EC', '#FED7AA', '#C4B5FD'])
-        fig5.update_layout(
-            title=f"Churn Triggers ({time_period_text})",
-            title_font=dict(size=18, color='#1f2937', family='Inter'),
-            margin=dict(t=80, b=50, l=220, r=50),
-            xaxis=dict(
-                title='Churn Rate (%)',
-                titlefont=dict(size=14, color='#1f2937'),
-                tickfont=dict(size=8, color='#718096'),
-                tickformat='.1f',
-                dtick=5,
-                automargin=True,
-                showgrid=False,
-                showticklabels=False,
-                ticks=''
-            ),
-            yaxis=dict(tickfont=dict(size=8, color='#718096'), automargin=True, showgrid=False),
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)',
-            height=450
-        )
+        def build_fig5():
+            churn_filtered = churn_triggers_df[churn_triggers_df['Client'] == track_360]
+            fig5 = px.bar(churn_filtered, x='ChurnRate', y='Trigger', orientation='h',
+                          color_discrete_sequence=['#FBB6CE', '#A3BFFA', '#B5F5EC', '#FED7AA', '#C4B5FD'])
+            fig5.update_layout(
+                title=f"Churn Triggers ({time_period_text})",
+                title_font=dict(size=18, color='#1f2937', family='Inter'),
+                margin=dict(t=80, b=50, l=220, r=50),
+                xaxis=dict(
+                    title='Churn Rate (%)',
+                    titlefont=dict(size=14, color='#1f2937'),
+                    tickfont=dict(size=8, color='#718096'),
+                    tickformat='.1f',
+                    dtick=5,
+                    automargin=True,
+                    showgrid=False,
+                    showticklabels=False,
+                    ticks=''
+                ),
+                yaxis=dict(tickfont=dict(size=8, color='#718096'), automargin=True, showgrid=False),
+                plot_bgcolor='rgba(0,0,0,0)',
+                paper_bgcolor='rgba(0,0,0,0)',
+                height=450
+            )
+            return fig5
+        fig5 = cached_figure("fig5", figure_key_360, build_fig5)
         with col6:
             st.markdown('<div class="chart-container">', unsafe_allow_html=True)
-            st.plotly_chart(fig5, use_container_width=True)
+            render_chart(fig5)
             st.markdown('</div>', unsafe_allow_html=True)
 
         # Subscribers by Status (Bar)
-        status_subs = filtered_df.groupby('Status')['Subscribers'].sum().reset_index()
-        fig6 = px.bar(status_subs, x='Subscribers', y='Status', orientation='h',
-                      color_discrete_sequence=['#B5F5EC', '#A3BFFA', '#FED7AA', '#C4B5FD'])
-        fig6.update_layout(
-            title=f"Subscribers by Status ({time_period_text})",
-            title_font=dict(size=18, color='#1f2937', family='Inter'),
-            margin=dict(t=80, b=50, l=120, r=50),
-            xaxis=dict(
-                title='Subscribers',
-                titlefont=dict(size=14, color='#1f2937'),
-                tickfont=dict(size=8, color='#718096'),
-                showticklabels=False,
-                ticks='',
-                automargin=True,
-                showgrid=False
-            ),
-            yaxis=dict(tickfont=dict(size=8, color='#718096'), automargin=True, showgrid=False),
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)',
-            height=450
-        )
+        def build_fig6():
+            status_subs = aggregates.by_dimension('Status', ['Subscribers'], **selection_360)
+            fig6 = px.bar(status_subs, x='Subscribers', y='Status', orientation='h',
+                          color_discrete_sequence=['#B5F5EC', '#A3BFFA', '#FED7AA', '#C4B5FD'])
+            fig6.update_layout(
+                title=f"Subscribers by Status ({time_period_text})",
+                title_font=dict(size=18, color='#1f2937', family='Inter'),
+                margin=dict(t=80, b=50, l=120, r=50),
+                xaxis=dict(
+                    title='Subscribers',
+                    titlefont=dict(size=14, color='#1f2937'),
+                    tickfont=dict(size=8, color='#718096'),
+                    showticklabels=False,
+                    ticks='',
+                    automargin=True,
+                    showgrid=False
+                ),
+                yaxis=dict(tickfont=dict(size=8, color='#718096'), automargin=True, showgrid=False),
+                plot_bgcolor='rgba(0,0,0,0)',
+                paper_bgcolor='rgba(0,0,0,0)',
+                height=450
+            )
+            return fig6
+        fig6 = cached_figure("fig6", figure_key_360, build_fig6)
         with col7:
             st.markdown('<div class="chart-container">', unsafe_allow_html=True)
-            st.plotly_chart(fig6, use_container_width=True)
+            render_chart(fig6)
             st.markdown('</div>', unsafe_allow_html=True)
 
         # Revenue by Payment Method (Pie)
-        payment_revenue = filtered_df.groupby('PaymentMethod')['Revenue'].sum().reset_index()
-        fig7 = px.pie(payment_revenue, names='PaymentMethod', values='Revenue',
-                      color_discrete_sequence=['#A3BFFA', '#B5F5EC', '#FED7AA', '#C4B5FD', '#FBB6CE', '#D1D5DB'])
-        fig7.update_layout(
-            title=f"Revenue by Payment Method ({time_period_text})",
-            title_font=dict(size=18, color='#1f2937', family='Inter'),
-            margin=dict(t=80, b=50, l=50, r=50),
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)',
-            height=450
-        )
+        def build_fig7():
+            payment_revenue = aggregates.by_dimension('PaymentMethod', ['Revenue'], **selection_360)
+            fig7 = px.pie(payment_revenue, names='PaymentMethod', values='Revenue',
+                          color_discrete_sequence=['#A3BFFA', '#B5F5EC', '#FED7AA', '#C4B5FD', '#FBB6CE', '#D1D5DB'])
+            fig7.update_layout(
+                title=f"Revenue by Payment Method ({time_period_text})",
+                title_font=dict(size=18, color='#1f2937', family='Inter'),
+                margin=dict(t=80, b=50, l=50, r=50),
+                plot_bgcolor='rgba(0,0,0,0)',
+                paper_bgcolor='rgba(0,0,0,0)',
+                height=450
+            )
+            return fig7
+        fig7 = cached_figure("fig7", figure_key_360, build_fig7)
         with col6:
             st.markdown('<div class="chart-container">', unsafe_allow_html=True)
-            st.plotly_chart(fig7, use_container_width=True)
+            render_chart(fig7)
             st.markdown('</div>', unsafe_allow_html=True)
 
         # Top Promotions (Funnel)
-        promo_filtered = top_promotions_df[top_promotions_df['Client'] == track_360].sort_values('ProfitMargin', ascending=False)
-        fig8 = go.Figure(go.Funnel(
-            y=promo_filtered['Promotion'],
-            x=promo_filtered['ProfitMargin'],
-            textinfo='value+percent initial',
-            marker=dict(color=['#C4B5FD', '#A3BFFA', '#B5F5EC', '#FED7AA', '#FBB6CE'])
-        ))
-        fig8.update_layout(
-            title=f"Top Promotions by Profit Margin ({time_period_text})",
-            title_font=dict(size=18, color='#1f2937', family='Inter'),
-            margin=dict(t=80, b=50, l=100, r=50),
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)',
-            xaxis=dict(tickformat='.1f', showgrid=False, showticklabels=False),
-            yaxis=dict(showgrid=False),
-            height=450
-        )
+        def build_fig8():
+            promo_filtered = top_promotions_df[top_promotions_df['Client'] == track_360].sort_values('ProfitMargin', ascending=False)
+            fig8 = go.Figure(go.Funnel(
+                y=promo_filtered['Promotion'],
+                x=promo_filtered['ProfitMargin'],
+                textinfo='value+percent initial',
+                marker=dict(color=['#C4B5FD', '#A3BFFA', '#B5F5EC', '#FED7AA', '#FBB6CE'])
+            ))
+            fig8.update_layout(
+                title=f"Top Promotions by Profit Margin ({time_period_text})",
+                title_font=dict(size=18, color='#1f2937', family='Inter'),
+                margin=dict(t=80, b=50, l=100, r=50),
+                plot_bgcolor='rgba(0,0,0,0)',
+                paper_bgcolor='rgba(0,0,0,0)',
+                xaxis=dict(tickformat='.1f', showgrid=False, showticklabels=False),
+                yaxis=dict(showgrid=False),
+                height=450
+            )
+            return fig8
+        fig8 = cached_figure("fig8", figure_key_360, build_fig8)
         with col7:
             st.markdown('<div class="chart-container">', unsafe_allow_html=True)
-            st.plotly_chart(fig8, use_container_width=True)
+            render_chart(fig8)
             st.markdown('</div>', unsafe_allow_html=True)
 
         # Top Coupons (Bar)
-        coupon_filtered = top_coupons_df[top_coupons_df['Client'] == track_360].sort_values('Count', ascending=False)
-        fig9 = px.bar(coupon_filtered, x='Count', y='Coupon', orientation='h',
-                      color_discrete_sequence=['#FED7AA', '#FED7AA', '#FED7AA', '#FED7AA', '#FED7AA', '#FED7AA', '#FED7AA'])
-        fig9.update_layout(
-            title=f"Top Coupons by Count ({time_period_text})",
-            title_font=dict(size=18, color='#1f2937', family='Inter'),
-            margin=dict(t=80, b=50, l=120, r=50),
-            xaxis=dict(
-                title='Count',
-                titlefont=dict(size=14, color='#1f2937'),
-                tickfont=dict(size=8, color='#718096'),
-                showticklabels=False,
-                ticks='',
-                automargin=True,
-                showgrid=False
-            ),
-            yaxis=dict(tickfont=dict(size=8, color='#718096'), automargin=True, showgrid=False),
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)',
-            height=450
-        )
+        def build_fig9():
+            coupon_filtered = top_coupons_df[top_coupons_df['Client'] == track_360].sort_values('Count', ascending=False)
+            fig9 = px.bar(coupon_filtered, x='Count', y='Coupon', orientation='h',
+                          color_discrete_sequence=['#FED7AA', '#FED7AA', '#FED7AA', '#FED7AA', '#FED7AA', '#FED7AA', '#FED7AA'])
+            fig9.update_layout(
+                title=f"Top Coupons by Count ({time_period_text})",
+                title_font=dict(size=18, color='#1f2937', family='Inter'),
+                margin=dict(t=80, b=50, l=120, r=50),
+                xaxis=dict(
+                    title='Count',
+                    titlefont=dict(size=14, color='#1f2937'),
+                    tickfont=dict(size=8, color='#718096'),
+                    showticklabels=False,
+                    ticks='',
+                    automargin=True,
+                    showgrid=False
+                ),
+                yaxis=dict(tickfont=dict(size=8, color='#718096'), automargin=True, showgrid=False),
+                plot_bgcolor='rgba(0,0,0,0)',
+                paper_bgcolor='rgba(0,0,0,0)',
+                height=450
+            )
+            return fig9
+        fig9 = cached_figure("fig9", figure_key_360, build_fig9)
         with col6:
             st.markdown('<div class="chart-container">', unsafe_allow_html=True)
-            st.plotly_chart(fig9, use_container_width=True)
+            render_chart(fig9)
             st.markdown('</div>', unsafe_allow_html=True)
 
         # Churned Customers Over Time (Line)
-        churn_data = filtered_df.groupby('Date')[['InvoluntaryChurn', 'VoluntaryChurn']].sum().reset_index()
-        churn_data['TotalChurn'] = churn_data['InvoluntaryChurn'] + churn_data['VoluntaryChurn']
-        fig10 = px.line(churn_data, x='Date', y='TotalChurn',
-                        line_shape='linear', color_discrete_sequence=['#6366F1'])
-        fig10.update_traces(
-            mode='lines+markers',
-            marker=dict(size=6, color='#FBB6CE', line=dict(width=1, color='#ffffff')),
-            line=dict(width=2)
-        )
-        fig10.update_layout(
-            title=f"Churned Customers Over Time ({time_period_text})",
-            title_font=dict(size=18, color='#1f2937', family='Inter'),
-            margin=dict(t=80, b=80, l=60, r=50),
-            xaxis=dict(
-                title='Date',
-                titlefont=dict(size=14, color='#1f2937'),
-                tickfont=dict(size=8, color='#718096'),
-                tickangle=-45,
-                automargin=True,
-                showgrid=False
-            ),
-            yaxis=dict(
-                title='Churned Customers',
-                titlefont=dict(size=14, color='#1f2937'),
-                tickfont=dict(size=8, color='#718096'),
-                tickformat='s',
-                dtick=500,
-                automargin=True,
-                showgrid=False
-            ),
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)',
-            height=450
-        )
+        def build_fig10():
+            churn_data = aggregates.over_time(['InvoluntaryChurn', 'VoluntaryChurn'], grain=grain_360, **selection_360)
+            churn_data = churn_data.assign(TotalChurn=churn_data['InvoluntaryChurn'] + churn_data['VoluntaryChurn'])
+            churn_data = downsample_frame(churn_data, 'Date', 'TotalChurn', CHART_MAX_POINTS)
+            fig10 = px.line(churn_data, x='Date', y='TotalChurn',
+                            line_shape='linear', color_discrete_sequence=['#6366F1'])
+            fig10.update_traces(
+                mode='lines+markers',
+                marker=dict(size=6, color='#FBB6CE', line=dict(width=1, color='#ffffff')),
+                line=dict(width=2)
+            )
+            fig10.update_layout(
+                title=f"Churned Customers Over Time ({time_period_text})",
+                title_font=dict(size=18, color='#1f2937', family='Inter'),
+                margin=dict(t=80, b=80, l=60, r=50),
+                xaxis=dict(
+                    title=grain_label_360,
+                    titlefont=dict(size=14, color='#1f2937'),
+                    tickfont=dict(size=8, color='#718096'),
+                    tickangle=-45,
+                    automargin=True,
+                    showgrid=False
+                ),
+                yaxis=dict(
+                    title='Churned Customers',
+                    titlefont=dict(size=14, color='#1f2937'),
+                    tickfont=dict(size=8, color='#718096'),
+                    tickformat='s',
+                    dtick=500 if grain_360 == "D" else None,
+                    automargin=True,
+                    showgrid=False
+                ),
+                plot_bgcolor='rgba(0,0,0,0)',
+                paper_bgcolor='rgba(0,0,0,0)',
+                height=450
+            )
+            return fig10
+        fig10 = cached_figure("fig10", figure_key_360, build_fig10)
         st.markdown('<div class="chart-container">', unsafe_allow_html=True)
-        st.plotly_chart(fig10, use_container_width=True)
+        render_chart(fig10)
         st.markdown('</div>', unsafe_allow_html=True)
 
         # Active Customers Over Time (Line)
-        active_data = filtered_df.groupby('Date')['ActivePaid'].sum().reset_index()
-        fig11 = px.line(active_data, x='Date', y='ActivePaid',
-                        line_shape='linear', color_discrete_sequence=['#3B82F6'])
-        fig11.update_traces(
-            mode='lines+markers',
-            marker=dict(size=6, color='#A3BFFA', line=dict(width=1, color='#ffffff')),
-            line=dict(width=2)
-        )
-        fig11.update_layout(
-            title=f"Active Customers Over Time ({time_period_text})",
-            title_font=dict(size=18, color='#1f2937', family='Inter'),
-            margin=dict(t=80, b=80, l=60, r=50),
-            xaxis=dict(
-                title='Date',
-                titlefont=dict(size=14, color='#1f2937'),
-                tickfont=dict(size=8, color='#718096'),
-                tickangle=-45,
-                automargin=True,
-                showgrid=False
-            ),
-            yaxis=dict(
-                title='Active Customers',
-                titlefont=dict(size=14, color='#1f2937'),
-                tickfont=dict(size=8, color='#718096'),
-                tickformat='s',
-                dtick=1000,
-                automargin=True,
-                showgrid=False
-            ),
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)',
-            height=450
-        )
+        def build_fig11():
+            active_data = aggregates.over_time(['ActivePaid'], grain=grain_360, **selection_360)
+            active_data = downsample_frame(active_data, 'Date', 'ActivePaid', CHART_MAX_POINTS)
+            fig11 = px.line(active_data, x='Date', y='ActivePaid',
+                            line_shape='linear', color_discrete_sequence=['#3B82F6'])
+            fig11.update_traces(
+                mode='lines+markers',
+                marker=dict(size=6, color='#A3BFFA', line=dict(width=1, color='#ffffff')),
+                line=dict(width=2)
+            )
+            fig11.update_layout(
+                title=f"Active Customers Over Time ({time_period_text})",
+                title_font=dict(size=18, color='#1f2937', family='Inter'),
+                margin=dict(t=80, b=80, l=60, r=50),
+                xaxis=dict(
+                    title=grain_label_360,
+                    titlefont=dict(size=14, color='#1f2937'),
+                    tickfont=dict(size=8, color='#718096'),
+                    tickangle=-45,
+                    automargin=True,
+                    showgrid=False
+                ),
+                yaxis=dict(
+                    title='Active Customers',
+                    titlefont=dict(size=14, color='#1f2937'),
+                    tickfont=dict(size=8, color='#718096'),
+                    tickformat='s',
+                    dtick=1000 if grain_360 == "D" else None,
+                    automargin=True,
+                    showgrid=False
+                ),
+                plot_bgcolor='rgba(0,0,0,0)',
+                paper_bgcolor='rgba(0,0,0,0)',
+                height=450
+            )
+            return fig11
+        fig11 = cached_figure("fig11", figure_key_360, build_fig11)
         st.markdown('<div class="chart-container">', unsafe_allow_html=True)
-        st.plotly_chart(fig11, use_container_width=True)
+        render_chart(fig11)
         st.markdown('</div>', unsafe_allow_html=True)
 
-# Trends Comparison Tab (Multiple Tracks)
-with tab2:
-    # Filters
-    st.markdown('<div class="filter-section">', unsafe_allow_html=True)
-    col1, col2, col3, col4 = st.columns(4)
-    with col1:
-        st.markdown('<label class="block text-sm font-medium text-gray-700 mb-1">Track Name(s)</label>', unsafe_allow_html=True)
-        st.markdown('<div class="checkbox-container">', unsafe_allow_html=True)
-        selected_tracks = st.multiselect("", clients, key="tracks_trends", label_visibility="collapsed")
-        st.markdown('</div>', unsafe_allow_html=True)
-    with col2:
-        st.markdown('<label class="block text-sm font-medium text-gray-700 mb-1">Metric(s)</label>', unsafe_allow_html=True)
-        st.markdown('<div class="checkbox-container">', unsafe_allow_html=True)
-        metrics = [
-            "Subscribers", "Revenue", "TotalChurn", "FreeTrials", "NewOrders", "Conversions",
-            "Redemptions", "Registrations", "ActivePaid", "Renewals", "PaymentAmount",
-            "RefundAmount", "InvoluntaryChurn", "VoluntaryChurn", "Winbacks"
-        ]
-        selected_metrics = st.multiselect("", metrics, key="metrics_trends", label_visibility="collapsed")
+with tab1:
+    render_360_view()
+
+# Trends Comparison Tab (Multiple Tracks). A fragment, like the 360 View tab
+@st.experimental_fragment
+@timed("view_trends")
+def render_trends():
+    with stage("filter"):
+        clients = aggregates.dimension_values('Client')
+
+        # Filters
+        st.markdown('<div class="filter-section">', unsafe_allow_html=True)
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.markdown('<label class="block text-sm font-medium text-gray-700 mb-1">Track Name(s)</label>', unsafe_allow_html=True)
+            st.markdown('<div class="checkbox-container">', unsafe_allow_html=True)
+            selected_tracks = st.multiselect("", clients, key="tracks_trends", label_visibility="collapsed")
+            st.markdown('</div>', unsafe_allow_html=True)
+        with col2:
+            st.markdown('<label class="block text-sm font-medium text-gray-700 mb-1">Metric(s)</label>', unsafe_allow_html=True)
+            st.markdown('<div class="checkbox-container">', unsafe_allow_html=True)
+            metrics = [
+                "Subscribers", "Revenue", "TotalChurn", "FreeTrials", "NewOrders", "Conversions",
+                "Redemptions", "Registrations", "ActivePaid", "Renewals", "PaymentAmount",
+                "RefundAmount", "InvoluntaryChurn", "VoluntaryChurn", "Winbacks"
+            ]
+            selected_metrics = st.multiselect("", metrics, key="metrics_trends", label_visibility="collapsed")
+            st.markdown('</div>', unsafe_allow_html=True)
+        with col3:
+            comparison_options = [
+                ("Yesterday vs. Today", "yesterday-today"),
+                ("Last Week vs. This Week", "lastweek-thisweek"),
+                ("Last Month vs. This Month", "lastmonth-thismonth"),
+                ("Last Quarter vs. This Quarter", "lastquarter-thisquarter"),
+                ("Last Half-Year vs. This Half-Year", "lasthalfyear-thishalfyear"),
+                ("Last Year vs. This Year", "lastyear-thisyear")
+            ]
+            comparison_type = st.selectbox("Duration Comparison", [opt[0] for opt in comparison_options], key="comparison_trends")
+            comparison_value = next(value for label, value in comparison_options if label == comparison_type)
+        with col4:
+            graph_types = ["Bar", "Line", "Scatter", "Area", "Pie", "Donut"]
+            graph_type = st.selectbox("Graph Type", graph_types, key="graph_type_trends")
         st.markdown('</div>', unsafe_allow_html=True)
-    with col3:
-        comparison_options = [
-            ("Yesterday vs. Today", "yesterday-today"),
-            ("Last Week vs. This Week", "lastweek-thisweek"),
-            ("Last Month vs. This Month", "lastmonth-thismonth"),
-            ("Last Quarter vs. This Quarter", "lastquarter-thisquarter"),
-            ("Last Half-Year vs. This Half-Year", "lasthalfyear-thishalfyear"),
-            ("Last Year vs. This Year", "lastyear-thisyear")
-        ]
-        comparison_type = st.selectbox("Duration Comparison", [opt[0] for opt in comparison_options], key="comparison_trends")
-        comparison_value = next(value for label, value in comparison_options if label == comparison_type)
-    with col4:
-        graph_types = ["Bar", "Line", "Scatter", "Area", "Pie", "Donut"]
-        graph_type = st.selectbox("Graph Type", graph_types, key="graph_type_trends")
-    st.markdown('</div>', unsafe_allow_html=True)
 
     # Error Message
     error_message_trends = st.empty()
@@ -890,277 +1144,92 @@ with tab2:
     else:
         error_message_trends.markdown('')
 
-        # Date ranges for Trends Comparison
-        def get_date_ranges(comparison_type):
-            today = datetime(2025, 4, 6)
-            period1_start, period1_end, period2_start, period2_end, period1_label, period2_label = today, today, today, today, '', ''
-            if comparison_type == "yesterday-today":
-                period2_end = today
-                period2_start = today
-                period1_end = today - timedelta(days=1)
-                period1_start = period1_end
-                period1_label = "Yesterday"
-                period2_label = "Today"
-            elif comparison_type == "lastweek-thisweek":
-                period2_end = today
-                period2_start = today - timedelta(days=today.weekday())
-                period1_end = period2_start - timedelta(days=1)
-                period1_start = period1_end - timedelta(days=6)
-                period1_label = "Last Week"
-                period2_label = "This Week"
-            elif comparison_type == "lastmonth-thismonth":
-                period2_end = today
-                period2_start = today.replace(day=1)
-                period1_end = period2_start - timedelta(days=1)
-                period1_start = period1_end.replace(day=1)
-                period1_label = "Last Month"
-                period2_label = "This Month"
-            elif comparison_type == "lastquarter-thisquarter":
-                period2_end = today
-                current_quarter = (today.month - 1) // 3 + 1
-                period2_start = datetime(today.year, (current_quarter - 1) * 3 + 1, 1)
-                period1_end = period2_start - timedelta(days=1)
-                period1_start = datetime(period1_end.year, ((period1_end.month - 1) // 3 - 1) * 3 + 4, 1)
-                period1_label = "Last Quarter"
-                period2_label = "This Quarter"
-            elif comparison_type == "lasthalfyear-thishalfyear":
-                period2_end = today
-                current_half_year = 1 if today.month < 7 else 2
-                period2_start = datetime(today.year, 1 if current_half_year == 1 else 7, 1)
-                period1_end = period2_start - timedelta(days=1)
-                period1_start = datetime(period1_end.year, 7 if period1_end.month < 7 else 1, 1)
-                period1_label = "Last Half-Year"
-                period2_label = "This Half-Year"
-            elif comparison_type == "lastyear-thisyear":
-                period2_end = today
-                period2_start = datetime(today.year, 1, 1)
-                period1_end = period2_start - timedelta(days=1)
-                period1_start = datetime(period1_end.year, 1, 1)
-                period1_label = "Last Year"
-                period2_label = "This Year"
-            return period1_start, period1_end, period2_start, period2_end, period1_label, period2_label
-
         period1_start, period1_end, period2_start, period2_end, period1_label, period2_label = get_date_ranges(comparison_value)
-        table_rows = []
-        colors = ['#A3BFFA', '#FBB6CE', '#B5F5EC', '#FED7AA', '#D1D5DB', '#C4B5FD']
-        line_colors = ['#6366F1', '#3B82F6']
-        marker_colors = ['#FBB6CE', '#A3BFFA']
+        # Every selected track x metric x period total in one batched lookup
+        comparison_df = compare_periods(
+            aggregates, selected_tracks, selected_metrics,
+            (period1_start, period1_end), (period2_start, period2_end)
+        )
 
         # Create one chart per metric
         col8, col9 = st.columns(2)
-        for metric_idx, metric in enumerate(selected_metrics):
+        for metric_idx, (metric, metric_df) in enumerate(comparison_df.groupby('metric', sort=False)):
             all_values = []
-            bar_data = []
-            for track_idx, track in enumerate(selected_tracks):
-                filtered_data = subscriptions_df[subscriptions_df['Client'] == track]
-                period1_data = filtered_data[(filtered_data['Date'] >= pd.to_datetime(period1_start)) & (filtered_data['Date'] <= pd.to_datetime(period1_end))]
-                period2_data = filtered_data[(filtered_data['Date'] >= pd.to_datetime(period2_start)) & (filtered_data['Date'] <= pd.to_datetime(period2_end))]
-                period1_value = 0
-                period2_value = 0
-                if metric == "TotalChurn":
-                    period1_value = period1_data['InvoluntaryChurn'].sum() + period1_data['VoluntaryChurn'].sum()
-                    period2_value = period2_data['InvoluntaryChurn'].sum() + period2_data['VoluntaryChurn'].sum()
-                else:
-                    period1_value = period1_data[metric].sum()
-                    period2_value = period2_data[metric].sum()
-
+            for track_idx, (track, period1_value, period2_value) in enumerate(zip(metric_df['track'], metric_df['period1_value'], metric_df['period2_value'])):
                 all_values.extend([period1_value, period2_value])
 
-                value_change = period2_value - period1_value
-                percent_change = ((value_change / period1_value) * 100) if period1_value else 0
-
-                short_metric = metric.replace("TotalChurn", "Churn").replace("FreeTrials", "Trials").replace("NewOrders", "Orders").replace("Conversions", "Conv").replace("Redemptions", "Redemp").replace("Registrations", "Reg").replace("ActivePaid", "Active").replace("Renewals", "Renew").replace("PaymentAmount", "PayAmt").replace("RefundAmount", "RefAmt").replace("InvoluntaryChurn", "InvChurn").replace("VoluntaryChurn", "VolChurn").replace("Winbacks", "Winback")
-                short_period1 = period1_label.replace("Yesterday", "Yest").replace("Today", "Today").replace("Last Week", "LW").replace("This Week", "TW").replace("Last Month", "LM").replace("This Month", "TM").replace("Last Quarter", "LQ").replace("This Quarter", "TQ").replace("Last Half-Year", "LHY").replace("This Half-Year", "THY").replace("Last Year", "LY").replace("This Year", "TY")
-                short_period2 = period2_label.replace("Yesterday", "Yest").replace("Today", "Today").replace("Last Week", "LW").replace("This Week", "TW").replace("Last Month", "LM").replace("This Month", "TM").replace("Last Quarter", "LQ").replace("This Quarter", "TQ").replace("Last Half-Year", "LHY").replace("This Half-Year", "THY").replace("Last Year", "LY").replace("This Year", "TY")
-
-                if graph_type.lower() in ["pie", "donut"]:
-                    fig = go.Figure(data=go.Pie(
-                        labels=[f"{track} ({short_period1})", f"{track} ({short_period2})"],
-                        values=[period1_value, period2_value],
-                        marker=dict(colors=[colors[(metric_idx * len(selected_tracks) + track_idx) % len(colors)] for _ in range(2)]),
-                        hole=0.4 if graph_type.lower() == "donut" else 0,
-                        name=track
-                    ))
-                else:
-                    if graph_type.lower() == "line":
-                        fig = go.Figure()
-                        fig.add_trace(go.Scatter(
-                            x=[f"{track} ({short_period1})", f"{track} ({short_period2})"],
-                            y=[period1_value, period2_value],
-                            mode='lines+markers',
-                            name=track,
-                            line=dict(width=2, color=line_colors[track_idx % len(line_colors)]),
-                            marker=dict(size=6, color=marker_colors[track_idx % len(marker_colors)], line=dict(width=1, color='#ffffff'))
-                        ))
-                    elif graph_type.lower() == "scatter":
-                        fig = go.Figure()
-                        fig.add_trace(go.Scatter(
-                            x=[f"{track} ({short_period1})", f"{track} ({short_period2})"],
-                            y=[period1_value, period2_value],
-                            mode='markers',
-                            name=track,
-                            marker=dict(size=8, color=colors[(metric_idx * len(selected_tracks) + track_idx) % len(colors)])
-                        ))
-                    elif graph_type.lower() == "area":
-                        fig = go.Figure()
-                        fig.add_trace(go.Scatter(
-                            x=[f"{track} ({short_period1})", f"{track} ({short_period2})"],
-                            y=[period1_value, period2_value],
-                            mode='lines',
-                            fill='tozeroy',
-                            name=track,
-                            line=dict(width=2, color=colors[(metric_idx * len(selected_tracks) + track_idx) % len(colors)])
-                        ))
-                    else:  # Bar
-                        fig = go.Figure()
-                        fig.add_trace(go.Bar(
-                            x=[f"{track} ({short_period1})", f"{track} ({short_period2})"],
-                            y=[period1_value, period2_value],
-                            name=track,
-                            marker_color=colors[(metric_idx * len(selected_tracks) + track_idx) % len(colors)],
-                            width=0.1
-                        ))
-
-                min_value = min(all_values)
-                max_value = max(all_values)
-                padding = (max_value - min_value) * 0.1
-                y_axis_range = [max(0, min_value - padding), max_value + padding]
-                range_diff = max_value - min_value
-                y_axis_dtick = 10000 if range_diff > 50000 else (5000 if range_diff > 10000 else 1000)
-
-                # Compute the chart title outside the f-string to avoid backslash in f-string
-                transformed_metric = metric.replace('TotalChurn', 'Churn')
-                transformed_metric = re.sub(r'([A-Z])', r' \1', transformed_metric).strip()
-                chart_title = f"{transformed_metric} Comparison"
-
-                layout = {
-                    "title": chart_title,
-                    "titlefont": dict(size=18, color='#1f2937', family='Inter'),
-                    "margin": dict(t=80, b=80, l=60, r=50),
-                    "plot_bgcolor": 'rgba(0,0,0,0)',
-                    "paper_bgcolor": 'rgba(0,0,0,0)',
-                    "legend": dict(x=1, y=1, bgcolor='rgba(255,255,255,0.8)'),
-                    "height": 450
-                }
-                if graph_type.lower() == "bar":
-                    layout["barmode"] = "group"
-                    layout["xaxis"] = dict(tickfont=dict(size=10, color='#718096'), tickangle=-45, automargin=True, showgrid=False)
-                    layout["yaxis"] = dict(
-                        title='Value',
-                        titlefont=dict(size=14, color='#1f2937'),
-                        tickfont=dict(size=8, color='#718096'),
-                        showticklabels=False,
-                        ticks='',
-                        range=[0, y_axis_range[1]],
-                        automargin=True,
-                        showgrid=False
-                    )
-                elif graph_type.lower() == "line":
-                    layout["xaxis"] = dict(tickfont=dict(size=8, color='#718096'), tickangle=-45, automargin=True, showgrid=False)
-                    layout["yaxis"] = dict(
-                        title='Value',
-                        titlefont=dict(size=14, color='#1f2937'),
-                        tickfont=dict(size=8, color='#718096'),
-                        tickformat='s',
-                        dtick=y_axis_dtick,
-                        range=y_axis_range,
-                        automargin=True,
-                        showgrid=False
-                    )
-                elif graph_type.lower() == "scatter":
-                    layout["xaxis"] = dict(tickfont=dict(size=10, color='#718096'), tickangle=-45, automargin=True, showgrid=False)
-                    layout["yaxis"] = dict(
-                        title='Value',
-                        titlefont=dict(size=14, color='#1f2937'),
-                        tickfont=dict(size=8, color='#718096'),
-                        range=y_axis_range,
-                        automargin=True,
-                        showgrid=False
-                    )
-                elif graph_type.lower() == "area":
-                    layout["xaxis"] = dict(tickfont=dict(size=10, color='#718096'), tickangle=-45, automargin=True, showgrid=False)
-                    layout["yaxis"] = dict(
-                        title='Value',
-                        titlefont=dict(size=14, color='#1f2937'),
-                        tickfont=dict(size=8, color='#718096'),
-                        range=y_axis_range,
-                        automargin=True,
-                        showgrid=False
-                    )
-                elif graph_type.lower() in ["pie", "donut"]:
-                    layout["xaxis"] = dict(visible=False)
-                    layout["yaxis"] = dict(visible=False)
+                short_period1 = short_period_label(period1_label)
+                short_period2 = short_period_label(period2_label)
 
-                fig.update_layout(**layout)
+                def build_trend_figure():
+                    return trend_figure(
+                        metric, metric_idx, track, track_idx, len(selected_tracks), period1_value, period2_value,
+                        short_period1, short_period2, graph_type, all_values
+                    )
+                trend_figure_key = (metric, track, tuple(selected_tracks), tuple(selected_metrics), comparison_value, graph_type)
+                fig = cached_figure("trends", trend_figure_key, build_trend_figure)
 
                 with col8 if metric_idx % 2 == 0 else col9:
                     st.markdown('<div class="chart-container">', unsafe_allow_html=True)
-                    st.plotly_chart(fig, use_container_width=True)
+                    render_chart(fig)
                     st.markdown('</div>', unsafe_allow_html=True)
 
-                table_rows.append({
-                    "track": track,
-                    "metric": metric,
-                    "period1_value": period1_value,
-                    "period2_value": period2_value,
-                    "value_change": value_change,
-                    "percent_change": percent_change
-                })
-
-        # Summary Table
+        # Summary Table: sorted and paginated on the comparison frame, so only
+        # the visible page is formatted and sent; exports come from the frame
         st.markdown('<div class="chart-container"><h2 class="text-xl font-semibold text-gray-800 mb-4">Summary of Changes</h2>', unsafe_allow_html=True)
-        table_html = f"""
-        <table class="min-w-full divide-y divide-gray-200">
-            <thead class="bg-gray-50">
-                <tr>
-                    <th class="px-6 py-3 text-left text-xs font-medium text-gray-500 uppercase tracking-wider">Track</th>
-                    <th class="px-6 py-3 text-left text-xs font-medium text-gray-500 uppercase tracking-wider">Metric</th>
-                    <th class="px-6 py-3 text-left text-xs font-medium text-gray-500 uppercase tracking-wider">{period1_label}</th>
-                    <th class="px-6 py-3 text-left text-xs font-medium text-gray-500 uppercase tracking-wider">{period2_label}</th>
-                    <th class="px-6 py-3 text-left text-xs font-medium text-gray-500 uppercase tracking-wider">Change</th>
-                    <th class="px-6 py-3 text-left text-xs font-medium text-gray-500 uppercase tracking-wider">% Change</th>
-                </tr>
-            </thead>
-            <tbody class="bg-white divide-y divide-gray-200">
-        """
-        for row in table_rows:
-            # Format metric name for display in the table
-            display_metric = row['metric'].replace('TotalChurn', 'Churn')
-            display_metric = re.sub(r'([A-Z])', r' \1', display_metric).strip()
-            table_html += f"""
-            <tr>
-                <td class="px-6 py-4 whitespace-nowrap text-sm text-gray-900">{row['track']}</td>
-                <td class="px-6 py-4 whitespace-nowrap text-sm text-gray-900">{display_metric}</td>
-                <td class="px-6 py-4 whitespace-nowrap text-sm text-gray-900">{row['period1_value']:,}</td>
-                <td class="px-6 py-4 whitespace-nowrap text-sm text-gray-900">{row['period2_value']:,}</td>
-                <td class="px-6 py-4 whitespace-nowrap text-sm {'change-indicator-up' if row['value_change'] >= 0 else 'change-indicator-down'}">
-                    {'+' if row['value_change'] >= 0 else ''}{row['value_change']:,}
-                </td>
-                <td class="px-6 py-4 whitespace-nowrap text-sm {'change-indicator-up' if row['percent_change'] >= 0 else 'change-indicator-down'}">
-                    {'+' if row['percent_change'] >= 0 else ''}{row['percent_change']:.2f}%
-                </td>
-            </tr>
-            """
-        table_html += """
-            </tbody>
-        </table>
-        """
-        st.markdown(table_html, unsafe_allow_html=True)
+        sort_labels = list(SORT_COLUMNS)
+        col10, col11, col12, col13 = st.columns(4)
+        with col10:
+            sort_label = st.selectbox("Sort By", sort_labels, key="summary_sort_trends",
+                                      format_func=lambda label: {"Period 1": period1_label, "Period 2": period2_label}.get(label, label))
+        with col11:
+            descending = st.checkbox("Descending", key="summary_descending_trends")
+        with col12:
+            page_size = st.selectbox("Rows per Page", PAGE_SIZES, key="summary_page_size_trends")
+        with col13:
+            # Keyed by the page count, so a smaller selection starts again on page 1
+            pages = page_count(len(comparison_df), page_size)
+            page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1, step=1, key=f"summary_page_trends_{pages}")
+        summary_key = (tuple(selected_tracks), tuple(selected_metrics), comparison_value, sort_label, descending)
+        summary_df = result_cache.get_or_compute(
+            active_key, snapshot.version, ("summary", summary_key),
+            lambda: sort_summary(comparison_df, sort_label, descending)
+        )
+        st.markdown(summary_table_html(summary_page(summary_df, page, page_size), period1_label, period2_label), unsafe_allow_html=True)
+
+        def export_bytes(file_format, to_bytes):
+            return result_cache.get_or_compute(
+                active_key, snapshot.version, ("summary_export", file_format, summary_key),
+                lambda: to_bytes(export_frame(summary_df, period1_label, period2_label))
+            )
+        col14, col15 = st.columns(2)
+        with col14:
+            st.download_button("Download CSV", export_bytes("csv", to_csv_bytes), file_name="summary_of_changes.csv", mime="text/csv", key="summary_csv_trends")
+        with col15:
+            if PARQUET_EXPORT:
+                st.download_button("Download Parquet", export_bytes("parquet", to_parquet_bytes), file_name="summary_of_changes.parquet",
+                                   mime="application/octet-stream", key="summary_parquet_trends")
         st.markdown('</div>', unsafe_allow_html=True)
 
+with tab2:
+    render_trends()
+
+# Diagnostics
+if show_diagnostics:
+    with st.expander("Diagnostics", expanded=True):
+        st.markdown(f"Data version {snapshot.version} from {active_key[0]}, built {time.time() - snapshot.built_at:.0f}s ago")
+        table_classes = "min-w-full divide-y divide-gray-200 text-sm"
+        st.markdown(stage_metrics.summary().to_html(index=False, float_format="{:,.1f}".format, classes=table_classes), unsafe_allow_html=True)
+        gauges = pd.DataFrame(list(metrics_gauges(result_cache, snapshot_store, get_aggregation_backend()).items()), columns=["gauge", "value"])
+        st.markdown(gauges.to_html(index=False, classes=table_classes), unsafe_allow_html=True)
+
 # Footer
 st.markdown('<div class="footer">Last Updated: April 06, 2025 | Powered by: Plotly.js</div>', unsafe_allow_html=True)
 
-# Clean up connections on app shutdown (simulated via session state cleanup)
-def cleanup():
-    if 'connection_objects' in st.session_state:
-        for conn_type, conn in st.session_state.connection_objects.items():
-            try:
-                if conn_type in ["Microsoft SQL Server"] and conn:
-                    conn.dispose()
-            except:
-                pass
-        st.session_state.connection_objects = {}
-
 if st.session_state.get('shutdown', False):
     cleanup()
+    for snapshot_key in st.session_state.snapshot_keys:
+        get_snapshot_store().release(snapshot_key, st.session_state.session_id)
+    st.session_state.snapshot_keys = set()
+
+record_stage("rerun", time.perf_counter() - rerun_started)
@@ -0,0 +1,279 @@
+# Headless benchmarks of the dashboard's data and aggregation hot paths.
+#
+# Each stage (dummy generation, SQL ingestion from a local SQLite file, rollup
+# cube build, the 360 View filter/KPI/chart-data path, the Trends comparison, its
+# figures and its summary table) runs at the requested scales without Streamlit, and reports wall
+# time and peak memory. Results can be saved as a JSON baseline; a run given
+# --baseline exits with status 1 when a stage got slower or bigger than the
+# baseline by more than --tolerance.
+#
+#   python benchmark.py --rows 1M,10M --tracks 1,8,34 --metrics 1,15 --save baseline.json
+#   python benchmark.py --rows 1M,10M --tracks 1,8,34 --metrics 1,15 --baseline baseline.json
+#   python benchmark.py --rows 1M,10M --tracks 1,8,34 --metrics 1,15 --backend polars --compare-workers 4 --baseline baseline.json
+
+import argparse
+import gc
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine
+
+from aggregations import RollupAccumulator, build_rollup_cube, compare_periods, make_aggregation_backend, set_aggregation_backend, set_comparison_pool, time_grain
+from charts import get_date_ranges, short_period_label, trend_figure
+from downsampling import downsample_frame
+from dummy_data import CLIENTS, END_DATE, REGIONS, SKUS, STATUSES, generate_subscriptions
+from parallel_compare import MIN_CELLS, ComparisonPool
+from schema import SQL_COLUMN_MAP, normalize_subscriptions
+from sql_source import read_subscriptions
+from summary_table import export_frame, sort_summary, summary_page, summary_table_html, to_csv_bytes
+
+# Rows per generated day (Region x SKU x Client x Status)
+ROWS_PER_DAY = len(REGIONS) * len(SKUS) * len(CLIENTS) * len(STATUSES)
+
+# Trends metrics, in the order the app offers them
+TREND_METRICS = [
+    "Subscribers", "Revenue", "TotalChurn", "FreeTrials", "NewOrders", "Conversions",
+    "Redemptions", "Registrations", "ActivePaid", "Renewals", "PaymentAmount",
+    "RefundAmount", "InvoluntaryChurn", "VoluntaryChurn", "Winbacks"
+]
+COMPARISON_TYPES = [
+    "yesterday-today", "lastweek-thisweek", "lastmonth-thismonth",
+    "lastquarter-thisquarter", "lasthalfyear-thishalfyear", "lastyear-thisyear"
+]
+# 360 View time periods (days back from END_DATE) and breakdown charts
+PERIOD_DAYS_360 = [7, 30, 90, 182, 365]
+BREAKDOWNS_360 = [
+    ("Region", ["Subscribers"]), ("SKU", ["Subscribers"]),
+    ("Status", ["Subscribers"]), ("PaymentMethod", ["Subscribers"])
+]
+CHART_MAX_POINTS = 60
+
+
+# "500K" / "10M" / "2500" -> int
+def parse_count(text):
+    text = text.strip().upper()
+    multiplier = {"K": 1_000, "M": 1_000_000}.get(text[-1:], 1)
+    return int(float(text.rstrip("KM")) * multiplier)
+
+
+def format_count(count):
+    if count >= 1_000_000 and count % 1_000_000 == 0:
+        return f"{count // 1_000_000}M"
+    if count >= 1_000 and count % 1_000 == 0:
+        return f"{count // 1_000}K"
+    return str(count)
+
+
+# Resident set size and its high-water mark in bytes, from /proc (Linux)
+def _rss():
+    with open("/proc/self/status") as f:
+        fields = dict(line.split(":", 1) for line in f)
+    return int(fields["VmRSS"].split()[0]) * 1024, int(fields["VmHWM"].split()[0]) * 1024
+
+
+# Reset the RSS high-water mark; False where the kernel does not support it
+def _reset_peak_rss():
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+# Run `work` `repeat` times and record its best wall time and largest peak memory
+# under `name`. Peak memory is the growth of the process's peak RSS where Linux
+# allows resetting it, and otherwise the tracemalloc peak (which slows
+# Python-heavy stages down).
+def measure(results, name, work, repeat=1):
+    best_seconds, largest_peak = None, 0
+    for _ in range(repeat):
+        value = None
+        gc.collect()
+        rss_peak = _reset_peak_rss()
+        if rss_peak:
+            rss_before, _ = _rss()
+        else:
+            tracemalloc.start()
+        started = time.perf_counter()
+        try:
+            value = work()
+            seconds = time.perf_counter() - started
+            if rss_peak:
+                peak = max(0, _rss()[1] - rss_before)
+            else:
+                _, peak = tracemalloc.get_traced_memory()
+        finally:
+            if not rss_peak:
+                tracemalloc.stop()
+        best_seconds = seconds if best_seconds is None else min(best_seconds, seconds)
+        largest_peak = max(largest_peak, peak)
+    results[name] = {"seconds": round(best_seconds, 4), "peak_mb": round(largest_peak / (1024 * 1024), 1)}
+    print(f"{name:<60} {best_seconds:>9.3f}s {largest_peak / (1024 * 1024):>10.1f} MB", flush=True)
+    return value
+
+
+# Normalized subscriptions table of about `rows` rows: whole days ending at END_DATE
+def scaled_subscriptions(rows, seed=0):
+    days = max(1, math.ceil(rows / ROWS_PER_DAY))
+    start = pd.Timestamp(END_DATE) - pd.Timedelta(days=days - 1)
+    df = generate_subscriptions(np.random.default_rng(seed), start=start, end=END_DATE)
+    df, _ = normalize_subscriptions(df, "benchmark data", log=False)
+    return df
+
+
+# Write the subscriptions frame to a SQLite file as the SQL Server table looks
+def write_sqlite_table(df, path):
+    raw = df.rename(columns={column: name for name, column in SQL_COLUMN_MAP.items()})
+    for column in ["region", "sku", "client", "status", "payment_method"]:
+        raw[column] = raw[column].astype(str)
+    raw["date"] = raw["date"].dt.strftime("%Y-%m-%d %H:%M:%S")
+    raw.insert(0, "id", np.arange(1, len(raw) + 1))
+    engine = create_engine(f"sqlite:///{path}")
+    raw.to_sql("subscriptions", engine, index=False, if_exists="replace", chunksize=50_000)
+    return engine
+
+
+def sql_ingest(engine):
+    accumulator = RollupAccumulator()
+    df = read_subscriptions(engine, accumulator=accumulator)
+    return df, accumulator.cube()
+
+
+# Every 360 View aggregate (KPIs, breakdowns, time series) for each track and period
+def view_360(cube, tracks):
+    end = pd.Timestamp(END_DATE)
+    for track in tracks:
+        for days in PERIOD_DAYS_360:
+            start = end - pd.Timedelta(days=days)
+            selection = dict(client=track, region=None, start=start, end=end)
+            cube.totals(**selection)
+            for dimension, measures in BREAKDOWNS_360:
+                cube.by_dimension(dimension, measures, **selection)
+            grain = time_grain(start, end)
+            churn = cube.over_time(["InvoluntaryChurn", "VoluntaryChurn"], grain=grain, **selection)
+            churn = churn.assign(TotalChurn=churn["InvoluntaryChurn"] + churn["VoluntaryChurn"])
+            downsample_frame(churn, "Date", "TotalChurn", CHART_MAX_POINTS)
+            active = cube.over_time(["ActivePaid"], grain=grain, **selection)
+            downsample_frame(active, "Date", "ActivePaid", CHART_MAX_POINTS)
+
+
+def trends_compare(cube, tracks, metrics):
+    comparisons = []
+    for comparison_type in COMPARISON_TYPES:
+        period1_start, period1_end, period2_start, period2_end, period1_label, period2_label = get_date_ranges(comparison_type)
+        comparison_df = compare_periods(cube, tracks, metrics, (period1_start, period1_end), (period2_start, period2_end))
+        comparisons.append((comparison_df, period1_label, period2_label))
+    return comparisons
+
+
+# The Trends tab's figures (bar charts) for one comparison, as the app draws them
+def trends_figures(comparison_df, period1_label, period2_label, track_count):
+    figures = []
+    for metric_idx, (metric, metric_df) in enumerate(comparison_df.groupby("metric", sort=False)):
+        all_values = []
+        for track_idx, (track, period1_value, period2_value) in enumerate(zip(metric_df["track"], metric_df["period1_value"], metric_df["period2_value"])):
+            all_values.extend([period1_value, period2_value])
+            figures.append(trend_figure(
+                metric, metric_idx, track, track_idx, track_count, period1_value, period2_value,
+                short_period_label(period1_label), short_period_label(period2_label), "Bar", all_values
+            ))
+    return figures
+
+
+# The Summary of Changes table for one comparison: sort, first page of HTML, CSV export
+def summary_table(comparison_df, period1_label, period2_label):
+    summary_df = sort_summary(comparison_df, "% Change", descending=True)
+    summary_table_html(summary_page(summary_df, 1, 50), period1_label, period2_label)
+    return to_csv_bytes(export_frame(summary_df, period1_label, period2_label))
+
+
+def run_benchmarks(row_scales, track_scales, metric_scales, sql_rows, seed=0, repeat=1):
+    results = {}
+    # Plotly loads its validators on first use; keep that out of the first stage
+    trend_figure(TREND_METRICS[0], 0, CLIENTS[0], 0, 1, 1, 2, "LW", "TW", "Bar", [1, 2])
+    for rows in row_scales:
+        scale = f"rows={format_count(rows)}"
+        df = measure(results, f"generate[{scale}]", lambda: scaled_subscriptions(rows, seed), repeat)
+        cube = measure(results, f"rollup_cube[{scale}]", lambda: build_rollup_cube(df), repeat)
+        for track_count in track_scales:
+            tracks = CLIENTS[:track_count]
+            measure(results, f"view_360[{scale},tracks={track_count}]", lambda: view_360(cube, tracks), repeat)
+            for metric_count in metric_scales:
+                metrics = TREND_METRICS[:metric_count]
+                name = f"{scale},tracks={track_count},metrics={metric_count}"
+                comparisons = measure(results, f"trends_compare[{name}]", lambda: trends_compare(cube, tracks, metrics), repeat)
+                measure(results, f"trends_figures[{name}]", lambda: trends_figures(*comparisons[-1], track_count), repeat)
+                measure(results, f"summary_table[{name}]", lambda: summary_table(*comparisons[-1]), repeat)
+        df = cube = None
+
+    # SQL ingestion reads a smaller table: writing SQLite dominates setup time
+    if sql_rows:
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = write_sqlite_table(scaled_subscriptions(sql_rows, seed), os.path.join(tmp, "subscriptions.db"))
+            measure(results, f"sql_ingest[rows={format_count(sql_rows)}]", lambda: sql_ingest(engine), repeat)
+            engine.dispose()
+    return results
+
+
+# Stages slower or bigger than the baseline by more than `tolerance` (a fraction).
+# Differences under `min_seconds` / `min_mb` are timer and allocator noise.
+def find_regressions(results, baseline, tolerance, min_seconds=0.05, min_mb=16.0):
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if result["seconds"] > base["seconds"] * (1 + tolerance) and result["seconds"] - base["seconds"] > min_seconds:
+            regressions.append(f"{name}: {base['seconds']:.3f}s -> {result['seconds']:.3f}s")
+        if result["peak_mb"] > base["peak_mb"] * (1 + tolerance) and result["peak_mb"] - base["peak_mb"] > min_mb:
+            regressions.append(f"{name}: {base['peak_mb']:.1f} MB -> {result['peak_mb']:.1f} MB")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the TrendTrack Monitor data and aggregation paths.")
+    parser.add_argument("--rows", default="1M", help="Comma-separated table sizes, e.g. 1M,10M,50M")
+    parser.add_argument("--tracks", default="1,8,34", help="Comma-separated numbers of selected tracks (1-34)")
+    parser.add_argument("--metrics", default="1,15", help="Comma-separated numbers of selected metrics (1-15)")
+    parser.add_argument("--sql-rows", default="200K", help="Size of the SQLite table for the ingestion stage (0 skips it)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for the generated data")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per stage; the best time is reported")
+    parser.add_argument("--backend", default="pandas", help="Aggregation backend: pandas or polars")
+    parser.add_argument("--compare-workers", type=int, default=0, help="Worker processes for the Trends comparison (0 runs it in-process)")
+    parser.add_argument("--compare-min-cells", type=int, default=MIN_CELLS, help="Smallest track x metric selection sent to the workers (0 sends every one, to find the crossover)")
+    parser.add_argument("--save", help="Write the results to this JSON file (a new baseline)")
+    parser.add_argument("--baseline", help="Compare against this JSON file and exit 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown or growth over the baseline (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    track_scales = [min(int(count), len(CLIENTS)) for count in args.tracks.split(",")]
+    metric_scales = [min(int(count), len(TREND_METRICS)) for count in args.metrics.split(",")]
+    set_aggregation_backend(make_aggregation_backend(args.backend))
+    pool = ComparisonPool(args.compare_workers, min_cells=args.compare_min_cells) if args.compare_workers > 1 else None
+    set_comparison_pool(pool)
+    results = run_benchmarks(
+        [parse_count(rows) for rows in args.rows.split(",")], track_scales, metric_scales,
+        parse_count(args.sql_rows), args.seed, args.repeat
+    )
+    if pool is not None:
+        pool.shutdown()
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"Saved {len(results)} results to {args.save}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = find_regressions(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {args.baseline}")
@@ -0,0 +1,345 @@
+# BigQuery access for the dashboard.
+#
+# BigQueryReader never runs SELECT *: it selects only the columns the
+# dashboard uses, filters on the date (and partition) column plus the current
+# track/region selection, and transfers results through Arrow. Results are
+# cached locally, keyed by the normalized query text, its parameters and the
+# table's last-modified time, so an unchanged table is never scanned twice.
+# Results are streamed as Arrow record batches of up to CHUNK_ROWS rows, each
+# normalized as it arrives, so the raw rows of only one batch are held at a time.
+#
+# BigQuerySource answers the same calls as aggregations.RollupCube on top of
+# the reader, so both dashboard tabs work unchanged in BigQuery mode.
+
+import logging
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+from aggregations import build_rollup_cube
+from instrumentation import stage
+from schema import DIMENSION_COLUMNS, METRIC_COLUMNS, SQL_COLUMN_MAP, concat_normalized, frame_memory_mb, normalize_subscriptions
+
+try:
+    from google.cloud import bigquery
+except ImportError:
+    bigquery = None
+
+try:
+    from google.cloud import bigquery_storage
+except ImportError:
+    bigquery_storage = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:
+    pa = None
+
+logger = logging.getLogger(__name__)
+
+DASHBOARD_COLUMNS = ["Date"] + DIMENSION_COLUMNS + METRIC_COLUMNS
+WAREHOUSE_COLUMNS = {dashboard: warehouse for warehouse, dashboard in SQL_COLUMN_MAP.items()}
+CHUNK_ROWS = 100_000
+
+
+def normalize_query_text(sql):
+    return re.sub(r"\s+", " ", sql).strip()
+
+
+class BigQueryReader:
+    def __init__(self, client, project_id, dataset_id, table_id, metadata_ttl=10, max_cached_results=32, chunk_rows=CHUNK_ROWS):
+        self.client = client
+        self.chunk_rows = chunk_rows
+        self._bqstorage_client = None
+        self.table_ref = f"{project_id}.{dataset_id}.{table_id}"
+        self.metadata_ttl = metadata_ttl
+        self.max_cached_results = max_cached_results
+        self._metadata = None
+        self._metadata_time = 0.0
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+
+    # Table columns (dashboard name -> table column and type), partitioning field
+    # and last-modified time. Refetched at most every metadata_ttl seconds.
+    def metadata(self):
+        now = time.time()
+        if self._metadata is None or now - self._metadata_time >= self.metadata_ttl:
+            table = self.client.get_table(self.table_ref)
+            fields = {field.name: field.field_type for field in table.schema}
+            columns = {}
+            for column in DASHBOARD_COLUMNS:
+                for name in (column, WAREHOUSE_COLUMNS[column]):
+                    if name in fields:
+                        columns[column] = (name, fields[name])
+                        break
+            partitioning = getattr(table, "time_partitioning", None)
+            self._metadata = SimpleNamespace(
+                columns=columns,
+                partition_field=getattr(partitioning, "field", None),
+                modified=table.modified
+            )
+            self._metadata_time = now
+        return self._metadata
+
+    # Next read re-checks the table's last-modified time
+    def expire_metadata(self):
+        self._metadata = None
+
+    def _date_param(self, name, value, field_type):
+        value = pd.Timestamp(value)
+        if field_type == "DATE":
+            return _query_parameter(name, "DATE", value.date())
+        return _query_parameter(name, field_type, value.to_pydatetime())
+
+    # Query text and parameters selecting `columns` for the given filters
+    def build_query(self, columns, clients=None, region=None, start=None, end=None, distinct=False):
+        metadata = self.metadata()
+        available = [column for column in columns if column in metadata.columns]
+        select = [f"`{metadata.columns[column][0]}` AS {column}" for column in available]
+        conditions, params = [], []
+        if "Date" in metadata.columns:
+            date_column, date_type = metadata.columns["Date"]
+            # The date filter is also the partition filter when the table is partitioned on it
+            if start is not None:
+                conditions.append(f"`{date_column}` >= @start")
+                params.append(self._date_param("start", start, date_type))
+            if end is not None:
+                conditions.append(f"`{date_column}` <= @end")
+                params.append(self._date_param("end", end, date_type))
+            if metadata.partition_field not in (None, date_column):
+                logger.info(f"{self.table_ref} is partitioned on {metadata.partition_field}, not the date column; no partition pruning")
+        if clients is not None and "Client" in metadata.columns:
+            conditions.append(f"`{metadata.columns['Client'][0]}` IN UNNEST(@clients)")
+            params.append(_query_parameter("clients", "STRING", list(clients), array=True))
+        if region is not None and "Region" in metadata.columns:
+            conditions.append(f"`{metadata.columns['Region'][0]}` = @region")
+            params.append(_query_parameter("region", "STRING", region))
+        sql = f"SELECT {'DISTINCT ' if distinct else ''}{', '.join(select)} FROM `{self.table_ref}`"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        return sql, params
+
+    def _cache_key(self, sql, params):
+        values = tuple(
+            (param.name, tuple(param.values) if hasattr(param, "values") else param.value)
+            for param in params
+        )
+        return normalize_query_text(sql), values, self.metadata().modified
+
+    # BigQuery Storage API client for the Arrow transfer, when it is installed
+    def _storage_client(self):
+        if self._bqstorage_client is None and bigquery_storage is not None and bigquery is not None:
+            try:
+                self._bqstorage_client = bigquery_storage.BigQueryReadClient()
+            except Exception as e:
+                logger.error(f"BigQuery Storage API unavailable, using paged reads: {str(e)}")
+                self._bqstorage_client = False
+        return self._bqstorage_client or None
+
+    # Run the query (or reuse the cached result) and return a normalized frame
+    def read(self, columns=DASHBOARD_COLUMNS, **filters):
+        sql, params = self.build_query(columns, **filters)
+        key = self._cache_key(sql, params)
+        with self._lock:
+            if key in self._results:
+                self._results.move_to_end(key)
+                return self._results[key]
+        with stage("fetch") as record:
+            rows = self.client.query(sql, job_config=_job_config(params)).result(page_size=self.chunk_rows)
+            chunks = [
+                normalize_subscriptions(chunk, "BigQuery chunk", log=False)[0]
+                for chunk in _iter_frames(rows, columns, self._storage_client())
+            ]
+            df = concat_normalized(chunks)
+            record.rows, record.bytes = len(df), int(df.memory_usage(deep=True).sum())
+        logger.info(f"Fetched data from BigQuery in {len(chunks)} chunk(s): {len(df):,} rows, {len(df.columns)} columns, {frame_memory_mb(df):,.1f} MB")
+        with self._lock:
+            self._results[key] = df
+            while len(self._results) > self.max_cached_results:
+                self._results.popitem(last=False)
+        return df
+
+
+def _query_parameter(name, type_, value, array=False):
+    if bigquery is not None:
+        if array:
+            return bigquery.ArrayQueryParameter(name, type_, value)
+        return bigquery.ScalarQueryParameter(name, type_, value)
+    if array:
+        return SimpleNamespace(name=name, type_=type_, values=value)
+    return SimpleNamespace(name=name, type_=type_, value=value)
+
+
+def _job_config(params):
+    if bigquery is not None:
+        return bigquery.QueryJobConfig(query_parameters=params)
+    return SimpleNamespace(query_parameters=params)
+
+
+# Result rows as a stream of frames, one per Arrow record batch, with string
+# columns dictionary-encoded in Arrow so they arrive as categoricals. An empty
+# result is one empty frame with the selected `columns`.
+def _iter_frames(rows, columns, bqstorage_client=None):
+    if pa is None:
+        frames = rows.to_dataframe_iterable(bqstorage_client=bqstorage_client)
+    else:
+        frames = (_batch_to_frame(batch) for batch in rows.to_arrow_iterable(bqstorage_client=bqstorage_client))
+    empty = True
+    for frame in frames:
+        empty = False
+        yield frame
+    if empty:
+        yield pd.DataFrame(columns=columns)
+
+
+def _batch_to_frame(batch):
+    columns = []
+    for column in batch.columns:
+        if pa.types.is_string(column.type) or pa.types.is_large_string(column.type):
+            column = pc.dictionary_encode(column)
+        columns.append(column)
+    return pa.RecordBatch.from_arrays(columns, names=batch.schema.names).to_pandas()
+
+
+class BigQuerySource:
+    def __init__(self, reader, max_cached_cubes=16):
+        self.reader = reader
+        self.max_cached_cubes = max_cached_cubes
+        self._cubes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        self.reader.expire_metadata()
+
+    # The table's last-modified time; query results are cached under it
+    def data_token(self):
+        self.reader.expire_metadata()
+        return self.reader.metadata().modified
+
+    # Rollup cube over just the rows of one 360 View selection
+    def _selection_cube(self, client, region, start, end):
+        frame = self.reader.read(clients=[client], region=region, start=start, end=end)
+        with self._lock:
+            cached = self._cubes.get(id(frame))
+            if cached is not None and cached[0] is frame:
+                return cached[1]
+        cube = build_rollup_cube(frame)
+        with self._lock:
+            self._cubes[id(frame)] = (frame, cube)
+            while len(self._cubes) > self.max_cached_cubes:
+                self._cubes.popitem(last=False)
+        return cube
+
+    def dimension_values(self, dimension):
+        values = self.reader.read(columns=[dimension], distinct=True)
+        return sorted(values[dimension].dropna().unique()) if dimension in values.columns else []
+
+    def totals(self, client, region=None, start=None, end=None):
+        return self._selection_cube(client, region, start, end).totals(client, region, start, end)
+
+    def range_total(self, client, metric, start=None, end=None, region=None):
+        return self._selection_cube(client, region, start, end).range_total(client, metric, start, end, region)
+
+    def by_dimension(self, dimension, measures, client, region=None, start=None, end=None):
+        return self._selection_cube(client, region, start, end).by_dimension(dimension, measures, client, region, start, end)
+
+    def over_time(self, measures, client, region=None, start=None, end=None, grain="D"):
+        return self._selection_cube(client, region, start, end).over_time(measures, client, region, start, end, grain)
+
+    # Only Client, Date and the selected metrics, for the selected tracks over the
+    # span of all periods
+    def period_totals(self, tracks, metrics, periods):
+        tracks, metrics = list(tracks), list(metrics)
+        columns = ["Client", "Date"]
+        for metric in metrics:
+            columns.extend(["InvoluntaryChurn", "VoluntaryChurn"] if metric == "TotalChurn" else [metric])
+        frame = self.reader.read(
+            columns=list(dict.fromkeys(columns)),
+            clients=tracks,
+            start=min(start for start, _ in periods),
+            end=max(end for _, end in periods)
+        )
+        if "TotalChurn" in metrics:
+            frame = frame.assign(TotalChurn=frame["InvoluntaryChurn"].astype(np.int64) + frame["VoluntaryChurn"].astype(np.int64))
+        totals = []
+        for start, end in periods:
+            in_period = frame[(frame["Date"] >= pd.Timestamp(start)) & (frame["Date"] <= pd.Timestamp(end))]
+            sums = in_period.groupby("Client", observed=True)[metrics].sum()
+            totals.append(sums.reindex(tracks).fillna(0).to_numpy(dtype=np.int64))
+        return np.stack(totals)
+
+
+# Local stand-in for google.cloud.bigquery.Client, for offline development and
+# benchmarks. Tables are pandas frames loaded into an in-memory SQLite database
+# (which accepts BigQuery's backtick identifiers and @name parameters); only the
+# calls BigQueryReader makes are implemented.
+class LocalBigQueryClient:
+    def __init__(self, tables, partition_fields=None):
+        self._connection = sqlite3.connect(":memory:", check_same_thread=False)
+        self._tables = {}
+        self._partition_fields = partition_fields or {}
+        self.queries = []
+        for table_ref, df in tables.items():
+            self.load_table(table_ref, df)
+
+    def load_table(self, table_ref, df):
+        stored = df.copy()
+        for column in stored.columns:
+            if pd.api.types.is_datetime64_any_dtype(stored[column]):
+                stored[column] = stored[column].dt.strftime("%Y-%m-%d %H:%M:%S")
+            elif isinstance(stored[column].dtype, pd.CategoricalDtype):
+                stored[column] = stored[column].astype(str)
+        stored.to_sql(table_ref, self._connection, index=False, if_exists="replace")
+        types = {"i": "INTEGER", "u": "INTEGER", "f": "FLOAT", "M": "TIMESTAMP"}
+        schema = [SimpleNamespace(name=column, field_type=types.get(df[column].dtype.kind, "STRING")) for column in df.columns]
+        self._tables[table_ref] = SimpleNamespace(
+            schema=schema,
+            modified=datetime.now(),
+            time_partitioning=SimpleNamespace(field=self._partition_fields.get(table_ref))
+        )
+
+    def get_table(self, table_ref):
+        return self._tables[table_ref]
+
+    def query(self, sql, job_config=None):
+        self.queries.append(sql)
+        params = {}
+        for param in getattr(job_config, "query_parameters", []):
+            if hasattr(param, "values"):
+                # IN UNNEST(@name) -> IN (@name_0, @name_1, ...)
+                names = [f"{param.name}_{i}" for i in range(len(param.values))]
+                sql = sql.replace(f"IN UNNEST(@{param.name})", f"IN ({', '.join('@' + name for name in names) or 'NULL'})")
+                params.update(zip(names, param.values))
+            else:
+                value = param.value
+                params[param.name] = value.strftime("%Y-%m-%d %H:%M:%S") if hasattr(value, "strftime") else value
+        df = pd.read_sql(sql, self._connection, params=params)
+        return SimpleNamespace(result=lambda page_size=None: _LocalRows(df, page_size))
+
+
+class _LocalRows:
+    def __init__(self, df, page_size=None):
+        self._df = df
+        self._page_size = page_size or max(len(df), 1)
+
+    def _pages(self):
+        for start in range(0, len(self._df), self._page_size):
+            yield self._df.iloc[start:start + self._page_size].reset_index(drop=True)
+
+    def to_dataframe(self):
+        return self._df
+
+    def to_dataframe_iterable(self, bqstorage_client=None):
+        return self._pages()
+
+    def to_arrow_iterable(self, bqstorage_client=None):
+        for page in self._pages():
+            yield from pa.Table.from_pandas(page, preserve_index=False).to_batches()
@@ -0,0 +1,194 @@
+# Trends Comparison charts, kept out of app.py so they can be built (and
+# benchmarked) without running the Streamlit script.
+
+import re
+from datetime import datetime, timedelta
+
+import plotly.graph_objects as go
+
+COLORS = ['#A3BFFA', '#FBB6CE', '#B5F5EC', '#FED7AA', '#D1D5DB', '#C4B5FD']
+LINE_COLORS = ['#6366F1', '#3B82F6']
+MARKER_COLORS = ['#FBB6CE', '#A3BFFA']
+
+
+# (period1_start, period1_end, period2_start, period2_end, period1_label, period2_label)
+# for a Trends comparison type such as "lastweek-thisweek"
+def get_date_ranges(comparison_type):
+    today = datetime(2025, 4, 6)
+    period1_start, period1_end, period2_start, period2_end, period1_label, period2_label = today, today, today, today, '', ''
+    if comparison_type == "yesterday-today":
+        period2_end = today
+        period2_start = today
+        period1_end = today - timedelta(days=1)
+        period1_start = period1_end
+        period1_label = "Yesterday"
+        period2_label = "Today"
+    elif comparison_type == "lastweek-thisweek":
+        period2_end = today
+        period2_start = today - timedelta(days=today.weekday())
+        period1_end = period2_start - timedelta(days=1)
+        period1_start = period1_end - timedelta(days=6)
+        period1_label = "Last Week"
+        period2_label = "This Week"
+    elif comparison_type == "lastmonth-thismonth":
+        period2_end = today
+        period2_start = today.replace(day=1)
+        period1_end = period2_start - timedelta(days=1)
+        period1_start = period1_end.replace(day=1)
+        period1_label = "Last Month"
+        period2_label = "This Month"
+    elif comparison_type == "lastquarter-thisquarter":
+        period2_end = today
+        current_quarter = (today.month - 1) // 3 + 1
+        period2_start = datetime(today.year, (current_quarter - 1) * 3 + 1, 1)
+        period1_end = period2_start - timedelta(days=1)
+        period1_start = datetime(period1_end.year, ((period1_end.month - 1) // 3 - 1) * 3 + 4, 1)
+        period1_label = "Last Quarter"
+        period2_label = "This Quarter"
+    elif comparison_type == "lasthalfyear-thishalfyear":
+        period2_end = today
+        current_half_year = 1 if today.month < 7 else 2
+        period2_start = datetime(today.year, 1 if current_half_year == 1 else 7, 1)
+        period1_end = period2_start - timedelta(days=1)
+        period1_start = datetime(period1_end.year, 7 if period1_end.month < 7 else 1, 1)
+        period1_label = "Last Half-Year"
+        period2_label = "This Half-Year"
+    elif comparison_type == "lastyear-thisyear":
+        period2_end = today
+        period2_start = datetime(today.year, 1, 1)
+        period1_end = period2_start - timedelta(days=1)
+        period1_start = datetime(period1_end.year, 1, 1)
+        period1_label = "Last Year"
+        period2_label = "This Year"
+    return period1_start, period1_end, period2_start, period2_end, period1_label, period2_label
+
+
+# Abbreviated period label for chart axes ("Last Week" -> "LW")
+def short_period_label(label):
+    return label.replace("Yesterday", "Yest").replace("Today", "Today").replace("Last Week", "LW").replace("This Week", "TW").replace("Last Month", "LM").replace("This Month", "TM").replace("Last Quarter", "LQ").replace("This Quarter", "TQ").replace("Last Half-Year", "LHY").replace("This Half-Year", "THY").replace("Last Year", "LY").replace("This Year", "TY")
+
+
+# Comparison chart of one track's two period values for one metric. The y range
+# covers `all_values`, the values of this metric's tracks drawn so far.
+def trend_figure(metric, metric_idx, track, track_idx, track_count, period1_value, period2_value,
+                 short_period1, short_period2, graph_type, all_values):
+    if graph_type.lower() in ["pie", "donut"]:
+        fig = go.Figure(data=go.Pie(
+            labels=[f"{track} ({short_period1})", f"{track} ({short_period2})"],
+            values=[period1_value, period2_value],
+            marker=dict(colors=[COLORS[(metric_idx * track_count + track_idx) % len(COLORS)] for _ in range(2)]),
+            hole=0.4 if graph_type.lower() == "donut" else 0,
+            name=track
+        ))
+    else:
+        if graph_type.lower() == "line":
+            fig = go.Figure()
+            fig.add_trace(go.Scatter(
+                x=[f"{track} ({short_period1})", f"{track} ({short_period2})"],
+                y=[period1_value, period2_value],
+                mode='lines+markers',
+                name=track,
+                line=dict(width=2, color=LINE_COLORS[track_idx % len(LINE_COLORS)]),
+                marker=dict(size=6, color=MARKER_COLORS[track_idx % len(MARKER_COLORS)], line=dict(width=1, color='#ffffff'))
+            ))
+        elif graph_type.lower() == "scatter":
+            fig = go.Figure()
+            fig.add_trace(go.Scatter(
+                x=[f"{track} ({short_period1})", f"{track} ({short_period2})"],
+                y=[period1_value, period2_value],
+                mode='markers',
+                name=track,
+                marker=dict(size=8, color=COLORS[(metric_idx * track_count + track_idx) % len(COLORS)])
+            ))
+        elif graph_type.lower() == "area":
+            fig = go.Figure()
+            fig.add_trace(go.Scatter(
+                x=[f"{track} ({short_period1})", f"{track} ({short_period2})"],
+                y=[period1_value, period2_value],
+                mode='lines',
+                fill='tozeroy',
+                name=track,
+                line=dict(width=2, color=COLORS[(metric_idx * track_count + track_idx) % len(COLORS)])
+            ))
+        else:  # Bar
+            fig = go.Figure()
+            fig.add_trace(go.Bar(
+                x=[f"{track} ({short_period1})", f"{track} ({short_period2})"],
+                y=[period1_value, period2_value],
+                name=track,
+                marker_color=COLORS[(metric_idx * track_count + track_idx) % len(COLORS)],
+                width=0.1
+            ))
+
+    min_value = min(all_values)
+    max_value = max(all_values)
+    padding = (max_value - min_value) * 0.1
+    y_axis_range = [max(0, min_value - padding), max_value + padding]
+    range_diff = max_value - min_value
+    y_axis_dtick = 10000 if range_diff > 50000 else (5000 if range_diff > 10000 else 1000)
+
+    # Compute the chart title outside the f-string to avoid backslash in f-string
+    transformed_metric = metric.replace('TotalChurn', 'Churn')
+    transformed_metric = re.sub(r'([A-Z])', r' \1', transformed_metric).strip()
+    chart_title = f"{transformed_metric} Comparison"
+
+    layout = {
+        "title": chart_title,
+        "titlefont": dict(size=18, color='#1f2937', family='Inter'),
+        "margin": dict(t=80, b=80, l=60, r=50),
+        "plot_bgcolor": 'rgba(0,0,0,0)',
+        "paper_bgcolor": 'rgba(0,0,0,0)',
+        "legend": dict(x=1, y=1, bgcolor='rgba(255,255,255,0.8)'),
+        "height": 450
+    }
+    if graph_type.lower() == "bar":
+        layout["barmode"] = "group"
+        layout["xaxis"] = dict(tickfont=dict(size=10, color='#718096'), tickangle=-45, automargin=True, showgrid=False)
+        layout["yaxis"] = dict(
+            title='Value',
+            titlefont=dict(size=14, color='#1f2937'),
+            tickfont=dict(size=8, color='#718096'),
+            showticklabels=False,
+            ticks='',
+            range=[0, y_axis_range[1]],
+            automargin=True,
+            showgrid=False
+        )
+    elif graph_type.lower() == "line":
+        layout["xaxis"] = dict(tickfont=dict(size=8, color='#718096'), tickangle=-45, automargin=True, showgrid=False)
+        layout["yaxis"] = dict(
+            title='Value',
+            titlefont=dict(size=14, color='#1f2937'),
+            tickfont=dict(size=8, color='#718096'),
+            tickformat='s',
+            dtick=y_axis_dtick,
+            range=y_axis_range,
+            automargin=True,
+            showgrid=False
+        )
+    elif graph_type.lower() == "scatter":
+        layout["xaxis"] = dict(tickfont=dict(size=10, color='#718096'), tickangle=-45, automargin=True, showgrid=False)
+        layout["yaxis"] = dict(
+            title='Value',
+            titlefont=dict(size=14, color='#1f2937'),
+            tickfont=dict(size=8, color='#718096'),
+            range=y_axis_range,
+            automargin=True,
+            showgrid=False
+        )
+    elif graph_type.lower() == "area":
+        layout["xaxis"] = dict(tickfont=dict(size=10, color='#718096'), tickangle=-45, automargin=True, showgrid=False)
+        layout["yaxis"] = dict(
+            title='Value',
+            titlefont=dict(size=14, color='#1f2937'),
+            tickfont=dict(size=8, color='#718096'),
+            range=y_axis_range,
+            automargin=True,
+            showgrid=False
+        )
+    elif graph_type.lower() in ["pie", "donut"]:
+        layout["xaxis"] = dict(visible=False)
+        layout["yaxis"] = dict(visible=False)
+
+    fig.update_layout(**layout)
+    return fig
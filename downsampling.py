@@ -0,0 +1,58 @@
+# Downsampling of long time series before they are plotted.
+#
+# Largest-Triangle-Three-Buckets (LTTB) keeps the first and last points and, for
+# every bucket in between, the point forming the largest triangle with the point
+# kept from the previous bucket and the average of the next bucket. Peaks, dips
+# and the overall shape survive, while the browser only draws `max_points`.
+
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+# Positions of the points LTTB keeps out of (x, y), in order. x must be sorted.
+def lttb_indices(x, y, max_points):
+    n = len(x)
+    if max_points <= 0 or n <= max_points or max_points < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    # Bucket boundaries over the interior points (the ends are always kept)
+    edges = np.linspace(1, n - 1, max_points - 1).astype(np.int64)
+    kept = np.empty(max_points, dtype=np.int64)
+    kept[0] = 0
+    kept[-1] = n - 1
+    previous = 0
+    for bucket in range(max_points - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        # Average of the next bucket (the last point for the final bucket)
+        if bucket + 2 < len(edges):
+            next_start, next_end = edges[bucket + 1], edges[bucket + 2]
+        else:
+            next_start, next_end = n - 1, n
+        next_x = x[next_start:next_end].mean()
+        next_y = y[next_start:next_end].mean()
+        # Twice the triangle areas; the constant factor does not change the argmax
+        areas = np.abs(
+            (x[previous] - next_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (next_y - y[previous])
+        )
+        previous = start + int(areas.argmax())
+        kept[bucket + 1] = previous
+    return kept
+
+
+# Rows of a frame sorted by `x` reduced to at most `max_points` with LTTB on
+# `y`. Dates are compared as timestamps. max_points=0 keeps every row.
+def downsample_frame(df, x, y, max_points):
+    if max_points <= 0 or len(df) <= max_points:
+        return df
+    x_values = df[x].to_numpy()
+    if np.issubdtype(x_values.dtype, np.datetime64):
+        x_values = x_values.astype("datetime64[ns]").astype(np.int64)
+    kept = lttb_indices(x_values, df[y].to_numpy(), max_points)
+    logger.info(f"Downsampled {y} from {len(df)} to {len(kept)} points")
+    return df.iloc[kept]
@@ -0,0 +1,260 @@
+# Synthetic data generation for the TrendTrack Monitor dashboard.
+#
+# Every table is built column-wise: the Cartesian grid of dimensions is laid out
+# with NumPy broadcasting and each metric column is drawn as one batched array
+# from a numpy.random.Generator, instead of one Python dict per row.
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from schema import normalize_subscriptions
+
+START_DATE = "2023-01-01"
+END_DATE = "2025-04-06"
+
+REGIONS = ["North America", "South America", "Europe", "Africa", "Asia", "Australia"]
+SKUS = ["SKU005", "SKU002", "SKU018", "SKU036", "SKU001"]
+PAYMENT_METHODS = ["App Billing", "Google Wallet", "Pay Pal", "Roku Payment", "Debit Card", "Credit Card"]
+STATUSES = ["Paid", "Active", "Free Trial", "Registered"]
+CLIENTS = [
+    "1001", "AHA", "ATT", "Antel", "ABSCBN", "Astro Sooka", "Astro NJOI", "Astro PayTV",
+    "BBCAsia", "Britbox", "Cignal", "Etisalat", "Etv", "Exxen", "FOXUSA", "Kocowa",
+    "Lightbox", "MongolTV", "Marquee", "MK Ooredoo", "NBA", "NEWS9", "PLDT", "Pilipinas",
+    "Sinclair", "Sony", "SimpleTv", "Shahid", "TRT World", "TV3", "TV ASAHI", "VIKI",
+    "One31", "Gotham"
+]
+TRIGGERS = [
+    "Got all the content needed already",
+    "Was too expensive",
+    "Technical issues",
+    "Stopped subscribing to bundling partner",
+    "After trial is expired, decided not to continue"
+]
+PROMOTIONS = ["Spring Deal", "20% OFF Combo", "AppleTV Offer", "Credit Card Offer", "Package10%OFF"]
+COUPONS = ["FLAT25", "MOVIE999", "PREMIERE", "SAVE50", "FESTIVE10", "OFFER999", "FIRST50"]
+
+# Metric column -> [low, high) bounds of the uniform integer draw, in schema order.
+# PaymentMethod sits between Revenue and FreeTrials in the output frame.
+METRIC_RANGES = {
+    "Subscribers": (500, 5000),
+    "Revenue": (10000, 100000),
+    "FreeTrials": (100, 500),
+    "NewOrders": (50, 200),
+    "Conversions": (100, 500),
+    "Redemptions": (20, 100),
+    "Registrations": (200, 600),
+    "ActivePaid": (300, 4000),
+    "Renewals": (100, 300),
+    "PaymentAmount": (5000, 20000),
+    "RefundAmount": (100, 1000),
+    "InvoluntaryChurn": (50, 200),
+    "VoluntaryChurn": (50, 200),
+    "Winbacks": (10, 100)
+}
+
+SUBSCRIPTION_COLUMNS = [
+    "Date", "Region", "SKU", "Client", "Status", "Subscribers", "Revenue", "PaymentMethod",
+    "FreeTrials", "NewOrders", "Conversions", "Redemptions", "Registrations", "ActivePaid",
+    "Renewals", "PaymentAmount", "RefundAmount", "InvoluntaryChurn", "VoluntaryChurn", "Winbacks"
+]
+
+
+# Index arrays for the full Cartesian product of the given axis lengths, in
+# row-major order (the first axis varies slowest, like nested for-loops).
+def _grid_indices(*sizes):
+    grids = np.meshgrid(*[np.arange(size) for size in sizes], indexing="ij")
+    return [grid.ravel() for grid in grids]
+
+
+# Categorical from codes into `categories`, with the categories sorted as
+# groupbys and the database sources order them
+def _sorted_categorical(codes, categories):
+    return pd.Categorical.from_codes(codes, categories=categories).reorder_categories(sorted(categories))
+
+
+# Daily subscriptions: Date x Region x SKU x Client x Status. A longer date
+# range gives a proportionally larger table (the benchmarks scale it this way).
+def generate_subscriptions(rng, start=START_DATE, end=END_DATE):
+    dates = pd.date_range(start=start, end=end, freq="D")
+    date_idx, region_idx, sku_idx, client_idx, status_idx = _grid_indices(
+        len(dates), len(REGIONS), len(SKUS), len(CLIENTS), len(STATUSES)
+    )
+    n_rows = len(date_idx)
+
+    # Metrics are written into one (metric, row) matrix so the frame wraps it as a
+    # single int64 block without another consolidation copy.
+    metric_values = np.empty((len(METRIC_RANGES), n_rows), dtype=np.int64)
+    for i, (low, high) in enumerate(METRIC_RANGES.values()):
+        metric_values[i] = rng.integers(low, high, n_rows)
+    subscriptions_df = pd.DataFrame(metric_values.T, columns=list(METRIC_RANGES), copy=False)
+
+    # Dimensions come straight out of the grid as dictionary codes
+    dimensions = {
+        "Date": dates.values[date_idx],
+        "Region": _sorted_categorical(region_idx.astype(np.int8), REGIONS),
+        "SKU": _sorted_categorical(sku_idx.astype(np.int8), SKUS),
+        "Client": _sorted_categorical(client_idx.astype(np.int8), CLIENTS),
+        "Status": _sorted_categorical(status_idx.astype(np.int8), STATUSES),
+        "PaymentMethod": _sorted_categorical(rng.integers(0, len(PAYMENT_METHODS), n_rows, dtype=np.int8), PAYMENT_METHODS)
+    }
+    for column, values in dimensions.items():
+        subscriptions_df.insert(SUBSCRIPTION_COLUMNS.index(column), column, values)
+    return subscriptions_df
+
+
+# Daily subscriptions over the full date range, generated `days` days at a time
+# so the whole table never has to be held at once (out-of-core mode)
+def generate_subscription_chunks(rng, days=31, start=START_DATE, end=END_DATE):
+    chunk_start = pd.Timestamp(start)
+    while chunk_start <= pd.Timestamp(end):
+        chunk_end = min(chunk_start + pd.Timedelta(days=days - 1), pd.Timestamp(end))
+        yield generate_subscriptions(rng, start=chunk_start, end=chunk_end)
+        chunk_start = chunk_end + pd.Timedelta(days=1)
+
+
+# One row per (Client, label) pair, with a single batched draw for the value column
+def _per_client_table(label_column, labels, value_column, values):
+    client_idx, label_idx = _grid_indices(len(CLIENTS), len(labels))
+    return pd.DataFrame({
+        label_column: np.array(labels, dtype=object)[label_idx],
+        value_column: values,
+        "Client": np.array(CLIENTS, dtype=object)[client_idx]
+    })
+
+
+def generate_churn_triggers(rng):
+    return _per_client_table("Trigger", TRIGGERS, "ChurnRate", rng.uniform(5, 25, len(CLIENTS) * len(TRIGGERS)))
+
+
+def generate_top_promotions(rng):
+    return _per_client_table("Promotion", PROMOTIONS, "ProfitMargin", rng.uniform(18, 35, len(CLIENTS) * len(PROMOTIONS)))
+
+
+def generate_top_coupons(rng):
+    return _per_client_table("Coupon", COUPONS, "Count", rng.integers(50, 87, len(CLIENTS) * len(COUPONS)))
+
+
+# All four dummy tables from a single generator
+def generate_dummy_frames(seed=None):
+    rng = np.random.default_rng(seed)
+    return (
+        generate_subscriptions(rng),
+        generate_churn_triggers(rng),
+        generate_top_promotions(rng),
+        generate_top_coupons(rng)
+    )
+
+
+# Materialized demo dataset
+#
+# The four tables are written once, from an explicit seed, as one .npy file per
+# column plus a manifest. String columns are stored as integer codes with their
+# dictionary in the manifest, so loading them back with mmap_mode="r" gives
+# read-only frames whose pages are shared by every process that maps them.
+
+DATASET_TABLES = ["subscriptions", "churn_triggers", "top_promotions", "top_coupons"]
+MANIFEST_FILE = "manifest.json"
+DATASET_FORMAT_VERSION = 2
+
+
+def _write_table(df, table_dir):
+    os.makedirs(table_dir)
+    columns = []
+    for column in df.columns:
+        values = df[column]
+        spec = {"name": column, "file": f"{len(columns):02d}.npy"}
+        if values.dtype == object or isinstance(values.dtype, pd.CategoricalDtype):
+            codes, categories = pd.factorize(values, sort=True)
+            spec["categories"] = [str(category) for category in categories]
+            # Signed codes, as pandas expects, so from_codes can wrap the map as-is
+            array = codes.astype(np.min_scalar_type(-len(categories)))
+        else:
+            array = values.to_numpy()
+        np.save(os.path.join(table_dir, spec["file"]), array, allow_pickle=False)
+        columns.append(spec)
+    return {"rows": len(df), "columns": columns}
+
+
+def _read_table(table_dir, table_spec):
+    data = {}
+    for spec in table_spec["columns"]:
+        array = np.load(os.path.join(table_dir, spec["file"]), mmap_mode="r", allow_pickle=False)
+        if "categories" in spec:
+            array = pd.Categorical.from_codes(array, categories=spec["categories"])
+        data[spec["name"]] = array
+    # copy=False keeps every column backed by its memory map
+    return pd.DataFrame(data, copy=False)
+
+
+# Directory of the dataset for `seed` under data_dir. Every seed and format
+# version gets its own directory, which is complete once it exists and is never
+# modified or replaced afterwards.
+def dataset_path(data_dir, seed):
+    return os.path.join(data_dir, f"seed-{seed}-v{DATASET_FORMAT_VERSION}")
+
+
+def dataset_exists(data_dir, seed):
+    manifest_path = os.path.join(dataset_path(data_dir, seed), MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return False
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    return manifest.get("seed") == seed and manifest.get("format_version") == DATASET_FORMAT_VERSION
+
+
+# Generate the demo dataset for `seed` and write it to dataset_path(data_dir, seed).
+# The files are staged in a temporary directory under data_dir and moved into
+# place with a single rename, so concurrent workers either see a complete dataset
+# or none at all. Nothing outside the staging directory is ever deleted: when
+# another worker got there first, its dataset is kept and ours is discarded.
+def materialize_dataset(data_dir, seed):
+    subscriptions_df, churn_triggers_df, top_promotions_df, top_coupons_df = generate_dummy_frames(seed)
+    # Persist the compact schema so mapped metric columns are already narrow on load
+    subscriptions_df, _ = normalize_subscriptions(subscriptions_df, "demo dataset")
+    frames = (subscriptions_df, churn_triggers_df, top_promotions_df, top_coupons_df)
+    os.makedirs(data_dir, exist_ok=True)
+    staging_dir = tempfile.mkdtemp(prefix=".staging-", dir=data_dir)
+    try:
+        manifest = {"seed": seed, "format_version": DATASET_FORMAT_VERSION, "tables": {}}
+        for table, df in zip(DATASET_TABLES, frames):
+            manifest["tables"][table] = _write_table(df, os.path.join(staging_dir, table))
+        with open(os.path.join(staging_dir, MANIFEST_FILE), "w") as f:
+            json.dump(manifest, f, indent=2)
+        try:
+            os.rename(staging_dir, dataset_path(data_dir, seed))
+        except OSError:
+            if not dataset_exists(data_dir, seed):
+                raise
+            shutil.rmtree(staging_dir, ignore_errors=True)
+    except Exception:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        raise
+    return manifest
+
+
+# Memory-map a materialized dataset, writing it first if there is none for `seed`
+def load_dataset(data_dir, seed):
+    if not dataset_exists(data_dir, seed):
+        materialize_dataset(data_dir, seed)
+    path = dataset_path(data_dir, seed)
+    with open(os.path.join(path, MANIFEST_FILE)) as f:
+        manifest = json.load(f)
+    return tuple(
+        _read_table(os.path.join(path, table), manifest["tables"][table])
+        for table in DATASET_TABLES
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Materialize the TrendTrack Monitor demo dataset.")
+    parser.add_argument("data_dir", help="Directory to write the dataset under (one subdirectory per seed)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for the generator")
+    args = parser.parse_args()
+    written = materialize_dataset(args.data_dir, args.seed)
+    print(f"Wrote {written['tables']['subscriptions']['rows']:,} subscription rows to {dataset_path(args.data_dir, args.seed)}")
@@ -0,0 +1,172 @@
+# Per-stage latency instrumentation for the dashboard's hot paths.
+#
+# Code under measurement runs inside `with stage("fetch") as record:` and may set
+# record.rows / record.bytes. Every completed stage is added to a process-wide
+# registry that keeps the most recent durations per stage, from which the
+# diagnostics panel and the Prometheus text endpoint report p50/p95 latencies.
+# Stages are also written as structured log records (logfmt message, fields in
+# `extra`): at DEBUG, or at INFO when slower than SLOW_STAGE_SECONDS, so a rerun
+# (one render stage per chart, every auto-refresh) does not flood the log.
+
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Durations kept per stage for the percentiles
+WINDOW = 1024
+QUANTILES = [0.5, 0.95]
+# Stages at least this slow are logged at INFO, the rest at DEBUG
+SLOW_STAGE_SECONDS = 1.0
+
+
+class StageRecord:
+    def __init__(self, name):
+        self.name = name
+        self.rows = None
+        self.bytes = None
+        self.seconds = None
+
+
+class StageMetrics:
+    def __init__(self, window=WINDOW):
+        self.window = window
+        self._durations = {}
+        self._totals = {}
+        self._lock = threading.Lock()
+
+    def _totals_for(self, name):
+        totals = self._totals.get(name)
+        if totals is None:
+            self._durations[name] = deque(maxlen=self.window)
+            totals = self._totals[name] = {"count": 0, "seconds": 0.0, "rows": 0, "bytes": 0, "errors": 0}
+        return totals
+
+    def record(self, name, seconds, rows=None, bytes=None):
+        with self._lock:
+            totals = self._totals_for(name)
+            self._durations[name].append(seconds)
+            totals["count"] += 1
+            totals["seconds"] += seconds
+            totals["rows"] += rows or 0
+            totals["bytes"] += bytes or 0
+
+    def record_error(self, name):
+        with self._lock:
+            self._totals_for(name)["errors"] += 1
+
+    # One row per stage: counts, totals and latency percentiles over the window
+    def summary(self):
+        with self._lock:
+            stages = {name: (np.array(durations), dict(self._totals[name])) for name, durations in self._durations.items()}
+        rows = []
+        for name, (durations, totals) in sorted(stages.items()):
+            row = {"stage": name, **totals}
+            for quantile in QUANTILES:
+                row[f"p{round(quantile * 100)}_ms"] = float(np.quantile(durations, quantile)) * 1000 if len(durations) else None
+            row["max_ms"] = float(durations.max()) * 1000 if len(durations) else None
+            rows.append(row)
+        return pd.DataFrame(rows, columns=[
+            "stage", "count", "errors", "p50_ms", "p95_ms", "max_ms", "seconds", "rows", "bytes"
+        ])
+
+    def reset(self):
+        with self._lock:
+            self._durations = {}
+            self._totals = {}
+
+
+# Process-wide registry (shared by every session and the refresher threads)
+stage_metrics = StageMetrics()
+
+
+# Add one completed stage to the registry and the log
+def record_stage(name, seconds, rows=None, bytes=None):
+    stage_metrics.record(name, seconds, rows, bytes)
+    fields = {"stage": name, "seconds": round(seconds, 6), "rows": rows, "bytes": bytes}
+    message = " ".join(f"{key}={value}" for key, value in fields.items() if value is not None)
+    logger.log(logging.INFO if seconds >= SLOW_STAGE_SECONDS else logging.DEBUG, message, extra=fields)
+
+
+# Time the enclosed block as stage `name`. Failed blocks count as errors and are
+# not added to the latency window. Stages may nest (a fetch includes its normalize).
+@contextmanager
+def stage(name, rows=None, bytes=None):
+    record = StageRecord(name)
+    record.rows, record.bytes = rows, bytes
+    started = time.perf_counter()
+    try:
+        yield record
+    except Exception:
+        stage_metrics.record_error(name)
+        raise
+    record.seconds = time.perf_counter() - started
+    record_stage(name, record.seconds, record.rows, record.bytes)
+
+
+# Decorator form of stage()
+def timed(name):
+    def decorate(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+# Prometheus text exposition of the stage registry. `gauges` adds further
+# name -> value samples (cache counters, snapshot ages).
+def prometheus_text(gauges=None, prefix="trackmonitor"):
+    summary = stage_metrics.summary()
+    lines = [
+        f"# HELP {prefix}_stage_seconds Latency of dashboard stages over the last {stage_metrics.window} runs.",
+        f"# TYPE {prefix}_stage_seconds summary"
+    ]
+    for row in summary.to_dict("records"):
+        if not row["count"]:
+            continue
+        label = f'stage="{row["stage"]}"'
+        for quantile in QUANTILES:
+            lines.append(f'{prefix}_stage_seconds{{{label},quantile="{quantile}"}} {row[f"p{round(quantile * 100)}_ms"] / 1000:.6f}')
+        lines.append(f"{prefix}_stage_seconds_sum{{{label}}} {row['seconds']:.6f}")
+        lines.append(f"{prefix}_stage_seconds_count{{{label}}} {row['count']}")
+    for counter in ["rows", "bytes", "errors"]:
+        lines.append(f"# TYPE {prefix}_stage_{counter}_total counter")
+        for row in summary.to_dict("records"):
+            lines.append(f'{prefix}_stage_{counter}_total{{stage="{row["stage"]}"}} {row[counter]}')
+    for name, value in (gauges or {}).items():
+        lines.append(f"# TYPE {prefix}_{name} gauge")
+        lines.append(f"{prefix}_{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+# Serve prometheus_text(gauges()) at /metrics on `port`, from a daemon thread
+def start_metrics_server(port, gauges=None, host="0.0.0.0"):
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = prometheus_text(gauges() if gauges else None).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics server", daemon=True).start()
+    logger.info(f"Serving Prometheus metrics on port {port}")
+    return server
@@ -0,0 +1,128 @@
+# Process-pool execution of the Trends comparison lookups.
+#
+# The period totals behind Trends Comparison are differences of the rollup cube's
+# per-client cumulative sums. ComparisonPool splits the selected tracks (Clients)
+# into one partition per worker and looks each partition up in a separate process.
+# The cumulative array is published once per cube as a shared memory segment that
+# workers map by name, so no frame or array is pickled per call, only client codes
+# and day bounds. Selections under MIN_CELLS track x metric cells are looked up
+# in-process, where handing the work to the pool costs more than it saves.
+#
+# Each lookup is a few fancy-indexed subtractions, and the pool does not pay off
+# at dashboard sizes: over two years of days, a full 34 track x 15 metric
+# selection (510 cells) took 3.3 ms serially and 3.6 ms on 4 workers (after
+# start-up, which alone takes over a second), and the pool did not pull ahead
+# below about 60,000 cells (measured on a single-core host). Keep it off unless
+# `benchmark.py --compare-workers <n> --compare-min-cells 0` shows a crossover on
+# the deployment host, and set TRACKMONITOR_COMPARE_MIN_CELLS to it.
+#
+# Workers import only this module and numpy (processes are spawned, not forked
+# from the threaded Streamlit server).
+
+import logging
+import multiprocessing
+import threading
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Default smallest track x metric selection sent to the pool
+MIN_CELLS = 60_000
+
+
+# (period, client, metric) totals from a (client, day + 1, metric) cumulative
+# array: cumulative[last + 1] - cumulative[first] for each (first, last) day
+# bound, or zeros for an empty bound
+def period_range_totals(cumulative, codes, positions, bounds):
+    totals = np.zeros((len(bounds), len(codes), len(positions)), dtype=np.int64)
+    selected = cumulative[codes][:, :, positions]
+    for period, (first, last) in enumerate(bounds):
+        if last >= first:
+            totals[period] = selected[:, last + 1] - selected[:, first]
+    return totals
+
+
+# Segments mapped by this worker process, by name. A new cube's segment replaces
+# the previous one, which the parent has unlinked by then. Workers share the
+# parent's resource tracker, so attaching does not make them unlink it on exit.
+_attached = {}
+
+
+def _partition_totals(name, shape, codes, positions, bounds):
+    if name not in _attached:
+        for segment in _attached.values():
+            segment.close()
+        _attached.clear()
+        _attached[name] = shared_memory.SharedMemory(name=name)
+    cumulative = np.ndarray(shape, dtype=np.int64, buffer=_attached[name].buf)
+    return period_range_totals(cumulative, codes, positions, bounds)
+
+
+def _release(segment):
+    segment.close()
+    segment.unlink()
+
+
+class ComparisonPool:
+    def __init__(self, workers, min_cells=MIN_CELLS):
+        self.workers = workers
+        # Selections with fewer track x metric cells run serially
+        self.min_cells = min_cells
+        self._executor = None
+        self._segments = {}
+        # Reentrant: a replaced cube can be collected (and its segment dropped)
+        # while a new segment is being published
+        self._lock = threading.RLock()
+
+    def should_split(self, track_count, metric_count):
+        return self.workers > 1 and track_count > 1 and track_count * metric_count >= self.min_cells
+
+    def _pool(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            logger.info(f"Comparison pool started with {self.workers} worker processes")
+        return self._executor
+
+    # Name of the shared copy of `cumulative`, created on first use and unlinked
+    # when the array is garbage collected (i.e. its cube was replaced)
+    def _segment_name(self, cumulative):
+        key = id(cumulative)
+        segment = self._segments.get(key)
+        if segment is None:
+            segment = shared_memory.SharedMemory(create=True, size=max(cumulative.nbytes, 1))
+            np.ndarray(cumulative.shape, dtype=np.int64, buffer=segment.buf)[...] = cumulative
+            self._segments[key] = segment
+            weakref.finalize(cumulative, self._drop_segment, key)
+            logger.info(f"Published {cumulative.nbytes / 1024 / 1024:.1f} MB of cumulative sums to shared memory")
+        return segment.name
+
+    def _drop_segment(self, key):
+        with self._lock:
+            segment = self._segments.pop(key, None)
+        if segment is not None:
+            _release(segment)
+
+    # Same result as period_range_totals(cumulative, ...), one client partition
+    # per worker, merged back in the order of `codes`
+    def period_totals(self, cumulative, codes, positions, bounds):
+        with self._lock:
+            name = self._segment_name(cumulative)
+            executor = self._pool()
+        futures = [
+            executor.submit(_partition_totals, name, cumulative.shape, partition, positions, bounds)
+            for partition in np.array_split(codes, min(self.workers, len(codes)))
+        ]
+        return np.concatenate([future.result() for future in futures], axis=1)
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+            segments, self._segments = list(self._segments.values()), {}
+        if executor is not None:
+            executor.shutdown()
+        for segment in segments:
+            _release(segment)
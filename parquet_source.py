@@ -0,0 +1,323 @@
+# Out-of-core mode: local Parquet files queried by an embedded DuckDB engine.
+#
+# Subscriptions are written chunk by chunk (as they are generated or streamed
+# from the database) to a Parquet dataset in hive layout, partitioned by Client
+# and month: <version>/Client=<client>/Month=<yyyy-mm-01>/part_<uuid>.parquet.
+# Every full refresh writes a new version directory, so queries running against
+# the previous one are never disturbed; incremental refreshes only add complete
+# files to the newest version.
+#
+# ParquetSource answers the same calls as aggregations.RollupCube with DuckDB
+# queries over those files (partition pruning on Client and Month, filters on
+# Date, SUM / GROUP BY in the engine). Only the aggregated rows reach pandas, so
+# memory stays flat however long the history is.
+
+import logging
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import stage
+from schema import METRIC_COLUMNS
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+logger = logging.getLogger(__name__)
+
+PARQUET_METRICS = METRIC_COLUMNS + ["TotalChurn"]
+# Dimensions that can be grouped on or listed; identifiers in generated SQL only
+# ever come from these whitelists, every value is a bound parameter
+PARQUET_DIMENSIONS = ["Client", "Region", "SKU", "Status", "PaymentMethod"]
+GRAIN_UNITS = {"W": "week", "M": "month"}
+DONE_FILE = "_SUCCESS"
+
+
+def _metric_expression(metric):
+    if metric == "TotalChurn":
+        return '("InvoluntaryChurn" + "VoluntaryChurn")'
+    return f'"{metric}"'
+
+
+def _connect(memory_limit=None, threads=None):
+    if duckdb is None:
+        raise ImportError("duckdb is not installed.")
+    connection = duckdb.connect()
+    if memory_limit:
+        connection.execute(f"SET memory_limit = '{memory_limit}'")
+    if threads:
+        connection.execute(f"SET threads = {int(threads)}")
+    # Aggregations do not need input order; this lets large scans stream
+    connection.execute("SET preserve_insertion_order = false")
+    return connection
+
+
+# Writes normalized subscription chunks into one new dataset version
+class ParquetDatasetWriter:
+    def __init__(self, path, connection=None):
+        self.path = path
+        self.rows = 0
+        self.chunks = 0
+        self._connection = connection or _connect()
+        os.makedirs(path, exist_ok=True)
+
+    def add(self, chunk):
+        if not len(chunk):
+            return
+        # Chunks are normalized one at a time, so each may have its own metric
+        # widths; every file gets int64 metrics so the dataset has one schema
+        chunk = chunk.astype({
+            column: np.int64 for column in METRIC_COLUMNS
+            if column in chunk.columns and pd.api.types.is_integer_dtype(chunk[column].dtype)
+        })
+        with stage("write", rows=len(chunk)):
+            self._connection.register("chunk", chunk)
+            try:
+                self._connection.execute(f"""
+                    COPY (SELECT *, CAST(date_trunc('month', "Date") AS DATE) AS "Month" FROM chunk)
+                    TO '{self.path}' (FORMAT parquet, PARTITION_BY ("Client", "Month"), APPEND, FILENAME_PATTERN 'part_{{uuid}}')
+                """)
+            finally:
+                self._connection.unregister("chunk")
+        self.rows += len(chunk)
+        self.chunks += 1
+
+    # Mark the version complete; readers only open completed versions
+    def close(self):
+        with open(os.path.join(self.path, DONE_FILE), "w") as f:
+            f.write(f"{self.rows}\n")
+        logger.info(f"Wrote Parquet dataset {self.path}: {self.rows:,} rows in {self.chunks} chunk(s)")
+
+
+# Versioned Parquet copies of one source under `root`. write() streams chunks
+# into a new version and drops all but the newest `keep_versions`.
+class ParquetDataset:
+    def __init__(self, root, keep_versions=2, memory_limit=None, threads=None):
+        self.root = root
+        self.keep_versions = keep_versions
+        self.memory_limit = memory_limit
+        self.threads = threads
+        os.makedirs(root, exist_ok=True)
+
+    def versions(self):
+        names = [
+            name for name in os.listdir(self.root)
+            if os.path.exists(os.path.join(self.root, name, DONE_FILE))
+        ]
+        return sorted(names)
+
+    # Path of the newest completed version, or None
+    def latest(self):
+        versions = self.versions()
+        return os.path.join(self.root, versions[-1]) if versions else None
+
+    def write(self, chunks):
+        path = os.path.join(self.root, f"v{time.time_ns()}")
+        writer = ParquetDatasetWriter(path, _connect(self.memory_limit, self.threads))
+        try:
+            for chunk in chunks:
+                writer.add(chunk)
+        except Exception:
+            shutil.rmtree(path, ignore_errors=True)
+            raise
+        writer.close()
+        self._prune()
+        return path
+
+    # Append chunks to the newest version. They are written to a staging
+    # directory and each file is renamed into the version's partitions, so
+    # readers only ever see complete files. Returns the number of rows appended.
+    def append(self, chunks):
+        target = self.latest()
+        if target is None:
+            raise FileNotFoundError(f"No Parquet dataset in {self.root}")
+        staging = os.path.join(self.root, f"_append_{time.time_ns()}")
+        writer = ParquetDatasetWriter(staging, _connect(self.memory_limit, self.threads))
+        try:
+            for chunk in chunks:
+                writer.add(chunk)
+            for directory, _, files in os.walk(staging):
+                partition = os.path.join(target, os.path.relpath(directory, staging))
+                for name in files:
+                    os.makedirs(partition, exist_ok=True)
+                    os.replace(os.path.join(directory, name), os.path.join(partition, name))
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        if writer.rows:
+            logger.info(f"Appended {writer.rows:,} rows in {writer.chunks} chunk(s) to {target}")
+        return writer.rows
+
+    def _prune(self):
+        for name in self.versions()[:-self.keep_versions]:
+            shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+
+    # Query source over the newest version
+    def source(self):
+        path = self.latest()
+        if path is None:
+            raise FileNotFoundError(f"No Parquet dataset in {self.root}")
+        return ParquetSource(path, self.memory_limit, self.threads)
+
+
+# Keeps a ParquetDataset in step with an append-mostly table. `read_chunks(after_id)`
+# yields normalized chunks of the rows with Id > after_id (every row for None).
+# Refreshes append only the rows past the highest Id written; the whole table is
+# rewritten into a new version every `full_refresh_interval` seconds (0: on every
+# refresh) to pick up updates and deletes, and after a failed append.
+class IncrementalParquetMirror:
+    def __init__(self, dataset, read_chunks, full_refresh_interval=900):
+        self.dataset = dataset
+        self.read_chunks = read_chunks
+        self.full_refresh_interval = full_refresh_interval
+        self.source = None
+        # Bumped whenever the dataset changed
+        self.version = 0
+        self.high_water_mark = None
+        self.last_full_refresh = 0.0
+        self._lock = threading.Lock()
+
+    def _tracked(self, chunks):
+        for chunk in chunks:
+            if len(chunk):
+                last_id = chunk["Id"].max()
+                if self.high_water_mark is None or last_id > self.high_water_mark:
+                    self.high_water_mark = last_id
+            yield chunk
+
+    def refresh(self):
+        with self._lock:
+            now = time.time()
+            if self.source is None or now - self.last_full_refresh >= self.full_refresh_interval:
+                self.high_water_mark = None
+                self.dataset.write(self._tracked(self.read_chunks(None)))
+                self.last_full_refresh = now
+            else:
+                try:
+                    if not self.dataset.append(self._tracked(self.read_chunks(self.high_water_mark))):
+                        return self.source
+                except Exception:
+                    # Some files may have been moved in: rewrite everything next time
+                    self.last_full_refresh = 0.0
+                    raise
+            self.source = self.dataset.source()
+            self.version += 1
+            return self.source
+
+
+# Query source over one dataset version. Files are read with union_by_name, so
+# a column that differs in type between files (a metric written as DOUBLE from a
+# chunk with nulls) is widened to a common type instead of failing the cast.
+class ParquetSource:
+    def __init__(self, path, memory_limit=None, threads=None):
+        self.path = path
+        self._connection = _connect(memory_limit, threads)
+        self._connection.execute(f"""
+            CREATE VIEW subscriptions AS
+            SELECT * FROM read_parquet('{os.path.join(path, "**", "*.parquet")}',
+                hive_partitioning = true, hive_types = {{'Client': VARCHAR, 'Month': DATE}},
+                union_by_name = true)
+        """)
+        self._lock = threading.Lock()
+
+    # Run a query on its own cursor (DuckDB cursors are per-thread connections)
+    def query(self, sql, params=None):
+        with self._lock:
+            cursor = self._connection.cursor()
+        try:
+            with stage("fetch") as record:
+                result = cursor.execute(sql, params or {}).df()
+                record.rows = len(result)
+        finally:
+            cursor.close()
+        return result
+
+    def _where(self, client=None, region=None, start=None, end=None, clients=None):
+        conditions, params = [], {}
+        if client is not None:
+            conditions.append('"Client" = $client')
+            params["client"] = str(client)
+        if clients is not None:
+            conditions.append('"Client" IN (SELECT unnest($clients))')
+            params["clients"] = [str(value) for value in clients]
+        if region is not None:
+            conditions.append('"Region" = $region')
+            params["region"] = region
+        if start is not None:
+            # Month bounds prune partitions; Date bounds filter the rows
+            conditions.append("\"Month\" >= CAST(date_trunc('month', CAST($start AS TIMESTAMP)) AS DATE)")
+            conditions.append('"Date" >= $start')
+            params["start"] = pd.Timestamp(start).to_pydatetime()
+        if end is not None:
+            conditions.append('"Month" <= CAST($end AS DATE)')
+            conditions.append('"Date" <= $end')
+            params["end"] = pd.Timestamp(end).to_pydatetime()
+        return (" WHERE " + " AND ".join(conditions)) if conditions else "", params
+
+    def _sums(self, metrics):
+        return ", ".join(f'CAST(SUM({_metric_expression(metric)}) AS BIGINT) AS "{metric}"' for metric in metrics)
+
+    def _fill(self, result, metrics):
+        for metric in metrics:
+            result[metric] = pd.to_numeric(result[metric]).fillna(0).astype(np.int64)
+        return result
+
+    def dimension_values(self, dimension):
+        if dimension not in PARQUET_DIMENSIONS:
+            raise ValueError(f"Unknown dimension: {dimension}")
+        result = self.query(f'SELECT DISTINCT "{dimension}" AS value FROM subscriptions')
+        return sorted(result["value"].dropna().astype(str))
+
+    def totals(self, client, region=None, start=None, end=None):
+        where, params = self._where(client, region, start, end)
+        result = self._fill(self.query(f"SELECT {self._sums(PARQUET_METRICS)} FROM subscriptions{where}", params), PARQUET_METRICS)
+        return result.iloc[0]
+
+    def range_total(self, client, metric, start=None, end=None, region=None):
+        where, params = self._where(client, region, start, end)
+        result = self._fill(self.query(f"SELECT {self._sums([metric])} FROM subscriptions{where}", params), [metric])
+        return result[metric].iloc[0]
+
+    def by_dimension(self, dimension, measures, client, region=None, start=None, end=None):
+        if dimension not in PARQUET_DIMENSIONS:
+            raise ValueError(f"Unknown dimension: {dimension}")
+        where, params = self._where(client, region, start, end)
+        sql = (
+            f'SELECT "{dimension}", {self._sums(measures)} FROM subscriptions{where}'
+            f' GROUP BY "{dimension}" ORDER BY "{dimension}"'
+        )
+        return self._fill(self.query(sql, params), measures)
+
+    # Totals per day, or per week / month bucketed by the engine
+    def over_time(self, measures, client, region=None, start=None, end=None, grain="D"):
+        where, params = self._where(client, region, start, end)
+        bucket = '"Date"' if grain == "D" else f"date_trunc('{GRAIN_UNITS[grain]}', \"Date\")"
+        sql = f'SELECT {bucket} AS "Date", {self._sums(measures)} FROM subscriptions{where} GROUP BY 1 ORDER BY 1'
+        result = self._fill(self.query(sql, params), measures)
+        result["Date"] = pd.to_datetime(result["Date"])
+        return result
+
+    # (period, track, metric) totals: one conditional SUM per period and metric
+    def period_totals(self, tracks, metrics, periods):
+        tracks, metrics = list(tracks), list(metrics)
+        where, params = self._where(clients=tracks)
+        select, period_conditions = ['"Client"'], []
+        for i, (start, end) in enumerate(periods):
+            params[f"start_{i}"], params[f"end_{i}"] = pd.Timestamp(start).to_pydatetime(), pd.Timestamp(end).to_pydatetime()
+            condition = f'"Date" >= $start_{i} AND "Date" <= $end_{i}'
+            period_conditions.append(f"({condition})")
+            select.extend(
+                f'CAST(SUM(CASE WHEN {condition} THEN {_metric_expression(metric)} ELSE 0 END) AS BIGINT) AS "{metric}_{i}"'
+                for metric in metrics
+            )
+        sql = f"SELECT {', '.join(select)} FROM subscriptions{where} AND ({' OR '.join(period_conditions)}) GROUP BY \"Client\""
+        result = self.query(sql, params).set_index("Client").reindex([str(track) for track in tracks]).fillna(0)
+        return np.stack([
+            result[[f"{metric}_{i}" for metric in metrics]].to_numpy(dtype=np.int64)
+            for i in range(len(periods))
+        ])
@@ -0,0 +1,171 @@
+# Background refresh of the dashboard's data.
+#
+# A BackgroundRefresher owns one daemon thread that calls its `build` function
+# every `interval` seconds, off the request path. Each result is published as an
+# immutable Snapshot with a single reference assignment (the "pointer swap"), so
+# script reruns only ever read `refresher.snapshot`: a complete, ready snapshot
+# that never changes underneath them, and never a fetch in progress.
+#
+# SnapshotStore keeps one refresher per data source and connection identity for
+# the whole process, reference-counted by the sessions reading it. Every session
+# on a source shares one copy of its data and one refresh schedule; the refresher
+# stops and its snapshot is dropped once no session holds it.
+
+import logging
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+# `aggregates` answers the dashboard's queries (RollupCube, PushdownSqlSource,
+# BigQuerySource or ParquetSource); raw rows are not kept once it is built.
+# `token` identifies the source data: a build with the same token as the current
+# snapshot is not published, so `version` only changes when the data did.
+Snapshot = namedtuple("Snapshot", [
+    "version", "built_at", "token", "churn_triggers", "top_promotions", "top_coupons", "aggregates"
+])
+
+
+class BackgroundRefresher:
+    # `build()` returns the Snapshot fields other than version and built_at, as a
+    # dict. interval=None builds once (static data).
+    def __init__(self, build, interval=10, name="refresher"):
+        self.build = build
+        self.interval = interval
+        self.name = name
+        self.snapshot = None
+        self.last_error = None
+        self._ready = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+
+    def _refresh(self):
+        started = time.time()
+        try:
+            fields = self.build()
+        except Exception as e:
+            # Keep serving the previous snapshot
+            self.last_error = e
+            logger.error(f"{self.name}: refresh failed: {str(e)}")
+        else:
+            self.last_error = None
+            if self.snapshot is not None and fields["token"] == self.snapshot.token:
+                return
+            version = self.snapshot.version + 1 if self.snapshot is not None else 1
+            self.snapshot = Snapshot(version=version, built_at=time.time(), **fields)
+            logger.info(f"{self.name}: published snapshot {version} ({time.time() - started:.2f}s)")
+        finally:
+            self._ready.set()
+
+    def _run(self):
+        self._refresh()
+        while self.interval and not self._stop.wait(self.interval):
+            self._refresh()
+
+    # Start the thread and wait for the first build. Raises its error if it
+    # failed, so a bad connection is reported to the caller (and not cached).
+    def start(self, timeout=None):
+        self._thread.start()
+        self._ready.wait(timeout)
+        if self.snapshot is None:
+            self.stop()
+            raise self.last_error or TimeoutError(f"{self.name}: first refresh timed out")
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    @property
+    def running(self):
+        return self._thread.is_alive()
+
+    # Stopped by its store (or a failed start); it publishes nothing more
+    @property
+    def stopped(self):
+        return self._stop.is_set()
+
+
+class SnapshotStore:
+    # `start(key)` returns a started refresher for a key. Holders (sessions) not
+    # seen for `holder_ttl` seconds are dropped, since browser sessions can end
+    # without releasing anything.
+    def __init__(self, start, holder_ttl=3600):
+        self.start = start
+        self.holder_ttl = holder_ttl
+        self._refreshers = {}
+        self._holders = {}
+        # Future of each key whose first snapshot is being built
+        self._starting = {}
+        self._lock = threading.Lock()
+
+    # Refresher for `key`, started if no session holds one yet. `holder` counts
+    # as a reader until released. Sessions acquiring a key while its first
+    # snapshot is being built wait for that build instead of starting their own.
+    def acquire(self, key, holder):
+        while True:
+            with self._lock:
+                refresher = self._refreshers.get(key)
+                if refresher is not None:
+                    self._holders[key][holder] = time.time()
+                    return refresher
+                starting = self._starting.get(key)
+                if starting is None:
+                    starting = self._starting[key] = Future()
+                    break
+            # Raises the first build's error, like starting it here would
+            starting.result()
+        # Build outside the lock: the first snapshot can take a while
+        try:
+            refresher = self.start(key)
+        except Exception as e:
+            with self._lock:
+                del self._starting[key]
+            starting.set_exception(e)
+            raise
+        with self._lock:
+            del self._starting[key]
+            self._refreshers[key] = refresher
+            self._holders[key] = {holder: time.time()}
+        starting.set_result(refresher)
+        logger.info(f"Snapshot store: started {refresher.name}")
+        return refresher
+
+    # Mark `holder` as still reading `key` (reruns that skip acquire, such as
+    # fragment reruns, call this so the holder does not expire)
+    def touch(self, key, holder):
+        with self._lock:
+            holders = self._holders.get(key)
+            if holders is not None and holder in holders:
+                holders[holder] = time.time()
+
+    def release(self, key, holder):
+        with self._lock:
+            holders = self._holders.get(key)
+            if holders is None or holders.pop(holder, None) is None:
+                return
+        self._drop_unheld()
+
+    def _drop_unheld(self):
+        now = time.time()
+        stopped = []
+        with self._lock:
+            for key, holders in list(self._holders.items()):
+                for holder, seen in list(holders.items()):
+                    if now - seen > self.holder_ttl:
+                        del holders[holder]
+                if not holders:
+                    stopped.append(self._refreshers.pop(key))
+                    del self._holders[key]
+        for refresher in stopped:
+            refresher.stop()
+            logger.info(f"Snapshot store: stopped {refresher.name} (no sessions left)")
+
+    # Drop holders that went quiet (the app sweeps on every rerun)
+    def sweep(self):
+        self._drop_unheld()
+
+    def holder_counts(self):
+        with self._lock:
+            return {key: len(holders) for key, holders in self._holders.items()}
@@ -0,0 +1,130 @@
+# Process-wide cache of results computed from data snapshots.
+#
+# Entries are keyed by the data version they were computed from: the snapshot key
+# of their source and the snapshot's version, which a refresher only bumps when
+# the source actually changed. A refresh therefore only makes the entries of the
+# changed source stale (retain() drops them); everything else stays cached until
+# LRU eviction under the entry-count and byte budgets.
+
+import logging
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import stage
+
+logger = logging.getLogger(__name__)
+
+
+# Approximate memory held by a cached result
+def result_size(value):
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    if hasattr(value, "to_plotly_json"):
+        # Plotly figure: the size of its JSON spec
+        return len(value.to_json())
+    return sys.getsizeof(value)
+
+
+# Hashable form of call arguments (lists and dicts become tuples)
+def _freeze(value):
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    return value
+
+
+class VersionedCache:
+    def __init__(self, max_bytes=256 * 1024 * 1024, max_entries=4096):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        # (source, version, key) -> (value, size), least recently used first
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or self.bytes > self.max_bytes):
+            _, (_, size) = self._entries.popitem(last=False)
+            self.bytes -= size
+
+    # Cached result for `key` at (source, version), computed on a miss. Results
+    # are shared between sessions and must not be modified in place.
+    def get_or_compute(self, source, version, key, compute):
+        entry_key = (source, version, key)
+        with self._lock:
+            entry = self._entries.get(entry_key)
+            if entry is not None:
+                self._entries.move_to_end(entry_key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+        value = compute()
+        size = result_size(value)
+        with self._lock:
+            if entry_key not in self._entries:
+                self._entries[entry_key] = (value, size)
+                self.bytes += size
+                self._evict()
+        return value
+
+    # Drop the entries of `source` computed from any version other than `version`
+    def retain(self, source, version):
+        with self._lock:
+            stale = [entry_key for entry_key in self._entries if entry_key[0] == source and entry_key[1] != version]
+            for entry_key in stale:
+                self.bytes -= self._entries.pop(entry_key)[1]
+        if stale:
+            logger.info(f"Result cache: dropped {len(stale)} entries of an older data version")
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self.bytes, "hits": self.hits, "misses": self.misses}
+
+
+# Aggregates source (RollupCube, PushdownSqlSource, BigQuerySource) whose answers
+# are memoized in a VersionedCache under (source, version)
+class CachedAggregates:
+    def __init__(self, aggregates, cache, source, version):
+        self.aggregates = aggregates
+        self.cache = cache
+        self.source = source
+        self.version = version
+
+    def _cached(self, method, *args, **kwargs):
+        key = (method, _freeze(args), _freeze(kwargs))
+        def compute():
+            with stage("aggregate") as record:
+                result = getattr(self.aggregates, method)(*args, **kwargs)
+                if isinstance(result, (pd.DataFrame, pd.Series, np.ndarray, list)):
+                    record.rows = len(result)
+                return result
+        return self.cache.get_or_compute(self.source, self.version, key, compute)
+
+    def dimension_values(self, dimension):
+        return self._cached("dimension_values", dimension)
+
+    def totals(self, client, region=None, start=None, end=None):
+        return self._cached("totals", client, region, start, end)
+
+    def range_total(self, client, metric, start=None, end=None, region=None):
+        return self._cached("range_total", client, metric, start, end, region)
+
+    def by_dimension(self, dimension, measures, client, region=None, start=None, end=None):
+        return self._cached("by_dimension", dimension, measures, client, region, start, end)
+
+    def over_time(self, measures, client, region=None, start=None, end=None, grain="D"):
+        return self._cached("over_time", measures, client, region, start, end, grain)
+
+    def period_totals(self, tracks, metrics, periods):
+        return self._cached("period_totals", tracks, metrics, periods)
@@ -0,0 +1,135 @@
+# Schema normalization shared by every data source (Dummy Data, Microsoft SQL
+# Server, BigQuery). Sources hand over whatever frame they produced and get back
+# the dashboard's compact columnar layout:
+#   - snake_case warehouse columns renamed to the dashboard's CamelCase names
+#   - dimension columns dictionary-encoded as pandas categoricals
+#   - metric columns downcast to the narrowest integer dtype that holds them
+#   - Date parsed to datetime64 exactly once
+
+import logging
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import stage
+
+logger = logging.getLogger(__name__)
+
+# Warehouse column -> dashboard column
+SQL_COLUMN_MAP = {
+    "id": "Id",
+    "date": "Date",
+    "region": "Region",
+    "sku": "SKU",
+    "client": "Client",
+    "status": "Status",
+    "subscribers": "Subscribers",
+    "revenue": "Revenue",
+    "payment_method": "PaymentMethod",
+    "free_trials": "FreeTrials",
+    "new_orders": "NewOrders",
+    "conversions": "Conversions",
+    "redemptions": "Redemptions",
+    "registrations": "Registrations",
+    "active_paid": "ActivePaid",
+    "renewals": "Renewals",
+    "payment_amount": "PaymentAmount",
+    "refund_amount": "RefundAmount",
+    "involuntary_churn": "InvoluntaryChurn",
+    "voluntary_churn": "VoluntaryChurn",
+    "winbacks": "Winbacks"
+}
+
+DIMENSION_COLUMNS = ["Region", "SKU", "Client", "Status", "PaymentMethod"]
+
+METRIC_COLUMNS = [
+    "Subscribers", "Revenue", "FreeTrials", "NewOrders", "Conversions", "Redemptions",
+    "Registrations", "ActivePaid", "Renewals", "PaymentAmount", "RefundAmount",
+    "InvoluntaryChurn", "VoluntaryChurn", "Winbacks"
+]
+
+
+def frame_memory_mb(df):
+    return df.memory_usage(deep=True).sum() / (1024 * 1024)
+
+
+INTEGER_DTYPES = [np.int8, np.int16, np.int32, np.int64]
+
+
+# Narrowest dtype for one metric column. Integral columns (including floats that
+# only hold whole numbers, as drivers return for nullable INT columns without
+# nulls) become the smallest signed integer that fits; anything with nulls or
+# fractions is left as it is.
+def _compact_metric(values):
+    if not pd.api.types.is_numeric_dtype(values.dtype):
+        values = pd.to_numeric(values, errors="coerce")
+    array = values.to_numpy()
+    if len(array) == 0:
+        return values
+    if pd.api.types.is_float_dtype(array.dtype):
+        if np.isnan(array).any() or not np.array_equal(array, np.trunc(array)):
+            return values
+    low, high = array.min(), array.max()
+    for dtype in INTEGER_DTYPES:
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return values if array.dtype == dtype else values.astype(dtype)
+    return values
+
+
+# Normalize a subscriptions frame from any source. Returns the normalized frame
+# and a memory report ({"rows", "before_mb", "after_mb"}). Columns that already
+# have the target dtype are left untouched, so memory-mapped frames stay mapped.
+# Streaming readers pass log=False per chunk and report the total themselves.
+def normalize_subscriptions(df, source="data", log=True):
+    with stage("normalize") as record:
+        before_mb = frame_memory_mb(df)
+        # copy=False so renaming does not duplicate (or un-map) the column data
+        df = df.rename(columns={column: SQL_COLUMN_MAP[column] for column in df.columns if column in SQL_COLUMN_MAP}, copy=False)
+
+        for column in df.columns:
+            values = df[column]
+            if column == "Date":
+                if isinstance(values.dtype, pd.DatetimeTZDtype):
+                    df[column] = values.dt.tz_localize(None)
+                elif not pd.api.types.is_datetime64_dtype(values.dtype):
+                    df[column] = pd.to_datetime(values)
+            elif column in DIMENSION_COLUMNS:
+                if not isinstance(values.dtype, pd.CategoricalDtype):
+                    df[column] = values.astype("category")
+                elif not values.cat.categories.is_monotonic_increasing:
+                    # Sorted categories, so breakdowns list values in the same order for every source
+                    df[column] = values.cat.reorder_categories(values.cat.categories.sort_values())
+            elif column in METRIC_COLUMNS:
+                compact = _compact_metric(values)
+                if compact.dtype != values.dtype:
+                    df[column] = compact
+
+        after_mb = frame_memory_mb(df)
+        record.rows, record.bytes = len(df), int(after_mb * 1024 * 1024)
+    memory_report = {"rows": len(df), "before_mb": before_mb, "after_mb": after_mb}
+    if log:
+        logger.info(f"Normalized {source}: {len(df):,} rows, {before_mb:,.1f} MB -> {after_mb:,.1f} MB")
+    return df, memory_report
+
+
+# Concatenate normalized frames, unioning the (sorted) categories of each
+# dimension so the result stays dictionary-encoded (plain pd.concat falls back
+# to object columns when categories differ).
+def concat_normalized(frames):
+    frames = [df for df in frames if df is not None]
+    non_empty = [df for df in frames if len(df)]
+    if len(non_empty) <= 1:
+        return non_empty[0] if non_empty else frames[0]
+    for column in DIMENSION_COLUMNS:
+        if column not in non_empty[0].columns:
+            continue
+        categories = pd.Index(non_empty[0][column].cat.categories)
+        for df in non_empty[1:]:
+            categories = categories.append(df[column].cat.categories.difference(categories, sort=False))
+        categories = categories.sort_values()
+        non_empty = [
+            df if df[column].cat.categories.equals(categories) else df.assign(**{column: df[column].cat.set_categories(categories)})
+            for df in non_empty
+        ]
+    return pd.concat(non_empty, ignore_index=True)
@@ -0,0 +1,393 @@
+# Microsoft SQL Server access for the dashboard.
+#
+# IncrementalSqlLoader keeps the rollup cube of the subscriptions table for one
+# connection and refreshes it from a high-water mark: each refresh only selects
+# rows past the last seen `id` (or `date`) and merges them into the cube. The raw
+# rows are not kept, apart from the last loaded day in `date` mode. A full reload
+# every `full_refresh_interval` seconds reconciles late corrections.
+#
+# Engines come from a process-wide registry (get_engine), so every session and
+# every source for the same server shares one connection pool.
+#
+# Extracts are streamed in chunks of CHUNK_ROWS rows from a server-side cursor.
+# Each chunk is normalized (and summed into the rollup cube) as it arrives, so
+# the raw driver rows of at most one chunk are in memory at a time.
+
+import logging
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import bindparam, create_engine, text
+
+from aggregations import RollupAccumulator, resample_over_time
+from instrumentation import stage
+from schema import METRIC_COLUMNS, SQL_COLUMN_MAP, concat_normalized, frame_memory_mb, normalize_subscriptions
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIPTIONS_QUERY = """
+    SELECT id, date, region, sku, client, status, subscribers, revenue, payment_method,
+           free_trials, new_orders, conversions, redemptions, registrations, active_paid,
+           renewals, payment_amount, refund_amount, involuntary_churn, voluntary_churn, winbacks
+    FROM subscriptions
+"""
+
+# Watermark column -> (normalized column, incremental predicate). Date watermarks
+# re-read the last loaded day, since rows for it may still be arriving.
+WATERMARKS = {
+    "id": ("Id", "WHERE id > :watermark"),
+    "date": ("Date", "WHERE date >= :watermark")
+}
+
+
+# Engine registry
+#
+# One pooled engine per (connection string, pool settings) for the whole process.
+# Sessions register as holders with acquire_engine and drop out with
+# release_engine; when the last holder leaves, the pool's connections are closed
+# (the engine itself stays registered and reconnects on next use).
+
+POOL_DEFAULTS = {"pool_size": 5, "max_overflow": 10, "pool_pre_ping": True, "pool_recycle": 1800}
+
+_engines = {}
+_engine_holders = {}
+_engines_lock = threading.Lock()
+
+
+def get_engine(connection_string, **pool_options):
+    options = {**POOL_DEFAULTS, **pool_options}
+    key = (connection_string, tuple(sorted(options.items())))
+    with _engines_lock:
+        engine = _engines.get(key)
+        if engine is None:
+            engine = create_engine(connection_string, **options)
+            _engines[key] = engine
+            logger.info(f"Created pooled engine (pool_size={options['pool_size']}, max_overflow={options['max_overflow']})")
+        return engine
+
+
+def acquire_engine(connection_string, holder, **pool_options):
+    engine = get_engine(connection_string, **pool_options)
+    with _engines_lock:
+        _engine_holders.setdefault(engine, set()).add(holder)
+    return engine
+
+
+def release_engine(engine, holder):
+    with _engines_lock:
+        holders = _engine_holders.get(engine)
+        if holders is None or holder not in holders:
+            return
+        holders.discard(holder)
+        if holders:
+            return
+        del _engine_holders[engine]
+    engine.dispose()
+    logger.info("Closed pooled connections (no sessions left)")
+
+
+# Close every pool, e.g. at process shutdown
+def dispose_engines():
+    with _engines_lock:
+        engines = list(_engines.values())
+        _engines.clear()
+        _engine_holders.clear()
+    for engine in engines:
+        engine.dispose()
+
+
+CHUNK_ROWS = 100_000
+
+
+# Normalized chunks of the subscriptions query, read through a server-side cursor
+def iter_subscription_chunks(engine, where="", params=None, chunk_rows=CHUNK_ROWS):
+    query = text(SUBSCRIPTIONS_QUERY + where)
+    with engine.connect() as connection:
+        connection = connection.execution_options(stream_results=True)
+        for chunk in pd.read_sql(query, connection, params=params or {}, chunksize=chunk_rows):
+            chunk, _ = normalize_subscriptions(chunk, "SQL Server chunk", log=False)
+            yield chunk
+
+
+# Read the subscriptions query chunk by chunk into one compact frame, feeding
+# each chunk to `accumulator` (a RollupAccumulator) on the way
+def read_subscriptions(engine, where="", params=None, accumulator=None, chunk_rows=CHUNK_ROWS):
+    chunks = []
+    with stage("fetch") as record:
+        for chunk in iter_subscription_chunks(engine, where, params, chunk_rows):
+            if accumulator is not None:
+                accumulator.add(chunk)
+            chunks.append(chunk)
+        df = concat_normalized(chunks)
+        record.rows, record.bytes = len(df), int(df.memory_usage(deep=True).sum())
+    logger.info(f"Read SQL Server data in {len(chunks)} chunk(s): {len(df):,} rows, {frame_memory_mb(df):,.1f} MB")
+    return df
+
+
+class IncrementalSqlLoader:
+    def __init__(self, engine, watermark="id", full_refresh_interval=900, min_refresh_interval=10):
+        if watermark not in WATERMARKS:
+            raise ValueError(f"Unsupported watermark column: {watermark}")
+        self.engine = engine
+        self.watermark = watermark
+        self.full_refresh_interval = full_refresh_interval
+        self.min_refresh_interval = min_refresh_interval
+        # Rollup cube of the table, replaced (never modified) on every change
+        self.cube = None
+        # Bumped on every published cube (full reload or merge), so it changes
+        # whenever the data does, including corrections that keep its totals
+        self.version = 0
+        self.high_water_mark = None
+        # Date watermark only: the loaded rows of the high-water mark day, which
+        # the next refresh re-reads and subtracts from the cube before adding
+        self.tail = None
+        self.last_refresh = 0.0
+        self.last_full_refresh = 0.0
+        self._lock = threading.Lock()
+
+    # High-water mark `mark` raised to cover `chunk`. In date mode, `tail`
+    # collects the rows of the high-water mark day.
+    def _advance(self, mark, chunk, tail):
+        if not len(chunk):
+            return mark
+        column = WATERMARKS[self.watermark][0]
+        chunk_max = chunk[column].max()
+        if mark is None or chunk_max > mark:
+            mark = chunk_max
+            tail.clear()
+        if self.watermark == "date" and chunk_max == mark:
+            tail.append(chunk[chunk[column] == chunk_max])
+        return mark
+
+    # Cube, high-water mark and tail are only replaced together, after a load
+    # succeeded, so a failed one leaves the previous state to resume from
+    def _publish(self, cube, mark, tail):
+        self.cube = cube
+        self.high_water_mark = mark
+        self.tail = concat_normalized(tail) if tail else None
+        self.version += 1
+
+    def _full_load(self):
+        accumulator, mark, tail = RollupAccumulator(), None, []
+        with stage("fetch") as record:
+            for chunk in iter_subscription_chunks(self.engine):
+                accumulator.add(chunk)
+                mark = self._advance(mark, chunk, tail)
+            record.rows = accumulator.row_count
+        self._publish(accumulator.cube(), mark, tail)
+        self.last_full_refresh = time.time()
+        logger.info(f"Fetched data from SQL database ({accumulator.row_count:,} rows, full reload)")
+
+    def _incremental_load(self):
+        predicate = WATERMARKS[self.watermark][1]
+        watermark = self.high_water_mark
+        if isinstance(watermark, pd.Timestamp):
+            watermark = watermark.to_pydatetime()
+        elif hasattr(watermark, "item"):
+            watermark = watermark.item()
+        new_rows = read_subscriptions(self.engine, predicate, {"watermark": watermark})
+        if not len(new_rows):
+            logger.info("Fetched data from SQL database (no new rows)")
+            return
+
+        # Only the delta is summed into the cube. Rows re-read by a date
+        # watermark (all of the previous tail) replace the ones already loaded.
+        tail = []
+        mark = self._advance(self.high_water_mark, new_rows, tail)
+        self._publish(self.cube.merged(new_rows, removed=self.tail), mark, tail)
+        logger.info(f"Fetched data from SQL database ({len(new_rows):,} new rows, watermark {self.watermark}={self.high_water_mark})")
+
+    # Current cube, refreshed if it is older than min_refresh_interval. Callers
+    # get a new cube object on every change; cubes are never modified in place.
+    def refresh(self, force_full=False):
+        with self._lock:
+            now = time.time()
+            if self.cube is None or force_full or now - self.last_full_refresh >= self.full_refresh_interval:
+                self._full_load()
+            elif now - self.last_refresh >= self.min_refresh_interval:
+                self._incremental_load()
+            self.last_refresh = now
+            return self.cube
+
+
+# Pushdown mode
+#
+# Instead of extracting the table, PushdownSqlSource turns each dashboard
+# question into one parameterized aggregate query (WHERE + GROUP BY + SUM run by
+# SQL Server) and only receives the aggregated rows. It answers the same calls as
+# aggregations.RollupCube, so both tabs work unchanged on either.
+
+# Dashboard column -> warehouse column. Identifiers in generated SQL only ever
+# come from this whitelist; every value is a bound parameter.
+WAREHOUSE_COLUMNS = {dashboard: warehouse for warehouse, dashboard in SQL_COLUMN_MAP.items()}
+PUSHDOWN_METRICS = METRIC_COLUMNS + ["TotalChurn"]
+
+
+def _metric_expression(metric):
+    if metric == "TotalChurn":
+        return "involuntary_churn + voluntary_churn"
+    return WAREHOUSE_COLUMNS[metric]
+
+
+# SUM over an INT column is INT in SQL Server and overflows past 2^31; sum as BIGINT
+def _sum_expression(expression):
+    return f"SUM(CAST({expression} AS BIGINT))"
+
+
+def _metric_alias(metric):
+    return "total_churn" if metric == "TotalChurn" else WAREHOUSE_COLUMNS[metric]
+
+
+def _as_param(value):
+    return pd.Timestamp(value).to_pydatetime()
+
+
+# WHERE clause and parameters for the dashboard's current selection
+def build_where(client=None, region=None, start=None, end=None, clients=None):
+    conditions, params = [], {}
+    if client is not None:
+        conditions.append("client = :client")
+        params["client"] = client
+    if clients is not None:
+        conditions.append("client IN :clients")
+        params["clients"] = list(clients)
+    if region is not None:
+        conditions.append("region = :region")
+        params["region"] = region
+    if start is not None:
+        conditions.append("date >= :start")
+        params["start"] = _as_param(start)
+    if end is not None:
+        conditions.append("date <= :end")
+        params["end"] = _as_param(end)
+    return (" WHERE " + " AND ".join(conditions)) if conditions else "", params
+
+
+# SELECT <group columns>, SUM(<metric>) ... FROM subscriptions WHERE ... GROUP BY ...
+def build_aggregate_query(metrics, group_by=(), **selection):
+    group_columns = [WAREHOUSE_COLUMNS[column] for column in group_by]
+    select = group_columns + [f"{_sum_expression(_metric_expression(metric))} AS {_metric_alias(metric)}" for metric in metrics]
+    where, params = build_where(**selection)
+    sql = f"SELECT {', '.join(select)} FROM subscriptions{where}"
+    if group_columns:
+        sql += f" GROUP BY {', '.join(group_columns)} ORDER BY {', '.join(group_columns)}"
+    return sql, params
+
+
+# One query for every track x metric x period: a conditional SUM per period,
+# grouped by client and restricted to the selected clients and periods.
+def build_period_totals_query(tracks, metrics, periods):
+    params = {"clients": list(tracks)}
+    select, period_conditions = ["client"], []
+    for i, (start, end) in enumerate(periods):
+        params[f"start_{i}"], params[f"end_{i}"] = _as_param(start), _as_param(end)
+        condition = f"date >= :start_{i} AND date <= :end_{i}"
+        period_conditions.append(f"({condition})")
+        select.extend(
+            f"{_sum_expression(f'CASE WHEN {condition} THEN {_metric_expression(metric)} ELSE 0 END')} AS {_metric_alias(metric)}_{i}"
+            for metric in metrics
+        )
+    sql = (
+        f"SELECT {', '.join(select)} FROM subscriptions"
+        f" WHERE client IN :clients AND ({' OR '.join(period_conditions)})"
+        " GROUP BY client"
+    )
+    return sql, params
+
+
+# Cheap change check for pushdown mode: new rows move the count and the maxima
+DATA_TOKEN_QUERY = "SELECT COUNT(*) AS row_count, MAX(id) AS last_id, MAX(date) AS last_date FROM subscriptions"
+
+
+class PushdownSqlSource:
+    # Query results are kept until the data changes (see data_token), or for at
+    # most cache_ttl seconds when set, to also pick up in-place corrections.
+    # Those leave the row count and maxima alone, so with cache_ttl set the token
+    # also moves once per cache_ttl period, giving callers a new data version.
+    def __init__(self, engine, cache_ttl=None, max_cached_queries=256):
+        self.engine = engine
+        self.cache_ttl = cache_ttl
+        self.max_cached_queries = max_cached_queries
+        self._results = {}
+        self._token = None
+        self._lock = threading.Lock()
+
+    # Token of the table's current contents. Drops the query cache when it changed.
+    def data_token(self):
+        with self.engine.connect() as connection:
+            token = tuple(connection.execute(text(DATA_TOKEN_QUERY)).one())
+        if self.cache_ttl:
+            token += (int(time.time() // self.cache_ttl),)
+        if token != self._token:
+            self.invalidate()
+            self._token = token
+        return token
+
+    def invalidate(self):
+        with self._lock:
+            self._results = {}
+
+    # Run an aggregate query, reusing a result younger than cache_ttl
+    def query(self, sql, params):
+        key = (sql, tuple(sorted((name, tuple(value) if isinstance(value, list) else value) for name, value in params.items())))
+        now = time.time()
+        with self._lock:
+            cached = self._results.get(key)
+            if cached is not None and (self.cache_ttl is None or now - cached[0] < self.cache_ttl):
+                return cached[1]
+        statement = text(sql)
+        if "clients" in params:
+            statement = statement.bindparams(bindparam("clients", expanding=True))
+        with stage("fetch") as record, self.engine.connect() as connection:
+            result = pd.read_sql(statement, connection, params=params)
+            record.rows, record.bytes = len(result), int(result.memory_usage(deep=True).sum())
+        logger.info(f"Pushdown query returned {len(result):,} rows")
+        with self._lock:
+            if len(self._results) >= self.max_cached_queries:
+                self._results.pop(next(iter(self._results)))
+            self._results[key] = (now, result)
+        return result
+
+    def _aggregate(self, metrics, group_by=(), **selection):
+        result = self.query(*build_aggregate_query(metrics, group_by, **selection))
+        renamed = {_metric_alias(metric): metric for metric in metrics}
+        renamed.update({WAREHOUSE_COLUMNS[column]: column for column in group_by})
+        result = result.rename(columns=renamed)
+        for metric in metrics:
+            # SUM over no rows is NULL
+            result[metric] = pd.to_numeric(result[metric]).fillna(0).astype(np.int64)
+        if "Date" in group_by:
+            result["Date"] = pd.to_datetime(result["Date"])
+        return result
+
+    def dimension_values(self, dimension):
+        column = WAREHOUSE_COLUMNS[dimension]
+        result = self.query(f"SELECT DISTINCT {column} FROM subscriptions", {})
+        return sorted(result[column].dropna())
+
+    def totals(self, client, region=None, start=None, end=None):
+        result = self._aggregate(PUSHDOWN_METRICS, client=client, region=region, start=start, end=end)
+        return result.iloc[0] if len(result) else pd.Series(0, index=PUSHDOWN_METRICS, dtype=np.int64)
+
+    def range_total(self, client, metric, start=None, end=None, region=None):
+        result = self._aggregate([metric], client=client, region=region, start=start, end=end)
+        return result[metric].iloc[0] if len(result) else np.int64(0)
+
+    def by_dimension(self, dimension, measures, client, region=None, start=None, end=None):
+        return self._aggregate(measures, [dimension], client=client, region=region, start=start, end=end)
+
+    # Daily totals from the server, re-summed locally into weekly or monthly buckets
+    def over_time(self, measures, client, region=None, start=None, end=None, grain="D"):
+        daily = self._aggregate(measures, ["Date"], client=client, region=region, start=start, end=end)
+        return resample_over_time(daily, measures, grain)
+
+    def period_totals(self, tracks, metrics, periods):
+        tracks, metrics = list(tracks), list(metrics)
+        result = self.query(*build_period_totals_query(tracks, metrics, periods)).set_index("client")
+        result = result.reindex(tracks).fillna(0)
+        return np.stack([
+            result[[f"{_metric_alias(metric)}_{i}" for metric in metrics]].to_numpy(dtype=np.int64)
+            for i in range(len(periods))
+        ])
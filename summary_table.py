@@ -0,0 +1,120 @@
+# Trends Comparison "Summary of Changes" table, kept out of app.py so it can be
+# built (and benchmarked) without running the Streamlit script.
+#
+# The table is a view of the comparison frame (aggregations.COMPARISON_COLUMNS):
+# rows are sorted on the frame, only the requested page is formatted, and each
+# column is formatted in one vectorized string operation instead of one f-string
+# per row. Exports are written from the frame itself, never from the HTML.
+
+import io
+import math
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401 (pandas' Parquet writer)
+except ImportError:
+    pyarrow = None
+
+PAGE_SIZES = [25, 50, 100, 250]
+
+# Sortable columns by their header label; the period columns are labelled by
+# the comparison ("Last Week", "This Week") when rendered. "None" keeps the
+# comparison's own order (each selected metric, its tracks in selection order).
+SORT_COLUMNS = {
+    "None": None,
+    "Track": "track",
+    "Metric": "metric",
+    "Period 1": "period1_value",
+    "Period 2": "period2_value",
+    "Change": "value_change",
+    "% Change": "percent_change"
+}
+
+PARQUET_EXPORT = pyarrow is not None
+
+_HEADER_CELL = '<th class="px-6 py-3 text-left text-xs font-medium text-gray-500 uppercase tracking-wider">'
+_CELL = '<td class="px-6 py-4 whitespace-nowrap text-sm text-gray-900">'
+_CHANGE_CELL = '<td class="px-6 py-4 whitespace-nowrap text-sm '
+
+
+# Metric names as the table shows them ("TotalChurn" -> "Churn", "NewOrders" -> "New Orders")
+def display_metrics(metrics):
+    return metrics.str.replace("TotalChurn", "Churn", regex=False).str.replace(r"([A-Z])", r" \1", regex=True).str.strip()
+
+
+# Values with thousands separators, as "{:,}" formats them
+def format_thousands(values):
+    parts = pd.Series(values).astype(str).str.partition(".")
+    whole = parts[0].str.replace(r"\B(?=(\d{3})+$)", ",", regex=True)
+    return (whole + parts[1] + parts[2]).to_numpy(dtype=object)
+
+
+# "+" before non-negative values
+def _signed(text, values):
+    return np.where(values >= 0, "+", "").astype(object) + text
+
+
+# Opening <td> coloured by the sign of `values`
+def _change_cell(values):
+    return _CHANGE_CELL + np.where(values >= 0, "change-indicator-up", "change-indicator-down").astype(object) + '">'
+
+
+def sort_summary(comparison_df, sort_label, descending=False):
+    if SORT_COLUMNS.get(sort_label) is None:
+        return comparison_df
+    return comparison_df.sort_values(SORT_COLUMNS[sort_label], ascending=not descending, kind="stable", ignore_index=True)
+
+
+def page_count(row_count, page_size):
+    return max(math.ceil(row_count / page_size), 1)
+
+
+# Rows of one page (1-based), clamped to the last page
+def summary_page(comparison_df, page, page_size):
+    page = min(max(page, 1), page_count(len(comparison_df), page_size))
+    return comparison_df.iloc[(page - 1) * page_size:page * page_size]
+
+
+# HTML of the table for the rows of `page_df`
+def summary_table_html(page_df, period1_label, period2_label):
+    value_change = page_df["value_change"].to_numpy()
+    percent_change = page_df["percent_change"].to_numpy()
+    percent = np.char.mod("%.2f", percent_change.astype(np.float64)).astype(object)
+    rows = (
+        "<tr>" + _CELL + page_df["track"].astype(str).to_numpy(dtype=object) + "</td>"
+        + _CELL + display_metrics(page_df["metric"]).to_numpy(dtype=object) + "</td>"
+        + _CELL + format_thousands(page_df["period1_value"]) + "</td>"
+        + _CELL + format_thousands(page_df["period2_value"]) + "</td>"
+        + _change_cell(value_change) + _signed(format_thousands(page_df["value_change"]), value_change) + "</td>"
+        + _change_cell(percent_change) + _signed(percent, percent_change) + "%</td></tr>"
+    )
+    headers = ["Track", "Metric", period1_label, period2_label, "Change", "% Change"]
+    return (
+        '<table class="min-w-full divide-y divide-gray-200"><thead class="bg-gray-50"><tr>'
+        + "".join(f"{_HEADER_CELL}{header}</th>" for header in headers)
+        + '</tr></thead><tbody class="bg-white divide-y divide-gray-200">'
+        + "".join(rows)
+        + "</tbody></table>"
+    )
+
+
+# The comparison frame with the period columns named after their labels
+def export_frame(comparison_df, period1_label, period2_label):
+    return comparison_df.rename(columns={
+        "period1_value": f"{period1_label} value",
+        "period2_value": f"{period2_label} value"
+    })
+
+
+def to_csv_bytes(df):
+    return df.to_csv(index=False).encode("utf-8")
+
+
+def to_parquet_bytes(df):
+    if pyarrow is None:
+        raise ImportError("pyarrow is not installed.")
+    buffer = io.BytesIO()
+    df.to_parquet(buffer, index=False)
+    return buffer.getvalue()
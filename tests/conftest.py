@@ -0,0 +1,23 @@
+# The dashboard's modules live at the repository root, next to app.py
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dummy_data import generate_subscriptions  # noqa: E402
+from schema import normalize_subscriptions  # noqa: E402
+
+
+# Factory of normalized subscriptions over a few days, with the Id column the
+# SQL Server table has (ids continue from `first_id`)
+@pytest.fixture
+def make_subscriptions():
+    def make(start="2024-01-01", end="2024-01-03", seed=0, first_id=1):
+        df = generate_subscriptions(np.random.default_rng(seed), start=start, end=end)
+        df.insert(0, "Id", np.arange(first_id, first_id + len(df), dtype=np.int64))
+        df, _ = normalize_subscriptions(df, log=False)
+        return df
+    return make
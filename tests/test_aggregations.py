@@ -0,0 +1,147 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from aggregations import CUBE_KEYS, CrossCheckBackend, PandasBackend, RollupAccumulator, build_rollup_cube, compare_periods, make_aggregation_backend
+from schema import METRIC_COLUMNS, concat_normalized
+
+
+# Pandas with one sum off by one, or with two keys swapped
+class SkewedBackend(PandasBackend):
+    name = "skewed"
+
+    def __init__(self, column):
+        self.column = column
+
+    def rollup(self, df, keys, measures):
+        result = super().rollup(df, keys, measures)
+        values = result[self.column].copy()
+        if self.column in measures:
+            values.iloc[-1] += 1
+        else:
+            values.iloc[[0, -1]] = values.iloc[[-1, 0]].to_numpy()
+        return result.assign(**{self.column: values})
+
+    def rollups(self, df, specs):
+        return {name: self.rollup(df, keys, measures) for name, (keys, measures) in specs.items()}
+
+
+@pytest.mark.parametrize("column", ["Subscribers", "Client"])
+def test_cross_check_flags_mismatches(make_subscriptions, column, caplog):
+    backend = CrossCheckBackend(PandasBackend(), SkewedBackend(column))
+    df = make_subscriptions()
+    result = backend.rollup(df, CUBE_KEYS, ["Subscribers"])
+    assert backend.checks == 1 and backend.mismatches == 1
+    assert f"in {column}" in caplog.text
+    # The reference result is the one returned
+    assert result.equals(PandasBackend().rollup(df, CUBE_KEYS, ["Subscribers"]))
+
+
+def test_cross_check_accepts_matching_backends(make_subscriptions):
+    pytest.importorskip("polars")
+    backend = make_aggregation_backend("polars", cross_check=True)
+    accumulator = RollupAccumulator(combine_every=2, backend=backend)
+    for seed in range(3):
+        accumulator.add(make_subscriptions(seed=seed))
+    accumulator.cube()
+    assert backend.checks > 0 and backend.mismatches == 0
+
+
+# The cube against the same sums taken directly on the raw rows
+
+
+def raw_rows(df, client, region=None, start=None, end=None):
+    mask = df["Client"] == client
+    if region is not None:
+        mask &= df["Region"] == region
+    if start is not None:
+        mask &= df["Date"] >= pd.Timestamp(start)
+    if end is not None:
+        mask &= df["Date"] <= pd.Timestamp(end)
+    return df[mask]
+
+
+@pytest.fixture
+def month(make_subscriptions):
+    return make_subscriptions("2024-01-01", "2024-02-29")
+
+
+SELECTIONS = [
+    dict(client="AHA"),
+    dict(client="Sony", region="Europe"),
+    dict(client="NBA", start="2024-01-10", end="2024-02-03"),
+    dict(client="VIKI", region="Asia", start="2024-02-01", end="2024-02-29")
+]
+
+
+@pytest.mark.parametrize("selection", SELECTIONS)
+def test_cube_totals_match_raw_rows(month, selection):
+    cube = build_rollup_cube(month)
+    rows = raw_rows(month, **selection)
+    totals = cube.totals(**selection)
+    assert totals[METRIC_COLUMNS].tolist() == rows[METRIC_COLUMNS].sum().tolist()
+    assert totals["TotalChurn"] == rows["InvoluntaryChurn"].sum() + rows["VoluntaryChurn"].sum()
+    assert cube.range_total(metric="Revenue", **selection) == rows["Revenue"].sum()
+
+
+@pytest.mark.parametrize("selection", SELECTIONS)
+@pytest.mark.parametrize("dimension", ["Region", "SKU", "Status", "PaymentMethod"])
+def test_cube_breakdowns_match_raw_rows(month, selection, dimension):
+    result = build_rollup_cube(month).by_dimension(dimension, ["Subscribers", "Revenue"], **selection)
+    expected = raw_rows(month, **selection).groupby(dimension, observed=True)[["Subscribers", "Revenue"]].sum()
+    assert result[dimension].astype(str).tolist() == expected.index.astype(str).tolist()
+    assert result[["Subscribers", "Revenue"]].to_numpy().tolist() == expected.to_numpy().tolist()
+
+
+@pytest.mark.parametrize("grain", ["D", "W", "M"])
+@pytest.mark.parametrize("selection", SELECTIONS)
+def test_cube_time_series_match_raw_rows(month, selection, grain):
+    result = build_rollup_cube(month).over_time(["ActivePaid"], grain=grain, **selection)
+    rows = raw_rows(month, **selection)
+    buckets = {"D": rows["Date"], "W": rows["Date"].dt.to_period("W-SUN").dt.start_time, "M": rows["Date"].dt.to_period("M").dt.start_time}[grain]
+    expected = rows.groupby(buckets)["ActivePaid"].sum()
+    assert result["Date"].tolist() == expected.index.tolist()
+    assert result["ActivePaid"].tolist() == expected.tolist()
+
+
+def test_compare_periods_matches_raw_rows(month):
+    tracks, metrics = ["AHA", "Sony", "Unknown"], ["Subscribers", "TotalChurn"]
+    period1, period2 = ("2024-01-01", "2024-01-31"), ("2024-02-01", "2024-02-29")
+    result = compare_periods(build_rollup_cube(month), tracks, metrics, period1, period2)
+    # Metric-major: every track of the first metric, then of the second
+    assert result["metric"].tolist() == ["Subscribers"] * 3 + ["TotalChurn"] * 3
+    assert result["track"].tolist() == tracks * 2
+    for row in result.itertuples():
+        values = []
+        for start, end in (period1, period2):
+            rows = raw_rows(month, row.track, start=start, end=end)
+            values.append(int(rows[["InvoluntaryChurn", "VoluntaryChurn"]].to_numpy().sum() if row.metric == "TotalChurn" else rows[row.metric].sum()))
+        assert [row.period1_value, row.period2_value] == values
+        assert row.value_change == values[1] - values[0]
+    assert (result.loc[result["track"] == "Unknown", ["period1_value", "period2_value", "percent_change"]] == 0).all().all()
+
+
+def test_accumulated_cube_matches_one_pass_cube(month):
+    accumulator = RollupAccumulator(combine_every=2)
+    for start in range(0, len(month), 10_000):
+        accumulator.add(month.iloc[start:start + 10_000])
+    cube, reference = accumulator.cube(), build_rollup_cube(month)
+    assert cube.base.frame.equals(reference.base.frame)
+    for dimension, index in reference.breakdowns.items():
+        assert cube.breakdowns[dimension].frame.equals(index.frame)
+
+
+# Merging added rows (and removing replaced ones) gives the cube of the new table
+def test_merged_cube_matches_rebuilt_cube(month, make_subscriptions):
+    replaced = month["Date"] == month["Date"].max()
+    corrected = month[replaced].assign(Revenue=month.loc[replaced, "Revenue"] * 2)
+    added = concat_normalized([corrected, make_subscriptions("2024-03-01", "2024-03-02", seed=1)])
+    merged = build_rollup_cube(month).merged(added, removed=month[replaced])
+    rebuilt = build_rollup_cube(concat_normalized([month[~replaced], added]))
+    for client in ["AHA", "Sony"]:
+        assert merged.totals(client).tolist() == rebuilt.totals(client).tolist()
+        assert merged.by_dimension("SKU", ["Revenue"], client).equals(rebuilt.by_dimension("SKU", ["Revenue"], client))
+    assert np.array_equal(
+        merged.period_totals(["AHA"], ["Revenue"], [("2024-02-29", "2024-03-02")]),
+        rebuilt.period_totals(["AHA"], ["Revenue"], [("2024-02-29", "2024-03-02")])
+    )
@@ -0,0 +1,48 @@
+import numpy as np
+
+from aggregations import build_rollup_cube
+from bigquery_source import BigQueryReader, BigQuerySource, LocalBigQueryClient
+from schema import SQL_COLUMN_MAP
+
+TABLE = "project.dataset.subscriptions"
+WAREHOUSE_COLUMNS = {dashboard: warehouse for warehouse, dashboard in SQL_COLUMN_MAP.items()}
+
+
+def local_source(df, chunk_rows=5_000):
+    client = LocalBigQueryClient({TABLE: df.drop(columns="Id").rename(columns=WAREHOUSE_COLUMNS)}, {TABLE: "date"})
+    return client, BigQuerySource(BigQueryReader(client, "project", "dataset", "subscriptions", chunk_rows=chunk_rows))
+
+
+def test_selection_queries_are_pruned_and_cached(make_subscriptions):
+    client, source = local_source(make_subscriptions("2024-01-01", "2024-01-10"))
+    selection = dict(client="AHA", region="Europe", start="2024-01-03", end="2024-01-08")
+    source.totals(**selection)
+    source.by_dimension("SKU", ["Subscribers"], **selection)
+    # One query for both calls, filtered on the selection, never SELECT *
+    assert len(client.queries) == 1
+    sql = client.queries[0]
+    assert "*" not in sql and "`date` >= @start" in sql and "`client` IN" in sql and "`region` = @region" in sql
+
+
+def test_source_matches_the_cube(make_subscriptions):
+    df = make_subscriptions("2024-01-01", "2024-01-10")
+    # Small pages, so the result arrives (and is normalized) in several chunks
+    _, source = local_source(df, chunk_rows=1_000)
+    cube = build_rollup_cube(df)
+    selection = dict(client="Sony", start="2024-01-02", end="2024-01-09")
+    assert source.totals(**selection).tolist() == cube.totals(**selection).tolist()
+    assert source.over_time(["ActivePaid"], grain="W", **selection).equals(cube.over_time(["ActivePaid"], grain="W", **selection))
+    periods = [("2024-01-01", "2024-01-05"), ("2024-01-06", "2024-01-10")]
+    tracks, metrics = ["AHA", "Sony", "Unknown"], ["Revenue", "TotalChurn"]
+    assert np.array_equal(source.period_totals(tracks, metrics, periods), cube.period_totals(tracks, metrics, periods))
+
+
+def test_changed_table_is_read_again(make_subscriptions):
+    df = make_subscriptions("2024-01-01", "2024-01-02")
+    client, source = local_source(df)
+    token = source.data_token()
+    source.totals("AHA")
+    client.load_table(TABLE, df.drop(columns="Id").rename(columns=WAREHOUSE_COLUMNS).assign(revenue=1))
+    assert source.data_token() != token
+    assert source.totals("AHA")["Revenue"] == (df["Client"] == "AHA").sum()
+    assert len(client.queries) == 2
@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+
+from aggregations import build_rollup_cube, time_grain
+from downsampling import downsample_frame, lttb_indices
+
+
+def test_short_series_are_kept_whole():
+    x = np.arange(50)
+    assert lttb_indices(x, x, 60).tolist() == list(range(50))
+    assert lttb_indices(x, x, 0).tolist() == list(range(50))
+
+
+def test_lttb_keeps_the_ends_and_the_peaks():
+    x = np.arange(1_000)
+    y = np.zeros(1_000)
+    y[[137, 512, 871]] = [50, -40, 30]
+    kept = lttb_indices(x, y, 60)
+    assert len(kept) == 60 and kept[0] == 0 and kept[-1] == 999
+    assert np.all(np.diff(kept) > 0)
+    assert {137, 512, 871} <= set(kept.tolist())
+
+
+# Last 90 Days is plotted by day (91 points), over the app's 60-point budget
+def test_daily_series_of_the_360_view_is_downsampled(make_subscriptions):
+    df = make_subscriptions("2024-01-01", "2024-03-31")
+    start, end = pd.Timestamp("2024-03-31") - pd.Timedelta(days=90), pd.Timestamp("2024-03-31")
+    grain = time_grain(start, end)
+    series = build_rollup_cube(df).over_time(["ActivePaid"], client="AHA", start=start, end=end, grain=grain)
+    assert grain == "D" and len(series) == 91
+    downsampled = downsample_frame(series, "Date", "ActivePaid", 60)
+    assert len(downsampled) == 60
+    assert downsampled["Date"].iloc[0] == start and downsampled["Date"].iloc[-1] == end
+    assert series["ActivePaid"].max() in downsampled["ActivePaid"].tolist()
@@ -0,0 +1,26 @@
+import os
+
+import numpy as np
+
+from dummy_data import dataset_path, generate_dummy_frames, load_dataset, materialize_dataset
+
+
+def test_loaded_dataset_matches_the_generator(tmp_path):
+    subscriptions, churn_triggers, _, _ = load_dataset(str(tmp_path), seed=3)
+    expected = generate_dummy_frames(3)
+    assert len(subscriptions) == len(expected[0])
+    for column in ["Client", "Date", "Revenue"]:
+        assert np.array_equal(subscriptions[column].to_numpy(), expected[0][column].to_numpy())
+    # String columns come back as categoricals over the stored codes
+    for column in churn_triggers.columns:
+        assert churn_triggers[column].tolist() == expected[1][column].tolist()
+
+
+def test_materializing_leaves_other_files_alone(tmp_path):
+    (tmp_path / "notes.txt").write_text("keep")
+    load_dataset(str(tmp_path), seed=1)
+    load_dataset(str(tmp_path), seed=2)
+    # A second writer of the same seed keeps the first one's dataset
+    materialize_dataset(str(tmp_path), seed=1)
+    assert sorted(os.listdir(tmp_path)) == sorted(["notes.txt", os.path.basename(dataset_path(str(tmp_path), 1)), os.path.basename(dataset_path(str(tmp_path), 2))])
+    assert (tmp_path / "notes.txt").read_text() == "keep"
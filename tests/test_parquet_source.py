@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from schema import METRIC_COLUMNS, concat_normalized, normalize_subscriptions
+
+pytest.importorskip("duckdb")
+
+from parquet_source import IncrementalParquetMirror, ParquetDataset  # noqa: E402
+
+
+def assert_matches(source, df):
+    expected = df.groupby("Client", observed=True)[METRIC_COLUMNS].sum()
+    for client in expected.index:
+        totals = source.totals(client)
+        assert totals[METRIC_COLUMNS].tolist() == expected.loc[client].tolist(), client
+
+
+# A chunk with larger values than the ones before it, normalized on its own as
+# the SQL reader does, so its metric columns are wider
+def wider_chunk(df):
+    df = df.assign(Subscribers=df["Subscribers"].astype(np.int64) * 100)
+    return normalize_subscriptions(df, log=False)[0]
+
+
+# The engine takes the schema from the first file (January's, from the narrow
+# chunk) and has to read February's wider files with it
+def test_write_chunks_with_different_metric_widths(tmp_path, make_subscriptions):
+    small = make_subscriptions("2024-01-30", "2024-01-31")
+    large = wider_chunk(make_subscriptions("2024-02-01", "2024-02-02", first_id=len(small) + 1))
+    assert small["Subscribers"].dtype == np.int16 and large["Subscribers"].dtype == np.int32
+
+    dataset = ParquetDataset(str(tmp_path))
+    dataset.write([small, large])
+    assert_matches(dataset.source(), concat_normalized([small, large]))
+
+
+def test_mirror_appends_rows_past_the_high_water_mark(tmp_path, make_subscriptions):
+    first = make_subscriptions("2024-01-30", "2024-01-31")
+    table = [first]
+
+    def read_chunks(after_id):
+        for chunk in table:
+            rows = chunk if after_id is None else chunk[chunk["Id"] > after_id]
+            if len(rows):
+                yield rows
+
+    mirror = IncrementalParquetMirror(ParquetDataset(str(tmp_path)), read_chunks, full_refresh_interval=3600)
+    source = mirror.refresh()
+    assert mirror.version == 1 and mirror.high_water_mark == len(first)
+    assert_matches(source, first)
+
+    # Nothing new: same source, same version
+    assert mirror.refresh() is source and mirror.version == 1
+
+    # Later rows with wider metrics are appended to the same version
+    table.append(wider_chunk(make_subscriptions("2024-02-01", "2024-02-01", first_id=len(first) + 1)))
+    source = mirror.refresh()
+    assert mirror.version == 2 and len(mirror.dataset.versions()) == 1
+    assert mirror.high_water_mark == table[-1]["Id"].max()
+    assert_matches(source, concat_normalized(table))
+
+
+def test_mirror_rewrites_on_full_refresh(tmp_path, make_subscriptions):
+    table = [make_subscriptions("2024-01-01", "2024-01-02")]
+    mirror = IncrementalParquetMirror(ParquetDataset(str(tmp_path)), lambda after_id: iter(table), full_refresh_interval=0)
+    mirror.refresh()
+    # An in-place correction is only seen by a full rewrite
+    table[0] = table[0].assign(Revenue=table[0]["Revenue"] + 1)
+    source = mirror.refresh()
+    assert len(mirror.dataset.versions()) == 2
+    assert_matches(source, table[0])
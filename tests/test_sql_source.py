@@ -0,0 +1,94 @@
+import numpy as np
+import pytest
+
+from aggregations import build_rollup_cube
+from schema import DIMENSION_COLUMNS, METRIC_COLUMNS, SQL_COLUMN_MAP, concat_normalized
+
+sqlalchemy = pytest.importorskip("sqlalchemy")
+
+from sql_source import IncrementalSqlLoader, PushdownSqlSource  # noqa: E402
+
+WAREHOUSE_COLUMNS = {dashboard: warehouse for warehouse, dashboard in SQL_COLUMN_MAP.items()}
+CLIENTS = ["AHA", "Sony", "VIKI"]
+
+
+# A normalized frame as rows of the warehouse table. SQLite compares dates as
+# text, so they are stored the way datetime parameters are bound.
+def insert(engine, df):
+    rows = df.assign(Date=df["Date"].dt.strftime("%Y-%m-%d %H:%M:%S"), **{column: df[column].astype(str) for column in DIMENSION_COLUMNS})
+    rows.rename(columns=WAREHOUSE_COLUMNS).to_sql("subscriptions", engine, index=False, if_exists="append")
+
+
+def delete_from(engine, day):
+    with engine.begin() as connection:
+        connection.exec_driver_sql(f"DELETE FROM subscriptions WHERE date >= '{day}'")
+
+
+def assert_cube_matches(cube, df):
+    reference = build_rollup_cube(df)
+    for client in CLIENTS:
+        assert cube.totals(client).tolist() == reference.totals(client).tolist(), client
+        assert cube.by_dimension("SKU", ["Subscribers"], client).equals(reference.by_dimension("SKU", ["Subscribers"], client))
+
+
+@pytest.fixture
+def engine():
+    return sqlalchemy.create_engine("sqlite://", poolclass=sqlalchemy.pool.StaticPool)
+
+
+def test_id_watermark_merges_new_rows(engine, make_subscriptions):
+    first = make_subscriptions("2024-01-01", "2024-01-02")
+    insert(engine, first)
+    loader = IncrementalSqlLoader(engine, watermark="id", min_refresh_interval=0)
+    assert_cube_matches(loader.refresh(), first)
+    assert loader.version == 1 and loader.high_water_mark == len(first) and loader.tail is None
+
+    # No new rows: the same cube, no new version
+    cube = loader.refresh()
+    assert loader.refresh() is cube and loader.version == 1
+
+    later = make_subscriptions("2024-01-03", "2024-01-03", seed=1, first_id=len(first) + 1)
+    insert(engine, later)
+    assert_cube_matches(loader.refresh(), concat_normalized([first, later]))
+    assert loader.version == 2 and loader.high_water_mark == later["Id"].max()
+
+
+def test_date_watermark_replaces_the_last_day(engine, make_subscriptions):
+    first = make_subscriptions("2024-01-01", "2024-01-02")
+    insert(engine, first)
+    loader = IncrementalSqlLoader(engine, watermark="date", min_refresh_interval=0)
+    loader.refresh()
+    assert str(loader.high_water_mark.date()) == "2024-01-02"
+    assert len(loader.tail) == (first["Date"] == first["Date"].max()).sum()
+
+    # The last day is corrected and a new day arrives: the re-read day replaces
+    # the loaded one instead of being counted twice
+    kept = first[first["Date"] < first["Date"].max()]
+    corrected = make_subscriptions("2024-01-02", "2024-01-03", seed=1, first_id=len(first) + 1)
+    delete_from(engine, "2024-01-02")
+    insert(engine, corrected)
+    assert_cube_matches(loader.refresh(), concat_normalized([kept, corrected]))
+    assert str(loader.high_water_mark.date()) == "2024-01-03"
+    assert len(loader.tail) == (corrected["Date"] == corrected["Date"].max()).sum()
+
+
+def test_full_refresh_picks_up_corrections(engine, make_subscriptions):
+    first = make_subscriptions("2024-01-01", "2024-01-02")
+    insert(engine, first)
+    loader = IncrementalSqlLoader(engine, watermark="id", full_refresh_interval=0, min_refresh_interval=0)
+    loader.refresh()
+    with engine.begin() as connection:
+        connection.exec_driver_sql("UPDATE subscriptions SET revenue = revenue + 1")
+    assert_cube_matches(loader.refresh(), first.assign(Revenue=first["Revenue"].astype(np.int64) + 1))
+    assert loader.version == 2
+
+
+def test_pushdown_matches_the_cube(engine, make_subscriptions):
+    df = make_subscriptions("2024-01-01", "2024-01-10")
+    insert(engine, df)
+    source, cube = PushdownSqlSource(engine), build_rollup_cube(df)
+    selection = dict(client="AHA", region="Europe", start="2024-01-03", end="2024-01-08")
+    assert source.totals(**selection)[METRIC_COLUMNS + ["TotalChurn"]].tolist() == cube.totals(**selection).tolist()
+    assert source.by_dimension("Status", ["Subscribers"], **selection)["Subscribers"].tolist() == cube.by_dimension("Status", ["Subscribers"], **selection)["Subscribers"].tolist()
+    periods = [("2024-01-01", "2024-01-05"), ("2024-01-06", "2024-01-10")]
+    assert np.array_equal(source.period_totals(CLIENTS, ["Revenue", "TotalChurn"], periods), cube.period_totals(CLIENTS, ["Revenue", "TotalChurn"], periods))
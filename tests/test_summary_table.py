@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+
+from aggregations import COMPARISON_COLUMNS
+from summary_table import export_frame, format_thousands, page_count, sort_summary, summary_page, summary_table_html, to_csv_bytes
+
+
+def comparison(rows=7):
+    period1 = np.arange(rows, dtype=np.int64) * 1_000
+    period2 = period1[::-1].copy()
+    return pd.DataFrame({
+        "track": [f"T{i}" for i in range(rows)],
+        "metric": ["TotalChurn", "NewOrders"] * (rows // 2) + ["Revenue"] * (rows % 2),
+        "period1_value": period1,
+        "period2_value": period2,
+        "value_change": period2 - period1,
+        "percent_change": np.where(period1 != 0, (period2 - period1) / np.maximum(period1, 1) * 100, 0.0)
+    }, columns=COMPARISON_COLUMNS)
+
+
+def test_format_thousands_matches_format_spec():
+    values = [0, 7, 1_000, -1_234_567, 987_654_321]
+    assert format_thousands(values).tolist() == [f"{value:,}" for value in values]
+
+
+def test_sort_defaults_to_the_comparison_order():
+    df = comparison()
+    assert sort_summary(df, "None") is df
+    assert sort_summary(df, "Change", descending=True)["value_change"].is_monotonic_decreasing
+    assert sort_summary(df, "Track")["track"].tolist() == sorted(df["track"])
+
+
+def test_pages_are_clamped():
+    df = comparison()
+    assert page_count(len(df), 3) == 3 and page_count(0, 25) == 1
+    assert summary_page(df, 3, 3)["track"].tolist() == ["T6"]
+    assert summary_page(df, 9, 3)["track"].tolist() == ["T6"]
+    assert summary_page(df, 0, 3)["track"].tolist() == ["T0", "T1", "T2"]
+
+
+def test_html_formats_each_row():
+    html = summary_table_html(comparison(2), "Last Week", "This Week")
+    assert html.count("<tr>") == 3
+    assert "Last Week" in html and "<td class=\"px-6 py-4 whitespace-nowrap text-sm text-gray-900\">New Orders</td>" in html
+    assert "+1,000</td>" in html and "-1,000</td>" in html and "change-indicator-down" in html
+
+
+def test_export_is_the_frame_with_period_labels():
+    exported = export_frame(comparison(), "Last Week", "This Week")
+    assert list(exported.columns[2:4]) == ["Last Week value", "This Week value"]
+    csv = to_csv_bytes(exported).decode()
+    assert csv.splitlines()[0].startswith("track,metric,Last Week value,This Week value")
+    assert len(csv.splitlines()) == 8